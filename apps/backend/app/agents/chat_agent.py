@@ -2,17 +2,32 @@
 
 from __future__ import annotations
 
-from typing import Annotated, TypedDict
-
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Annotated, Any, TypedDict
+
+from langchain_core.language_models import BaseChatModel, LanguageModelInput
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import END, StateGraph
 from langgraph.graph.message import add_messages
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import ToolNode
 
 from app.core.config import settings
 from app.core.observability import get_callbacks
+from app.services.history import SUMMARY_RUN_TAG, get_history_compactor
+from app.services.llm import DEFAULT_CHAT_MODEL, get_scheduled_model
+from app.services.sessions import get_session_store, session_lock
+
+
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a helpful AI assistant built with AIForge by Psypher AI. "
+    "You have access to tools and can search a knowledge base."
+)
 
 
 # ── Tools ──────────────────────────────────────────────────────────────
@@ -40,7 +55,11 @@ TOOLS = [search_knowledge_base, get_current_time]
 
 # ── Agent State ────────────────────────────────────────────────────────
 class AgentState(TypedDict):
-    """State for the chat agent graph."""
+    """State for the chat agent graph.
+
+    ``messages`` holds conversation turns and tool traffic only; the system
+    prompt is added per call by ``_prompt_messages``.
+    """
 
     messages: Annotated[list[BaseMessage], add_messages]
 
@@ -54,28 +73,96 @@ def _should_continue(state: AgentState) -> str:
     return END
 
 
-def _call_model(state: AgentState) -> dict:
-    """Call the LLM with current messages."""
-    llm = ChatOpenAI(
-        model="gpt-4o",
-        temperature=0.7,
-        api_key=settings.openai_api_key,
-        streaming=True,
-    ).bind_tools(TOOLS)
+@lru_cache(maxsize=64)
+def _bind_tools(
+    model: str, temperature: float, max_tokens: int | None
+) -> tuple[BaseChatModel, Runnable[LanguageModelInput, AIMessage]]:
+    llm = get_scheduled_model(model=model, temperature=temperature, max_tokens=max_tokens)
+    return llm, llm.bind_tools(TOOLS)
 
-    response = llm.invoke(state["messages"], config={"callbacks": get_callbacks()})
+
+def _agent_llm(
+    model: str, temperature: float, max_tokens: int | None
+) -> Runnable[LanguageModelInput, AIMessage]:
+    """Registry chat model with the agent's tools bound, cached per settings.
+
+    Binding takes milliseconds, so it is cached, but the bound model is
+    checked against the registry on every call: after ``close_llm_clients``
+    (or an eviction) the registry builds new models on fresh HTTP clients.
+    """
+    llm, bound = _bind_tools(model, temperature, max_tokens)
+    if llm is not get_scheduled_model(model=model, temperature=temperature, max_tokens=max_tokens):
+        _bind_tools.cache_clear()
+        llm, bound = _bind_tools(model, temperature, max_tokens)
+    return bound
+
+
+def _to_turn(message: BaseMessage) -> dict[str, str] | None:
+    """A user/assistant turn as a history dict; tool traffic and tool calls are dropped."""
+    if isinstance(message, HumanMessage):
+        return {"role": "user", "content": message.text}
+    if isinstance(message, AIMessage) and not message.tool_calls and message.text:
+        return {"role": "assistant", "content": message.text}
+    return None
+
+
+async def _prompt_messages(
+    messages: list[BaseMessage], params: dict[str, Any]
+) -> list[BaseMessage]:
+    """System prompt, earlier turns within the history budget, then the current turn.
+
+    The current turn (the last user message and any tool calls since) is
+    kept verbatim. Earlier turns that do not fit are folded into a cached
+    rolling summary appended to the system prompt (see ``app.services.history``).
+    """
+    start = next(
+        (i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], HumanMessage)),
+        len(messages),
+    )
+    turns = [t for t in map(_to_turn, messages[: start + 1]) if t is not None]
+    compacted = await get_history_compactor(params.get("model", DEFAULT_CHAT_MODEL)).compact(
+        turns,
+        params.get("system_prompt", DEFAULT_SYSTEM_PROMPT),
+        budget=params.get("history_max_tokens") or settings.chat_history_max_tokens,
+    )
+    if start == len(messages):
+        return compacted
+    return compacted[:-1] + messages[start:]
+
+
+async def _call_model(state: AgentState, config: RunnableConfig) -> dict[str, Any]:
+    """Call the LLM with current messages.
+
+    Model settings come from ``config["configurable"]`` (see ``_run_config``).
+    The node's config is passed through so the LLM run stays attached to the
+    graph's callbacks (observability handlers and ``astream_events``).
+    """
+    params = config.get("configurable", {})
+    llm = _agent_llm(
+        params.get("model", DEFAULT_CHAT_MODEL),
+        params.get("temperature", 0.7),
+        params.get("max_tokens"),
+    )
+
+    messages = await _prompt_messages(state["messages"], params)
+    response = await llm.ainvoke(messages, config)
     return {"messages": [response]}
 
 
-def build_chat_agent() -> StateGraph:
+def build_chat_agent(
+    checkpointer: BaseCheckpointSaver[str] | None = None,
+) -> CompiledStateGraph[AgentState]:
     """Build and compile the LangGraph chat agent.
 
     Returns a compiled graph with:
     - agent node: calls the LLM
     - tools node: executes tool calls
     - conditional routing between agent and tools
+
+    With a ``checkpointer`` the graph keeps each ``thread_id``'s messages
+    between runs, so a run's input is just the new messages.
     """
-    graph = StateGraph(AgentState)
+    graph: StateGraph[AgentState, None, AgentState, AgentState] = StateGraph(AgentState)
 
     graph.add_node("agent", _call_model)
     graph.add_node("tools", ToolNode(TOOLS))
@@ -84,38 +171,159 @@ def build_chat_agent() -> StateGraph:
     graph.add_conditional_edges("agent", _should_continue, {"tools": "tools", END: END})
     graph.add_edge("tools", "agent")
 
-    return graph.compile()
+    return graph.compile(checkpointer=checkpointer)
+
 
+@lru_cache(maxsize=1)
+def get_chat_agent() -> CompiledStateGraph[AgentState]:
+    """The stateless chat agent, compiled on first use (or by the app lifespan)."""
+    return build_chat_agent()
 
-# Singleton compiled graph
-chat_agent = build_chat_agent()
+
+@lru_cache(maxsize=4)
+def _session_agent(checkpointer: BaseCheckpointSaver[str]) -> CompiledStateGraph[AgentState]:
+    """The chat agent compiled with the session store's checkpointer."""
+    return build_chat_agent(checkpointer)
+
+
+@asynccontextmanager
+async def _agent_for(session_id: str | None) -> AsyncIterator[CompiledStateGraph[AgentState]]:
+    """The graph to run: stateless, or checkpointed and locked for ``session_id``."""
+    if session_id is None:
+        yield get_chat_agent()
+        return
+    store = get_session_store()
+    async with session_lock(session_id):
+        await store.touch(session_id)
+        yield _session_agent(store.checkpointer)
+        # The latest checkpoint holds the whole conversation; earlier ones only grow.
+        await store.prune(session_id)
+
+
+def _to_langchain_messages(messages: list[dict[str, str]]) -> list[BaseMessage]:
+    """Convert API message dicts to LangChain messages.
+
+    System messages are dropped; the agent's system prompt comes from the
+    run config.
+    """
+    result: list[BaseMessage] = []
+    for msg in messages:
+        if msg["role"] == "user":
+            result.append(HumanMessage(content=msg["content"]))
+        elif msg["role"] == "assistant":
+            result.append(AIMessage(content=msg["content"]))
+    return result
+
+
+def _run_config(
+    model: str,
+    temperature: float,
+    max_tokens: int | None,
+    system_prompt: str,
+    history_max_tokens: int | None,
+    session_id: str | None,
+) -> RunnableConfig:
+    """Graph config carrying per-request settings to ``_call_model``."""
+    configurable: dict[str, Any] = {
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "system_prompt": system_prompt,
+        "history_max_tokens": history_max_tokens,
+    }
+    if session_id is not None:
+        configurable["thread_id"] = session_id
+    return {"callbacks": get_callbacks(), "configurable": configurable}
 
 
 async def run_chat_agent(
     messages: list[dict[str, str]],
-    system_prompt: str = "You are a helpful AI assistant built with AIForge by Psypher AI. You have access to tools and can search a knowledge base.",
-) -> str:
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+    model: str = DEFAULT_CHAT_MODEL,
+    temperature: float = 0.7,
+    max_tokens: int | None = None,
+    history_max_tokens: int | None = None,
+    session_id: str | None = None,
+) -> dict[str, Any]:
     """Run the chat agent and return the final response.
 
     Args:
-        messages: List of message dicts with 'role' and 'content'.
+        messages: List of message dicts with 'role' and 'content'; with a
+            ``session_id``, only the messages new since the last turn.
         system_prompt: System prompt to prepend.
+        model: Chat model identifier (OpenAI or Anthropic).
+        temperature: Sampling temperature.
+        max_tokens: Optional completion token limit.
+        history_max_tokens: Token budget for system prompt + history
+            (default: settings.chat_history_max_tokens).
+        session_id: Server-side session to continue (see ``app.services.sessions``).
 
     Returns:
-        The assistant's final text response.
+        Dict with the assistant's final text response (``content``) and the
+        names of the tools called during this turn (``tools``).
     """
-    langchain_messages: list[BaseMessage] = [SystemMessage(content=system_prompt)]
+    config = _run_config(
+        model, temperature, max_tokens, system_prompt, history_max_tokens, session_id
+    )
+    async with _agent_for(session_id) as agent:
+        result = await agent.ainvoke({"messages": _to_langchain_messages(messages)}, config=config)
 
-    for msg in messages:
-        if msg["role"] == "user":
-            langchain_messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            langchain_messages.append(AIMessage(content=msg["content"]))
+    # With a session, the result holds the whole conversation; this turn starts
+    # after the last human message.
+    turn: list[BaseMessage] = []
+    for message in reversed(result["messages"]):
+        if isinstance(message, HumanMessage):
+            break
+        turn.append(message)
+    tools = [call["name"] for m in turn if isinstance(m, AIMessage) for call in m.tool_calls]
+    return {"content": result["messages"][-1].text, "tools": tools}
 
-    result = await chat_agent.ainvoke(
-        {"messages": langchain_messages},
-        config={"callbacks": get_callbacks()},
-    )
 
-    final_message = result["messages"][-1]
-    return str(final_message.content)
+async def stream_chat_agent(
+    messages: list[dict[str, str]],
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+    model: str = DEFAULT_CHAT_MODEL,
+    temperature: float = 0.7,
+    max_tokens: int | None = None,
+    history_max_tokens: int | None = None,
+    session_id: str | None = None,
+) -> AsyncGenerator[dict[str, Any]]:
+    """Run the chat agent, yielding events as the graph produces them.
+
+    Takes the same arguments as ``run_chat_agent``.
+
+    Yields dicts with a ``type`` of:
+    - ``token``: an LLM text delta from the agent node (``content``)
+    - ``tool_start`` / ``tool_end``: tool-call progress (``name``)
+
+    Closing the iterator (e.g. when the client disconnects) cancels the run.
+    """
+    config = _run_config(
+        model, temperature, max_tokens, system_prompt, history_max_tokens, session_id
+    )
+    streamed_runs: set[str] = set()
+
+    async with _agent_for(session_id) as agent:
+        async for event in agent.astream_events(
+            {"messages": _to_langchain_messages(messages)},
+            config=config,
+            version="v2",
+        ):
+            kind = event["event"]
+            is_agent = (
+                event.get("metadata", {}).get("langgraph_node") == "agent"
+                and SUMMARY_RUN_TAG not in event.get("tags", [])
+            )
+            if kind == "on_chat_model_stream" and is_agent:
+                # ``text`` also covers list-of-blocks content (Anthropic with tools bound).
+                if text := event["data"]["chunk"].text:
+                    streamed_runs.add(event["run_id"])
+                    yield {"type": "token", "content": text}
+            elif kind == "on_chat_model_end" and is_agent and event["run_id"] not in streamed_runs:
+                # Models that don't stream still deliver their answer, in one piece.
+                if text := event["data"]["output"].text:
+                    yield {"type": "token", "content": text}
+            elif kind == "on_tool_start":
+                yield {"type": "tool_start", "name": event["name"]}
+            elif kind == "on_tool_end":
+                yield {"type": "tool_end", "name": event["name"]}
@@ -5,6 +5,16 @@ Production patterns for orchestrating multiple AI agents:
 2. Pipeline: Sequential chain of agents
 3. Parallel Fan-Out: Multiple agents process in parallel
 
+All nodes are async and call models with ``ainvoke``, so running a graph
+never blocks the event loop or takes a threadpool worker.
+
+The factories return cached compiled graphs: calls with equal arguments
+(compared by canonical JSON, so key order in worker dicts does not matter)
+share one graph instead of rebuilding and compiling it per request. Known
+configurations can be compiled at startup with ``warm_graph_cache``.
+Graphs carry the observability callbacks (``get_callbacks``), so worker,
+stage and merge nodes are measured like the chat and RAG agents' nodes.
+
 Usage:
     from app.agents.orchestrator import create_supervisor, create_pipeline
 
@@ -17,12 +27,30 @@ Usage:
 
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
 import operator
-from typing import Annotated, Literal, TypedDict
-
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Annotated, Any, NotRequired, TypedDict
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, StateGraph
+from langgraph.graph.state import CompiledStateGraph
+
+from app.agents.routing import FINISH, RouterKind, make_router
+from app.core.config import settings
+from app.core.observability import get_callbacks
+from app.services.llm import get_scheduled_model
+
+logger = logging.getLogger(__name__)
 
 
 # ── Types ────────────────────────────────────────────────────────────
@@ -34,6 +62,8 @@ class AgentWorker(TypedDict):
     system_prompt: str
     model: str
     temperature: float
+    timeout: NotRequired[float]  # parallel fan-out only; seconds before the branch is dropped
+    keywords: NotRequired[list[str]]  # supervisor "rules" router only
 
 
 class SupervisorState(TypedDict):
@@ -41,6 +71,7 @@ class SupervisorState(TypedDict):
     messages: Annotated[list[BaseMessage], operator.add]
     current_worker: str
     round: int
+    routing: Annotated[list[dict[str, Any]], operator.add]  # one entry per supervisor decision
 
 
 class PipelineState(TypedDict):
@@ -49,46 +80,125 @@ class PipelineState(TypedDict):
     current_stage: int
 
 
+# ── Compiled-graph cache ─────────────────────────────────────────────
+
+
+class GraphCache:
+    """LRU of compiled graphs keyed by a hash of their factory and arguments."""
+
+    def __init__(self, maxsize: int = 64) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._graphs: OrderedDict[str, Any] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def get_or_build(self, pattern: str, params: dict[str, Any], build: Callable[..., Any]) -> Any:
+        """Return the cached graph for ``params``, building it with ``build`` on a miss.
+
+        The graph is built from a copy of ``params`` decoded from the hashed
+        JSON, so later changes to the caller's dicts cannot diverge from the key.
+        """
+        payload = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        key = hashlib.blake2b(f"{pattern}\0{payload}".encode(), digest_size=16).hexdigest()
+        graph = self._graphs.get(key)
+        if graph is not None:
+            self.hits += 1
+            self._graphs.move_to_end(key)
+            return graph
+        self.misses += 1
+        graph = build(**json.loads(payload))
+        self._graphs[key] = graph
+        while len(self._graphs) > self.maxsize:
+            self._graphs.popitem(last=False)
+        return graph
+
+    def clear(self) -> None:
+        self._graphs.clear()
+
+
+@functools.lru_cache(maxsize=1)
+def get_graph_cache() -> GraphCache:
+    """Process-wide cache shared by all orchestrator factories."""
+    return GraphCache(settings.orchestrator_graph_cache_size)
+
+
+def _cached_graph(build: Callable[..., Any]) -> Callable[..., Any]:
+    """Serve a graph factory's results from ``get_graph_cache()``."""
+    signature = inspect.signature(build)
+
+    @functools.wraps(build)
+    def create(*args: Any, **kwargs: Any) -> Any:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return get_graph_cache().get_or_build(build.__name__, bound.arguments, build)
+
+    return create
+
+
 # ── Pattern 1: Supervisor ────────────────────────────────────────────
 
 
+@_cached_graph
 def create_supervisor(
     workers: list[AgentWorker],
     supervisor_prompt: str = "You are a supervisor. Delegate tasks to the right worker.",
     model: str = "gpt-4o",
     max_rounds: int = 5,
-) -> StateGraph:
+    router: RouterKind | None = None,
+    router_model: str | None = None,
+) -> CompiledStateGraph[SupervisorState]:
     """Create a supervisor graph that delegates to specialist workers.
 
     The supervisor analyzes the task, picks the right worker, reviews output,
     and can re-delegate until satisfied.
+
+    ``router`` picks how it decides (see ``app.agents.routing``; default
+    ``settings.supervisor_router``). Each decision is recorded in
+    ``routing`` with its latency.
     """
     worker_names = [w["name"] for w in workers]
-    worker_list = "\n".join(f"- {w['name']}: {w['description']}" for w in workers)
-
-    def supervisor_node(state: SupervisorState) -> dict:
-        llm = ChatOpenAI(model=model, temperature=0.3)
-        response = llm.invoke(
-            [
-                SystemMessage(
-                    content=f"{supervisor_prompt}\n\nAvailable workers:\n{worker_list}\n\n"
-                    f"Respond with EXACTLY one of: {', '.join(worker_names)} OR 'FINISH' if done."
-                ),
-                *state["messages"],
-                HumanMessage(content=f"Task: {state['task']}\nRound: {state['round']}/{max_rounds}"),
-            ]
-        )
-        next_worker = response.content.strip()
-        return {"current_worker": next_worker, "messages": [response]}
+    chooser = make_router(
+        router or settings.supervisor_router,
+        workers,
+        supervisor_prompt,
+        model,
+        max_rounds,
+        router_model,
+    )
 
-    def make_worker_node(worker: AgentWorker):
-        def worker_node(state: SupervisorState) -> dict:
-            llm = ChatOpenAI(
+    async def supervisor_node(state: SupervisorState, config: RunnableConfig) -> dict[str, Any]:
+        start = time.perf_counter()
+        decision = await chooser.route(state["task"], state["messages"], state["round"], config)
+        latency_ms = (time.perf_counter() - start) * 1000
+        logger.debug(
+            "Supervisor %s router chose %s in %.1f ms", chooser.name, decision.worker, latency_ms
+        )
+        update: dict[str, Any] = {
+            "current_worker": decision.worker or FINISH,
+            "routing": [
+                {
+                    "round": state["round"],
+                    "router": chooser.name,
+                    "worker": decision.worker,
+                    "latency_ms": round(latency_ms, 2),
+                }
+            ],
+        }
+        if decision.message is not None:
+            update["messages"] = [decision.message]
+        return update
+
+    def make_worker_node(worker: AgentWorker) -> Callable[..., Awaitable[dict[str, Any]]]:
+        async def worker_node(state: SupervisorState, config: RunnableConfig) -> dict[str, Any]:
+            llm = get_scheduled_model(
                 model=worker.get("model", model),
                 temperature=worker.get("temperature", 0.7),
             )
-            response = llm.invoke(
-                [SystemMessage(content=worker["system_prompt"]), *state["messages"]]
+            response = await llm.ainvoke(
+                [SystemMessage(content=worker["system_prompt"]), *state["messages"]], config
             )
             return {"messages": [response], "round": state["round"] + 1}
 
@@ -97,15 +207,13 @@ def create_supervisor(
     def route(state: SupervisorState) -> str:
         if state["round"] >= max_rounds:
             return END
-        current = state["current_worker"].upper()
-        if "FINISH" in current:
-            return END
-        for w in workers:
-            if w["name"].lower() in state["current_worker"].lower():
-                return w["name"]
+        if state["current_worker"] in worker_names:
+            return state["current_worker"]
         return END
 
-    graph = StateGraph(SupervisorState)
+    graph: StateGraph[SupervisorState, None, SupervisorState, SupervisorState] = StateGraph(
+        SupervisorState
+    )
     graph.add_node("supervisor", supervisor_node)
 
     for worker in workers:
@@ -115,31 +223,41 @@ def create_supervisor(
     graph.set_entry_point("supervisor")
     graph.add_conditional_edges("supervisor", route)
 
-    return graph.compile()
+    return graph.compile().with_config(callbacks=get_callbacks())
 
 
 # ── Pattern 2: Pipeline ──────────────────────────────────────────────
 
 
+@_cached_graph
 def create_pipeline(
     stages: list[AgentWorker],
     model: str = "gpt-4o",
-) -> StateGraph:
+) -> CompiledStateGraph[PipelineState]:
     """Create a pipeline graph — sequential chain of agents, each refining output."""
 
-    graph = StateGraph(PipelineState)
+    graph: StateGraph[PipelineState, None, PipelineState, PipelineState] = StateGraph(PipelineState)
 
     for i, stage in enumerate(stages):
 
-        def make_stage_node(s: AgentWorker, idx: int):
-            def stage_node(state: PipelineState) -> dict:
-                llm = ChatOpenAI(
+        def make_stage_node(s: AgentWorker, idx: int) -> Callable[..., Awaitable[dict[str, Any]]]:
+            async def stage_node(state: PipelineState, config: RunnableConfig) -> dict[str, Any]:
+                llm = get_scheduled_model(
                     model=s.get("model", model),
                     temperature=s.get("temperature", 0.7),
                 )
-                prompt = state["input"] if idx == 0 else "Continue refining based on the previous output."
-                response = llm.invoke(
-                    [SystemMessage(content=s["system_prompt"]), *state["messages"], HumanMessage(content=prompt)]
+                prompt = (
+                    state["input"]
+                    if idx == 0
+                    else "Continue refining based on the previous output."
+                )
+                response = await llm.ainvoke(
+                    [
+                        SystemMessage(content=s["system_prompt"]),
+                        *state["messages"],
+                        HumanMessage(content=prompt),
+                    ],
+                    config,
                 )
                 return {"messages": [response], "current_stage": idx + 1}
 
@@ -153,58 +271,141 @@ def create_pipeline(
             graph.add_edge(stages[i - 1]["name"], stage["name"])
 
     graph.add_edge(stages[-1]["name"], END)
-    return graph.compile()
+    return graph.compile().with_config(callbacks=get_callbacks())
 
 
 # ── Pattern 3: Parallel Fan-Out ──────────────────────────────────────
 
 
+def _merge_dicts(left: dict[str, str], right: dict[str, str]) -> dict[str, str]:
+    """Reducer for per-agent results written by concurrent branches."""
+    return {**left, **right}
+
+
 class ParallelState(TypedDict):
     input: str
-    agent_outputs: dict[str, str]
+    agent_outputs: Annotated[dict[str, str], _merge_dicts]
+    agent_errors: Annotated[dict[str, str], _merge_dicts]  # agent name -> why it was dropped
     messages: Annotated[list[BaseMessage], operator.add]
 
 
+@_cached_graph
 def create_parallel(
     agents: list[AgentWorker],
     merge_prompt: str = "Synthesize the following agent outputs into a comprehensive response.",
     model: str = "gpt-4o",
-) -> StateGraph:
-    """Create a parallel graph — multiple agents process simultaneously, results merged."""
+    max_concurrency: int | None = None,
+    timeout: float | None = None,
+) -> CompiledStateGraph[ParallelState]:
+    """Create a parallel graph — multiple agents process simultaneously, results merged.
+
+    Agent branches run concurrently in one step, so the fan-out takes about
+    as long as its slowest branch. A branch that fails or exceeds its
+    timeout is recorded in ``agent_errors`` and left out, and the merge
+    synthesizes whatever finished. The merge fails only if every branch did.
+
+    Args:
+        agents: Agents to fan out to; ``timeout`` on an agent overrides the default.
+        merge_prompt: System prompt for the merge step.
+        model: Default model for agents and the merge step.
+        max_concurrency: Agent branches running at once within one run
+            (default: settings.orchestrator_max_concurrency). Applied through
+            the run config, so each invocation gets its own limit on its own
+            event loop; a caller's ``max_concurrency`` overrides it.
+        timeout: Seconds each agent's model call may take
+            (default: settings.orchestrator_agent_timeout).
+    """
+    default_timeout = timeout or settings.orchestrator_agent_timeout
 
-    graph = StateGraph(ParallelState)
+    graph: StateGraph[ParallelState, None, ParallelState, ParallelState] = StateGraph(ParallelState)
 
     for agent in agents:
 
-        def make_agent_node(a: AgentWorker):
-            def agent_node(state: ParallelState) -> dict:
-                llm = ChatOpenAI(
+        def make_agent_node(a: AgentWorker) -> Callable[..., Awaitable[dict[str, Any]]]:
+            async def agent_node(state: ParallelState, config: RunnableConfig) -> dict[str, Any]:
+                llm = get_scheduled_model(
                     model=a.get("model", model),
                     temperature=a.get("temperature", 0.7),
                 )
-                response = llm.invoke(
-                    [SystemMessage(content=a["system_prompt"]), HumanMessage(content=state["input"])]
-                )
-                return {"agent_outputs": {a["name"]: response.content}}
+                agent_timeout = a.get("timeout", default_timeout)
+                messages = [
+                    SystemMessage(content=a["system_prompt"]),
+                    HumanMessage(content=state["input"]),
+                ]
+                # Queued branches start only once a slot is free, so the
+                # timeout never counts time spent waiting for one.
+                try:
+                    response = await asyncio.wait_for(llm.ainvoke(messages, config), agent_timeout)
+                except TimeoutError:
+                    logger.warning(
+                        "Parallel agent %s timed out after %.1fs", a["name"], agent_timeout
+                    )
+                    return {"agent_errors": {a["name"]: f"timed out after {agent_timeout:g}s"}}
+                except Exception as exc:
+                    logger.warning("Parallel agent %s failed", a["name"], exc_info=True)
+                    return {"agent_errors": {a["name"]: f"{type(exc).__name__}: {exc}"}}
+                return {"agent_outputs": {a["name"]: response.text}}
 
             return agent_node
 
         graph.add_node(agent["name"], make_agent_node(agent))
         graph.set_entry_point(agent["name"])
 
-    def merge_node(state: ParallelState) -> dict:
-        llm = ChatOpenAI(model=model, temperature=0.3)
+    async def merge_node(state: ParallelState, config: RunnableConfig) -> dict[str, Any]:
+        agent_outputs = state.get("agent_outputs", {})
+        if not agent_outputs:
+            raise RuntimeError(f"All parallel agents failed: {state.get('agent_errors', {})}")
+        llm = get_scheduled_model(model=model, temperature=0.3)
+        # Keep the agents' order, whichever branch finished first.
         outputs = "\n\n".join(
-            f"### {name}:\n{output}" for name, output in state["agent_outputs"].items()
+            f"### {a['name']}:\n{agent_outputs[a['name']]}"
+            for a in agents
+            if a["name"] in agent_outputs
         )
-        response = llm.invoke(
-            [SystemMessage(content=merge_prompt), HumanMessage(content=outputs)]
+        response = await llm.ainvoke(
+            [SystemMessage(content=merge_prompt), HumanMessage(content=outputs)], config
         )
         return {"messages": [response]}
 
     graph.add_node("merge", merge_node)
-    for agent in agents:
-        graph.add_edge(agent["name"], "merge")
+    # One edge from all branches: merge runs once, after every branch has finished.
+    graph.add_edge([a["name"] for a in agents], "merge")
     graph.add_edge("merge", END)
 
-    return graph.compile()
+    return graph.compile().with_config(
+        callbacks=get_callbacks(),
+        max_concurrency=max_concurrency or settings.orchestrator_max_concurrency,
+    )
+
+
+# ── Warmup ───────────────────────────────────────────────────────────
+
+_FACTORIES: dict[str, Callable[..., Any]] = {
+    "supervisor": create_supervisor,
+    "pipeline": create_pipeline,
+    "parallel": create_parallel,
+}
+
+
+def warm_graph_cache(path: str | Path) -> int:
+    """Compile the configurations listed in a JSON file into the graph cache.
+
+    The file holds a list of objects with a ``pattern`` (``supervisor``,
+    ``pipeline`` or ``parallel``) plus that factory's keyword arguments.
+    Invalid entries are logged and skipped.
+
+    Returns:
+        The number of graphs compiled.
+    """
+    specs = json.loads(Path(path).read_text())
+    warmed = 0
+    for spec in specs:
+        try:
+            params = dict(spec)
+            factory = _FACTORIES[params.pop("pattern")]
+            factory(**params)
+        except Exception:
+            logger.warning("Skipping invalid orchestrator warmup entry: %r", spec, exc_info=True)
+            continue
+        warmed += 1
+    return warmed
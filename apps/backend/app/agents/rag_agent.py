@@ -1,18 +1,40 @@
-"""RAG agent with Supabase pgvector retrieval + LangGraph orchestration."""
+"""RAG agent with vector-store retrieval (pgvector or embedded index) + LangGraph orchestration."""
 
 from __future__ import annotations
 
-from typing import Annotated, TypedDict
+import asyncio
+import logging
+import time
+from collections.abc import AsyncGenerator
+from functools import lru_cache
+from typing import Annotated, Any, TypedDict, cast
 
+import numpy as np
 from langchain_core.documents import Document
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, StateGraph
 from langgraph.graph.message import add_messages
+from langgraph.graph.state import CompiledStateGraph
 
 from app.core.config import settings
 from app.core.observability import get_callbacks
-from app.services.vector_store import search_vectors
+from app.services.context_packer import CONTEXT_SEPARATOR, ContextPacker, format_chunk
+from app.services.embeddings import embed_query, embed_texts
+from app.services.llm import DEFAULT_CHAT_MODEL, get_scheduled_model
+from app.services.rerank import get_scorer, rerank
+from app.services.tokens import get_token_counter
+from app.services.vector_store import SearchMode, SearchTuning, get_vector_store
+
+logger = logging.getLogger(__name__)
+
+
+RAG_SYSTEM_PROMPT = """You are a helpful AI assistant with access to a knowledge base.
+Use the following retrieved context to answer the user's question.
+If the context doesn't contain relevant information, say so honestly.
+
+Retrieved Context:
+{context}"""
 
 
 # ── State ──────────────────────────────────────────────────────────────
@@ -24,105 +46,371 @@ class RAGState(TypedDict):
     documents: list[Document]
     collection: str
     top_k: int
+    search_mode: SearchMode
+    tuning: SearchTuning | None
+    # Prompt context built by pack; None means format every document.
+    context: str | None
+    rerank: bool
+    # Set by retrieve when re-ranking: the query vector and one row per candidate.
+    query_embedding: np.ndarray | None
+    candidate_embeddings: np.ndarray | None
 
 
 # ── Nodes ──────────────────────────────────────────────────────────────
-async def retrieve_documents(state: RAGState) -> dict:
-    """Retrieve relevant documents from Supabase pgvector."""
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        api_key=settings.openai_api_key,
-    )
-    query_embedding = await embeddings.aembed_query(state["query"])
+async def retrieve_documents(state: RAGState) -> dict[str, Any]:
+    """Retrieve relevant documents from the configured vector store.
+
+    When re-ranking, over-fetches ``rerank_fetch_factor * top_k`` candidates
+    together with their embeddings.
+    """
+    query_embedding = await embed_query(state["query"])
+
+    if not state.get("rerank"):
+        docs = await get_vector_store().search(
+            embedding=query_embedding,
+            collection=state["collection"],
+            top_k=state["top_k"],
+            mode=state.get("search_mode", "vector"),
+            query_text=state["query"],
+            tuning=state.get("tuning"),
+        )
+        return {"documents": docs}
 
-    docs = await search_vectors(
+    candidates = await get_vector_store().search_candidates(
         embedding=query_embedding,
         collection=state["collection"],
-        top_k=state["top_k"],
+        top_k=state["top_k"] * settings.rerank_fetch_factor,
+        mode=state.get("search_mode", "vector"),
+        query_text=state["query"],
+        tuning=state.get("tuning"),
     )
+    return {
+        "documents": candidates.documents,
+        "query_embedding": query_embedding,
+        "candidate_embeddings": candidates.embeddings,
+    }
 
-    return {"documents": docs}
 
+async def rerank_documents(state: RAGState) -> dict[str, Any]:
+    """Diversify over-fetched candidates down to top_k with MMR (no-op when disabled)."""
+    query_embedding = state.get("query_embedding")
+    candidate_embeddings = state.get("candidate_embeddings")
+    if not state.get("rerank") or query_embedding is None or candidate_embeddings is None:
+        return {}
 
-async def generate_answer(state: RAGState) -> dict:
-    """Generate answer using retrieved context."""
-    context = "\n\n---\n\n".join(
-        [f"Source: {doc.metadata.get('source', 'unknown')}\n{doc.page_content}" for doc in state["documents"]]
+    scorer = get_scorer()
+    args = (
+        state["query"],
+        query_embedding,
+        state["documents"],
+        candidate_embeddings,
+        state["top_k"],
+        settings.rerank_lambda,
+        scorer,
     )
+    # Cross-encoder inference is CPU-bound; plain MMR is a few small matmuls.
+    docs = await asyncio.to_thread(rerank, *args) if scorer else rerank(*args)
+    return {"documents": docs, "candidate_embeddings": None}
 
-    system_prompt = f"""You are a helpful AI assistant with access to a knowledge base.
-Use the following retrieved context to answer the user's question.
-If the context doesn't contain relevant information, say so honestly.
 
-Retrieved Context:
-{context}"""
+async def pack_context(state: RAGState, config: RunnableConfig) -> dict[str, Any]:
+    """Fit the documents into the context token budget, most relevant first."""
+    model = config.get("configurable", {}).get("model", DEFAULT_CHAT_MODEL)
+    packer = ContextPacker(get_token_counter(model), settings.rag_context_max_tokens)
+    # Off the loop: the first call for a model loads its tiktoken encoding.
+    packed = await asyncio.to_thread(packer.pack, state["documents"])
+    if packed.truncated or packed.skipped:
+        logger.debug(
+            "Packed %d/%d documents into %d tokens (%d truncated, %d skipped)",
+            len(packed.documents),
+            len(state["documents"]),
+            packed.tokens,
+            packed.truncated,
+            packed.skipped,
+        )
+    return {"documents": packed.documents, "context": packed.text}
+
 
-    llm = ChatOpenAI(
-        model="gpt-4o",
+async def generate_answer(state: RAGState, config: RunnableConfig) -> dict[str, Any]:
+    """Generate answer using retrieved context."""
+    context = state.get("context")
+    if context is None:
+        context = CONTEXT_SEPARATOR.join(format_chunk(doc) for doc in state["documents"])
+
+    system_prompt = RAG_SYSTEM_PROMPT.format(context=context)
+
+    llm = get_scheduled_model(
+        model=config.get("configurable", {}).get("model", DEFAULT_CHAT_MODEL),
         temperature=0.3,
-        api_key=settings.openai_api_key,
     )
 
     messages = [SystemMessage(content=system_prompt), HumanMessage(content=state["query"])]
-    response = await llm.ainvoke(messages, config={"callbacks": get_callbacks()})
+    # Pass the node config through so tokens reach the graph's event stream.
+    response = await llm.ainvoke(messages, config)
 
     return {"messages": [response]}
 
 
 # ── Graph ──────────────────────────────────────────────────────────────
-def build_rag_agent() -> StateGraph:
-    """Build the RAG agent graph: retrieve -> generate."""
-    graph = StateGraph(RAGState)
+def build_rag_agent() -> CompiledStateGraph[RAGState]:
+    """Build the RAG agent graph: retrieve -> rerank -> pack -> generate."""
+    graph: StateGraph[RAGState, None, RAGState, RAGState] = StateGraph(RAGState)
 
     graph.add_node("retrieve", retrieve_documents)
+    graph.add_node("rerank", rerank_documents)
+    graph.add_node("pack", pack_context)
     graph.add_node("generate", generate_answer)
 
     graph.set_entry_point("retrieve")
-    graph.add_edge("retrieve", "generate")
+    graph.add_edge("retrieve", "rerank")
+    graph.add_edge("rerank", "pack")
+    graph.add_edge("pack", "generate")
     graph.add_edge("generate", END)
 
     return graph.compile()
 
 
-rag_agent = build_rag_agent()
+@lru_cache(maxsize=1)
+def get_rag_agent() -> CompiledStateGraph[RAGState]:
+    """The RAG agent, compiled on first use (or by the app lifespan)."""
+    return build_rag_agent()
+
+
+def _run_config(model: str) -> RunnableConfig:
+    """Graph config carrying the request's generation model to ``generate_answer``."""
+    return {"callbacks": get_callbacks(), "configurable": {"model": model}}
+
+
+def _initial_state(
+    query: str,
+    collection: str,
+    top_k: int,
+    search_mode: SearchMode = "vector",
+    rerank: bool | None = None,
+    tuning: SearchTuning | None = None,
+) -> RAGState:
+    return {
+        "messages": [],
+        "query": query,
+        "documents": [],
+        "collection": collection,
+        "top_k": top_k,
+        "search_mode": search_mode,
+        "tuning": tuning,
+        "context": None,
+        "rerank": settings.rerank_enabled if rerank is None else rerank,
+        "query_embedding": None,
+        "candidate_embeddings": None,
+    }
+
+
+def format_sources(documents: list[Document]) -> list[dict[str, Any]]:
+    """Shape retrieved documents for API responses (content preview + metadata)."""
+    return [
+        {
+            "content": doc.page_content[:200],
+            "metadata": doc.metadata,
+        }
+        for doc in documents
+    ]
 
 
 async def run_rag_query(
     query: str,
     collection: str = "documents",
     top_k: int = 5,
-) -> dict:
+    model: str = DEFAULT_CHAT_MODEL,
+    search_mode: SearchMode = "vector",
+    rerank: bool | None = None,
+    tuning: SearchTuning | None = None,
+) -> dict[str, Any]:
     """Run RAG query and return answer + sources.
 
     Args:
         query: User's question.
-        collection: pgvector collection name.
+        collection: Vector store collection name.
         top_k: Number of documents to retrieve.
+        model: Chat model used for generation.
+        search_mode: 'vector' or 'hybrid' (full-text + vector rank fusion).
+        rerank: Over-fetch and diversify with MMR (default: settings.rerank_enabled).
+        tuning: ANN recall/latency knobs (hnsw.ef_search / ivfflat.probes) for retrieval.
 
     Returns:
         Dict with 'content' and 'sources'.
     """
-    result = await rag_agent.ainvoke(
-        {
-            "messages": [],
-            "query": query,
-            "documents": [],
-            "collection": collection,
-            "top_k": top_k,
-        },
-        config={"callbacks": get_callbacks()},
+    result = await get_rag_agent().ainvoke(
+        _initial_state(query, collection, top_k, search_mode, rerank, tuning),
+        config=_run_config(model),
     )
 
-    sources = [
-        {
-            "content": doc.page_content[:200],
-            "metadata": doc.metadata,
-        }
-        for doc in result.get("documents", [])
-    ]
-
     final_message = result["messages"][-1]
     return {
-        "content": str(final_message.content),
-        "sources": sources,
+        "content": final_message.text,
+        "sources": format_sources(result.get("documents", [])),
     }
+
+
+# Nodes whose output changes the sources a streamed answer cites.
+_SOURCE_NODES = ("retrieve", "rerank", "pack")
+
+
+async def stream_rag_query(
+    query: str,
+    collection: str = "documents",
+    top_k: int = 5,
+    model: str = DEFAULT_CHAT_MODEL,
+    search_mode: SearchMode = "vector",
+    rerank: bool | None = None,
+    tuning: SearchTuning | None = None,
+) -> AsyncGenerator[dict[str, Any]]:
+    """Run a RAG query, yielding sources as soon as retrieval finishes.
+
+    Takes the same arguments as ``run_rag_query``.
+
+    Yields dicts with a ``type`` of:
+    - ``sources``: retrieved (and re-ranked) sources, before any answer token.
+      If packing the context into its token budget then drops or truncates
+      chunks, a second ``sources`` event replaces the first with exactly the
+      chunks in the prompt, still before any answer token.
+    - ``token``: an answer text delta from the generate node (``content``)
+    - ``done``: token ``usage`` and ``timings`` in milliseconds
+      (``retrieve_ms``, ``ttft_ms``, ``total_ms``)
+
+    Closing the iterator (e.g. when the client disconnects) cancels the run.
+    """
+    started = time.perf_counter()
+    timings: dict[str, float] = {}
+    usage: dict[str, int] | None = None
+    documents: list[Document] = []
+    sources: list[dict[str, Any]] = []
+
+    def elapsed_ms() -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    async for event in get_rag_agent().astream_events(
+        _initial_state(query, collection, top_k, search_mode, rerank, tuning),
+        config=_run_config(model),
+        version="v2",
+    ):
+        kind = event["event"]
+        node = event.get("metadata", {}).get("langgraph_node")
+        if kind == "on_chain_end" and event["name"] == node and node in _SOURCE_NODES:
+            output = event["data"]["output"]
+            if node == "retrieve":
+                documents = output.get("documents", [])
+                continue
+            documents = output.get("documents", documents)
+            if node == "rerank":
+                # Sources are known once rerank has run (it passes through when disabled).
+                timings["retrieve_ms"] = elapsed_ms()
+            elif format_sources(documents) == sources:
+                continue  # everything fit into the context budget
+            sources = format_sources(documents)
+            yield {"type": "sources", "sources": sources}
+        elif kind == "on_chat_model_stream" and node == "generate":
+            # ``text`` also covers list-of-blocks content (e.g. Anthropic).
+            if text := event["data"]["chunk"].text:
+                timings.setdefault("ttft_ms", elapsed_ms())
+                yield {"type": "token", "content": text}
+        elif kind == "on_chat_model_end" and node == "generate":
+            output = event["data"]["output"]
+            if "ttft_ms" not in timings and output.text:
+                # Non-streaming models deliver the answer in one piece.
+                timings["ttft_ms"] = elapsed_ms()
+                yield {"type": "token", "content": output.text}
+            if output.usage_metadata:
+                usage = {
+                    "prompt_tokens": output.usage_metadata["input_tokens"],
+                    "completion_tokens": output.usage_metadata["output_tokens"],
+                    "total_tokens": output.usage_metadata["total_tokens"],
+                }
+
+    timings["total_ms"] = elapsed_ms()
+    yield {"type": "done", "usage": usage, "timings": timings}
+
+
+async def run_rag_batch(
+    queries: list[dict[str, Any]],
+    concurrency: int | None = None,
+) -> list[dict[str, Any]]:
+    """Answer many RAG queries with batched embedding and retrieval.
+
+    All queries are embedded in one API call and retrieved in one batched
+    search per collection and tuning; generation then runs with at most
+    ``concurrency`` LLM calls in flight.
+
+    Args:
+        queries: Dicts with 'query' and optional 'collection', 'top_k', 'model',
+            'search_mode', 'rerank', 'ef_search', 'probes'. Hybrid and re-ranked
+            queries are retrieved individually (concurrently).
+        concurrency: Max concurrent generations (default: settings.rag_batch_concurrency).
+
+    Returns:
+        One dict per query, in input order, with 'content', 'sources' and
+        'error' (None unless that query's generation failed).
+    """
+    embeddings = await embed_texts([q["query"] for q in queries])
+    states = [
+        _initial_state(
+            q["query"],
+            q.get("collection", "documents"),
+            q.get("top_k", 5),
+            q.get("search_mode", "vector"),
+            q.get("rerank"),
+            SearchTuning(q.get("ef_search"), q.get("probes")),
+        )
+        for q in queries
+    ]
+
+    groups: dict[tuple[str, SearchTuning | None], list[int]] = {}
+    individual: list[int] = []
+    for i, state in enumerate(states):
+        if state["search_mode"] == "hybrid" or state["rerank"]:
+            individual.append(i)
+        else:
+            groups.setdefault((state["collection"], state["tuning"]), []).append(i)
+
+    documents: list[list[Document]] = [[] for _ in queries]
+
+    async def retrieve(collection: str, tuning: SearchTuning | None, indices: list[int]) -> None:
+        found = await get_vector_store().search_batch(
+            [embeddings[i] for i in indices],
+            collection=collection,
+            top_k=[queries[i].get("top_k", 5) for i in indices],
+            tuning=tuning,
+        )
+        for i, docs in zip(indices, found, strict=True):
+            documents[i] = docs
+
+    async def retrieve_one(i: int) -> None:
+        # The query embedding is already cached, so the nodes skip the API call.
+        state = cast(RAGState, {**states[i], **await retrieve_documents(states[i])})
+        state.update(cast(RAGState, await rerank_documents(state)))
+        documents[i] = state["documents"]
+
+    await asyncio.gather(
+        *(retrieve(c, t, idx) for (c, t), idx in groups.items()),
+        *(retrieve_one(i) for i in individual),
+    )
+
+    semaphore = asyncio.Semaphore(concurrency or settings.rag_batch_concurrency)
+
+    async def generate(i: int) -> dict[str, Any]:
+        config = _run_config(queries[i].get("model", DEFAULT_CHAT_MODEL))
+        state: RAGState = {**states[i], "documents": documents[i]}
+        state.update(cast(RAGState, await pack_context(state, config)))
+        result: dict[str, Any] = {
+            "content": "",
+            "sources": format_sources(state["documents"]),
+            "error": None,
+        }
+        async with semaphore:
+            try:
+                update = await generate_answer(state, config)
+                result["content"] = update["messages"][-1].text
+            except Exception as exc:
+                logger.exception("RAG batch generation error")
+                result["error"] = str(exc)
+        return result
+
+    return await asyncio.gather(*(generate(i) for i in range(len(queries))))
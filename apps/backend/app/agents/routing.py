@@ -0,0 +1,271 @@
+"""Supervisor routers — pick the next worker without a frontier-model call.
+
+``create_supervisor`` takes a router by name:
+
+- ``llm``: the supervisor model answers in free text, matched against
+  worker names. The original behaviour and the default; one full model
+  call per round.
+- ``structured``: a small model (``settings.supervisor_router_model``)
+  returns the choice through structured output constrained to the worker
+  names, so no parsing is needed. A refusal or unparseable answer falls
+  back to the ``llm`` router for that round.
+- ``embedding``: the task is matched against worker descriptions by cosine
+  similarity. Description embeddings are computed once per router.
+- ``rules``: a worker's ``keywords`` matched as whole words in the task,
+  falling back to the embedding router when no rule fires.
+
+``embedding`` and ``rules`` are single-hop: they delegate the task to one
+worker and finish once it has answered.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Literal, Protocol
+
+import numpy as np
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import Field, create_model
+
+from app.core.config import settings
+from app.services.embeddings import embed_query, embed_texts
+from app.services.llm import get_scheduled_model
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel, LanguageModelInput
+
+    from app.agents.orchestrator import AgentWorker
+
+FINISH = "FINISH"
+
+RouterKind = Literal["llm", "structured", "embedding", "rules"]
+
+
+@dataclass
+class RouteDecision:
+    """The next worker, or None to finish.
+
+    ``message`` is added to the conversation, so workers see the
+    supervisor's reply (only the ``llm`` router has one).
+    """
+
+    worker: str | None
+    message: BaseMessage | None = None
+
+
+class Router(Protocol):
+    name: str
+
+    async def route(
+        self,
+        task: str,
+        messages: list[BaseMessage],
+        round_: int,
+        config: RunnableConfig | None = None,
+    ) -> RouteDecision: ...
+
+
+def _routing_prompt(supervisor_prompt: str, workers: list[AgentWorker]) -> str:
+    worker_list = "\n".join(f"- {w['name']}: {w['description']}" for w in workers)
+    names = ", ".join(w["name"] for w in workers)
+    return (
+        f"{supervisor_prompt}\n\nAvailable workers:\n{worker_list}\n\n"
+        f"Respond with EXACTLY one of: {names} OR '{FINISH}' if done."
+    )
+
+
+class LLMRouter:
+    """Free-text choice from the supervisor model, matched against worker names."""
+
+    name = "llm"
+
+    def __init__(
+        self,
+        workers: list[AgentWorker],
+        supervisor_prompt: str,
+        model: str,
+        max_rounds: int,
+    ) -> None:
+        self.workers = workers
+        self.prompt = _routing_prompt(supervisor_prompt, workers)
+        self.model = model
+        self.max_rounds = max_rounds
+
+    async def route(
+        self,
+        task: str,
+        messages: list[BaseMessage],
+        round_: int,
+        config: RunnableConfig | None = None,
+    ) -> RouteDecision:
+        llm = get_scheduled_model(model=self.model, temperature=0.3)
+        response = await llm.ainvoke(
+            [
+                SystemMessage(content=self.prompt),
+                *messages,
+                HumanMessage(content=f"Task: {task}\nRound: {round_}/{self.max_rounds}"),
+            ],
+            config,
+        )
+        answer = response.text.strip()
+        worker = None
+        if FINISH not in answer.upper():
+            worker = next(
+                (w["name"] for w in self.workers if w["name"].lower() in answer.lower()), None
+            )
+        return RouteDecision(worker, response)
+
+
+class StructuredRouter:
+    """Choice constrained to the worker names via a small model's structured output.
+
+    When the model returns no choice (a refusal or a failed parse),
+    ``fallback`` decides.
+    """
+
+    name = "structured"
+
+    def __init__(
+        self,
+        workers: list[AgentWorker],
+        supervisor_prompt: str,
+        model: str,
+        max_rounds: int,
+        fallback: Router,
+    ) -> None:
+        self.fallback = fallback
+        self.prompt = _routing_prompt(supervisor_prompt, workers)
+        self.model = model
+        self.max_rounds = max_rounds
+        options = tuple(w["name"] for w in workers) + (FINISH,)
+        self.schema = create_model(
+            "RouteChoice",
+            next=(Literal[options], Field(description="The worker to act next, or FINISH")),
+        )
+        # (registry model, structured runnable); bound on first use, needs provider credentials
+        self._llm: tuple[BaseChatModel, Runnable[LanguageModelInput, Any]] | None = None
+
+    async def route(
+        self,
+        task: str,
+        messages: list[BaseMessage],
+        round_: int,
+        config: RunnableConfig | None = None,
+    ) -> RouteDecision:
+        # Rebind when the registry has rebuilt the model (e.g. after close_llm_clients).
+        llm = get_scheduled_model(model=self.model, temperature=0.0)
+        if self._llm is None or self._llm[0] is not llm:
+            self._llm = (llm, llm.with_structured_output(self.schema))
+        # RouteChoice is built at runtime, so its fields are unknown to the type checker.
+        choice: Any = await self._llm[1].ainvoke(
+            [
+                SystemMessage(content=self.prompt),
+                *messages,
+                HumanMessage(content=f"Task: {task}\nRound: {round_}/{self.max_rounds}"),
+            ],
+            config,
+        )
+        if choice is None:
+            return await self.fallback.route(task, messages, round_, config)
+        return RouteDecision(None if choice.next == FINISH else choice.next)
+
+
+class EmbeddingRouter:
+    """Single-hop: the worker whose description is most similar to the task."""
+
+    name = "embedding"
+
+    def __init__(self, workers: list[AgentWorker]) -> None:
+        self.workers = workers
+        self._descriptions: np.ndarray | None = None
+
+    async def _description_matrix(self) -> np.ndarray:
+        if self._descriptions is None:
+            vectors = await embed_texts([f"{w['name']}: {w['description']}" for w in self.workers])
+            matrix = np.stack(vectors)
+            self._descriptions = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        return self._descriptions
+
+    async def scores(self, task: str) -> np.ndarray:
+        """Cosine similarity of ``task`` to each worker's description."""
+        query = await embed_query(task)
+        similarity: np.ndarray = await self._description_matrix() @ (query / np.linalg.norm(query))
+        return similarity
+
+    async def route(
+        self,
+        task: str,
+        messages: list[BaseMessage],
+        round_: int,
+        config: RunnableConfig | None = None,
+    ) -> RouteDecision:
+        if round_ > 0:
+            return RouteDecision(None)
+        return RouteDecision(self.workers[int(np.argmax(await self.scores(task)))]["name"])
+
+
+class RulesRouter:
+    """Single-hop: the worker whose ``keywords`` match the task most often.
+
+    Ties go to the earlier worker. Without a match, ``fallback`` decides.
+    """
+
+    name = "rules"
+
+    def __init__(self, workers: list[AgentWorker], fallback: Router) -> None:
+        self.fallback = fallback
+        self.rules = [
+            (w["name"], re.compile(rf"\b(?:{'|'.join(map(re.escape, keywords))})\b", re.I))
+            for w in workers
+            if (keywords := w.get("keywords"))
+        ]
+
+    def match(self, task: str) -> str | None:
+        best, best_hits = None, 0
+        for name, pattern in self.rules:
+            hits = len(pattern.findall(task))
+            if hits > best_hits:
+                best, best_hits = name, hits
+        return best
+
+    async def route(
+        self,
+        task: str,
+        messages: list[BaseMessage],
+        round_: int,
+        config: RunnableConfig | None = None,
+    ) -> RouteDecision:
+        if round_ > 0:
+            return RouteDecision(None)
+        worker = self.match(task)
+        if worker is not None:
+            return RouteDecision(worker)
+        return await self.fallback.route(task, messages, round_, config)
+
+
+def make_router(
+    kind: RouterKind,
+    workers: list[AgentWorker],
+    supervisor_prompt: str,
+    model: str,
+    max_rounds: int,
+    router_model: str | None = None,
+) -> Router:
+    """Build the router ``create_supervisor`` asked for.
+
+    ``router_model`` overrides ``settings.supervisor_router_model`` for the
+    ``structured`` router.
+    """
+    if kind == "llm":
+        return LLMRouter(workers, supervisor_prompt, model, max_rounds)
+    if kind == "structured":
+        small = router_model or settings.supervisor_router_model
+        fallback = LLMRouter(workers, supervisor_prompt, model, max_rounds)
+        return StructuredRouter(workers, supervisor_prompt, small, max_rounds, fallback)
+    if kind == "embedding":
+        return EmbeddingRouter(workers)
+    if kind == "rules":
+        return RulesRouter(workers, fallback=EmbeddingRouter(workers))
+    raise ValueError(f"Unknown router: {kind!r}")
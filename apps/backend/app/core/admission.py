@@ -0,0 +1,252 @@
+"""Admission control for LLM-bound endpoints.
+
+Caps how many agent/RAG runs execute at once, globally and per client key
+(API key, else client IP), so a spike queues or is shed instead of making
+every in-flight request slow.
+
+Requests that cannot start immediately wait in a bounded queue with a
+deadline. Waiters are served by lane priority: ``interactive`` (streaming)
+before ``standard`` before ``batch``. When the queue is full, a new request
+displaces the newest waiter of a lower lane. Otherwise it is rejected at
+once: 429 when its key has too many requests waiting, 503 when the server
+is full or the deadline passes. Rejections carry a ``Retry-After`` derived
+from recent run times.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import Counter, deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Literal
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+
+Lane = Literal["interactive", "standard", "batch"]
+
+LANES: tuple[Lane, ...] = ("interactive", "standard", "batch")  # highest priority first
+
+QUEUE_TIMEOUT_HEADER = "X-Queue-Timeout"
+
+
+class Overloaded(HTTPException):
+    """Request rejected by admission control (429 or 503 with ``Retry-After``)."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int) -> None:
+        super().__init__(status_code, detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+@dataclass(eq=False)
+class _Waiter:
+    key: str
+    lane: Lane
+    future: asyncio.Future[None] = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class Slot:
+    """A granted run slot. ``release`` is idempotent."""
+
+    def __init__(self, controller: AdmissionController, key: str) -> None:
+        self._controller = controller
+        self.key = key
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self.key, time.monotonic() - self.started)
+
+    async def __aenter__(self) -> Slot:
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        self.release()
+
+
+class AdmissionController:
+    """Global and per-key concurrency limits with a prioritized, bounded wait queue."""
+
+    def __init__(
+        self,
+        max_concurrent: int = 64,
+        per_key_concurrent: int = 8,
+        queue_size: int = 256,
+        per_key_queue: int = 32,
+        queue_timeout: float = 15.0,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.per_key_concurrent = per_key_concurrent
+        self.queue_size = queue_size
+        self.per_key_queue = per_key_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        self._active_by_key: Counter[str] = Counter()
+        self._waiting_by_key: Counter[str] = Counter()
+        self._lanes: dict[Lane, deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._service_time = 1.0  # EWMA of seconds a slot is held
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._lanes.values())
+
+    def retry_after(self) -> int:
+        """Seconds until a retry is likely to be admitted, from recent run times."""
+        estimate = self._service_time * (self.waiting + 1) / self.max_concurrent
+        return min(60, max(1, math.ceil(estimate)))
+
+    def _can_start(self, key: str) -> bool:
+        return (
+            self.active < self.max_concurrent and self._active_by_key[key] < self.per_key_concurrent
+        )
+
+    def _start(self, key: str) -> Slot:
+        self.active += 1
+        self._active_by_key[key] += 1
+        return Slot(self, key)
+
+    def _reject(self, status_code: int, detail: str) -> Overloaded:
+        self.rejected += 1
+        return Overloaded(status_code, detail, self.retry_after())
+
+    async def acquire(
+        self, key: str, lane: Lane = "standard", timeout: float | None = None
+    ) -> Slot:
+        """Wait for a run slot; raises ``Overloaded`` if rejected or not admitted in time."""
+        # Waiters are granted as soon as they can start, so anyone still queued
+        # is blocked on a limit this request does not share: no overtaking.
+        if self._can_start(key):
+            return self._start(key)
+
+        if self._waiting_by_key[key] >= self.per_key_queue:
+            raise self._reject(429, "Too many concurrent requests for this client")
+        if self.waiting >= self.queue_size and not self._displace(lane):
+            raise self._reject(503, "Server is at capacity")
+
+        waiter = _Waiter(key, lane)
+        self._lanes[lane].append(waiter)
+        self._waiting_by_key[key] += 1
+        deadline = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), deadline)
+        except TimeoutError:
+            if not self._forget(waiter):
+                return self._granted(waiter)
+            raise self._reject(503, "Timed out waiting for capacity") from None
+        except asyncio.CancelledError:
+            if not self._forget(waiter) and waiter.future.exception() is None:
+                # Granted just as the caller went away: hand the slot on.
+                self._release(key, held=None)
+            raise
+        return self._granted(waiter)
+
+    def _granted(self, waiter: _Waiter) -> Slot:
+        waiter.future.result()  # raises Overloaded if the waiter was displaced
+        return Slot(self, waiter.key)
+
+    def _displace(self, lane: Lane) -> bool:
+        """Reject the newest waiter of the lowest lane below ``lane`` to make room."""
+        for lower in reversed(LANES[LANES.index(lane) + 1 :]):
+            if self._lanes[lower]:
+                victim = self._lanes[lower].pop()
+                self._unwait(victim.key)
+                victim.future.set_exception(
+                    self._reject(503, "Displaced by higher-priority requests")
+                )
+                return True
+        return False
+
+    def _forget(self, waiter: _Waiter) -> bool:
+        """Drop a still-queued waiter; False if it was already granted or rejected."""
+        if waiter.future.done():
+            return False
+        self._lanes[waiter.lane].remove(waiter)
+        self._unwait(waiter.key)
+        waiter.future.cancel()
+        return True
+
+    def _unwait(self, key: str) -> None:
+        self._waiting_by_key[key] -= 1
+        if not self._waiting_by_key[key]:
+            del self._waiting_by_key[key]
+
+    def _release(self, key: str, held: float | None) -> None:
+        if held is not None:
+            self._service_time = 0.9 * self._service_time + 0.1 * held
+        self.active -= 1
+        self._active_by_key[key] -= 1
+        if not self._active_by_key[key]:
+            del self._active_by_key[key]
+        self._wake()
+
+    def _wake(self) -> None:
+        """Grant free slots to waiters in lane order, skipping keys at their limit."""
+        for lane in LANES:
+            queue = self._lanes[lane]
+            for waiter in list(queue):
+                if self.active >= self.max_concurrent:
+                    return
+                if self._active_by_key[waiter.key] >= self.per_key_concurrent:
+                    continue
+                queue.remove(waiter)
+                self._unwait(waiter.key)
+                self._start(waiter.key)
+                waiter.future.set_result(None)
+
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> AdmissionController:
+    """Process-wide admission controller configured from settings."""
+    return AdmissionController(
+        max_concurrent=settings.admission_max_concurrent,
+        per_key_concurrent=settings.admission_per_key_concurrent,
+        queue_size=settings.admission_queue_size,
+        per_key_queue=settings.admission_per_key_queue,
+        queue_timeout=settings.admission_queue_timeout,
+    )
+
+
+def client_key(request: Request) -> str:
+    """Per-client admission key: the API key if sent, else the client IP."""
+    api_key = request.headers.get("x-api-key") or request.headers.get("authorization")
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+async def admit(request: Request, lane: Lane = "standard") -> Slot | None:
+    """Acquire a run slot for ``request``; None when admission control is disabled.
+
+    Clients may shorten their queue deadline with ``X-Queue-Timeout`` (seconds).
+    """
+    if not settings.admission_enabled:
+        return None
+    timeout = None
+    if header := request.headers.get(QUEUE_TIMEOUT_HEADER):
+        try:
+            timeout = max(0.0, float(header))
+        except ValueError:
+            raise HTTPException(400, f"Invalid {QUEUE_TIMEOUT_HEADER} header") from None
+    return await get_admission_controller().acquire(client_key(request), lane, timeout)
+
+
+@asynccontextmanager
+async def admitted(request: Request, lane: Lane = "standard") -> AsyncIterator[None]:
+    """Hold a run slot for ``request`` for the duration of the block."""
+    slot = await admit(request, lane)
+    try:
+        yield
+    finally:
+        if slot is not None:
+            slot.release()
@@ -0,0 +1,113 @@
+"""Async Postgres connection pool shared across the backend.
+
+The pool is opened and closed by the FastAPI ``lifespan`` hook in ``app.main``
+so every request reuses warm connections instead of paying a TCP + TLS + auth
+handshake against Supabase per query.
+
+Pools and cursors from here record acquire and statement times in the
+Prometheus histograms of ``app.core.metrics``.
+"""
+
+from __future__ import annotations
+
+import logging
+from time import perf_counter
+from typing import Any, Self
+
+import psycopg
+from pgvector.psycopg import register_vector_async
+from psycopg_pool import AsyncConnectionPool
+
+from app.core.config import settings
+from app.core.metrics import DB_ACQUIRE_SECONDS, DB_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_pool: AsyncConnectionPool | None = None
+
+
+class TimedCursor(psycopg.AsyncCursor[Any]):
+    """Cursor that records statement execution time."""
+
+    async def execute(self, query: Any, params: Any = None, **kwargs: Any) -> Self:
+        start = perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(perf_counter() - start)
+
+    async def executemany(self, query: Any, params_seq: Any, **kwargs: Any) -> None:
+        start = perf_counter()
+        try:
+            await super().executemany(query, params_seq, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(perf_counter() - start)
+
+
+class TimedConnectionPool(AsyncConnectionPool[psycopg.AsyncConnection[Any]]):
+    """Pool that records how long callers wait for a connection, by pool name."""
+
+    async def getconn(self, timeout: float | None = None) -> Any:
+        start = perf_counter()
+        try:
+            return await super().getconn(timeout)
+        finally:
+            DB_ACQUIRE_SECONDS.labels(self.name).observe(perf_counter() - start)
+
+
+async def _configure_connection(conn: psycopg.AsyncConnection) -> None:
+    """Set up every new pooled connection: timed cursors and pgvector adapters.
+
+    With the adapters in place NumPy float32 arrays are sent and received as
+    the native ``vector`` wire format instead of ``'[0.1,0.2,...]'`` literals.
+    """
+    conn.cursor_factory = TimedCursor
+    try:
+        await register_vector_async(conn)
+    except psycopg.ProgrammingError:
+        logger.warning("pgvector extension not installed; vector adapters not registered")
+    # Type lookups open a transaction; the pool requires connections back idle.
+    await conn.rollback()
+
+
+async def open_pool() -> AsyncConnectionPool:
+    """Create and open the shared connection pool (idempotent).
+
+    Opening does not wait for the first connection, so the app still starts
+    when Postgres is unreachable; callers see a ``PoolTimeout`` on acquire.
+    """
+    global _pool
+    if _pool is None:
+        _pool = TimedConnectionPool(
+            conninfo=settings.supabase_db_url,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            timeout=settings.db_pool_timeout,
+            max_idle=settings.db_pool_max_idle,
+            max_lifetime=settings.db_pool_max_lifetime,
+            check=AsyncConnectionPool.check_connection if settings.db_pool_check else None,
+            configure=_configure_connection,
+            name="aiforge",
+            open=False,
+        )
+        await _pool.open(wait=False)
+    return _pool
+
+
+async def close_pool() -> None:
+    """Close the shared connection pool, if open."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> AsyncConnectionPool:
+    """Return the shared connection pool.
+
+    Raises:
+        RuntimeError: If the pool has not been opened by the app lifespan.
+    """
+    if _pool is None:
+        raise RuntimeError("Database pool is not open. It is created in the app lifespan.")
+    return _pool
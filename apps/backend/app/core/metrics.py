@@ -0,0 +1,226 @@
+"""Prometheus latency and throughput metrics, served at ``/metrics``.
+
+Traces answer "what happened in this request"; these histograms answer
+"where does p99 go" without shipping anything to an external service.
+Recording costs a few microseconds per event:
+
+- ``MetricsMiddleware``: HTTP latency by route template and status (pure
+  ASGI, so streaming responses are timed to their last byte).
+- ``MetricsCallbackHandler``: LangGraph node durations, model time to first
+  token and token counts, from LangChain callbacks run inline on the event
+  loop. It is included in ``get_callbacks()``.
+- Embedding API calls, pool acquire and query times, recorded where they
+  happen (``app.services.embeddings``, ``app.core.database``).
+
+Metrics live in the default registry of each process. With several
+workers, scrape each one or run prometheus_client in multiprocess mode.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from time import perf_counter
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+__all__ = [
+    "CONTENT_TYPE_LATEST",
+    "MetricsCallbackHandler",
+    "MetricsMiddleware",
+    "get_metrics_handler",
+    "render_metrics",
+]
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10)
+_TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "aiforge_http_request_duration_seconds",
+    "HTTP request latency, to the end of the response body",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+GRAPH_NODE_SECONDS = Histogram(
+    "aiforge_graph_node_duration_seconds",
+    "LangGraph node run time",
+    ["node", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "aiforge_llm_time_to_first_token_seconds",
+    "Time from a streaming model call to its first token",
+    ["model"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "aiforge_llm_request_duration_seconds",
+    "Chat model call latency",
+    ["model", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "aiforge_llm_tokens",
+    "Tokens per chat model call",
+    ["model", "kind"],
+    buckets=_TOKEN_BUCKETS,
+)
+EMBEDDING_REQUEST_SECONDS = Histogram(
+    "aiforge_embedding_request_duration_seconds",
+    "Embedding API call latency (cache misses only)",
+    buckets=_LATENCY_BUCKETS,
+)
+DB_ACQUIRE_SECONDS = Histogram(
+    "aiforge_db_pool_acquire_seconds",
+    "Time waiting for a pooled Postgres connection",
+    ["pool"],
+    buckets=_DB_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "aiforge_db_query_duration_seconds",
+    "Postgres statement execution time",
+    buckets=_DB_BUCKETS,
+)
+
+TRACES = Counter(
+    "aiforge_traces_total",
+    "Recorded traces by outcome: exported, sampled_out, dropped (buffer full) or failed",
+    ["outcome"],
+)
+
+
+def render_metrics() -> bytes:
+    """The default registry in the Prometheus text format."""
+    return generate_latest()
+
+
+class MetricsMiddleware:
+    """Records ``aiforge_http_request_duration_seconds`` for every HTTP request.
+
+    Routes are labelled by their path template, and unmatched paths share
+    one label, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(perf_counter() - start)
+
+
+def _model_name(metadata: dict[str, Any] | None, invocation: dict[str, Any]) -> str:
+    if metadata and (model := metadata.get("ls_model_name")):
+        return str(model)
+    return str(invocation.get("model") or invocation.get("model_name") or "unknown")
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """LangChain callbacks that feed the node, TTFT and token histograms.
+
+    A node is timed from its own run: the one named after its
+    ``langgraph_node``, not the model and tool runs nested inside it.
+    """
+
+    run_inline = True  # called on the event loop, not in a thread pool
+
+    def __init__(self) -> None:
+        self._nodes: dict[UUID, tuple[str, float]] = {}
+        self._models: dict[UUID, tuple[str, float]] = {}
+        self._streaming: set[UUID] = set()
+
+    def on_chain_start(
+        self,
+        serialized: dict[str, Any] | None,
+        inputs: Any,
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        name: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        node = metadata.get("langgraph_node") if metadata else None
+        if node is not None and node == name:
+            self._nodes[run_id] = (node, perf_counter())
+
+    def _end_node(self, run_id: UUID, status: str) -> None:
+        started = self._nodes.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            GRAPH_NODE_SECONDS.labels(node, status).observe(perf_counter() - start)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_node(run_id, "ok")
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_node(run_id, "error")
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any] | None,
+        messages: Any,
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        invocation_params: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        self._models[run_id] = (_model_name(metadata, invocation_params or {}), perf_counter())
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._streaming:
+            return
+        started = self._models.get(run_id)
+        if started is not None:
+            self._streaming.add(run_id)
+            model, start = started
+            LLM_TIME_TO_FIRST_TOKEN_SECONDS.labels(model).observe(perf_counter() - start)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._streaming.discard(run_id)
+        started = self._models.pop(run_id, None)
+        if started is None:
+            return
+        model, start = started
+        LLM_REQUEST_SECONDS.labels(model, "ok").observe(perf_counter() - start)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.labels(model, "input").observe(usage["input_tokens"])
+                    LLM_TOKENS.labels(model, "output").observe(usage["output_tokens"])
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._streaming.discard(run_id)
+        started = self._models.pop(run_id, None)
+        if started is not None:
+            model, start = started
+            LLM_REQUEST_SECONDS.labels(model, "error").observe(perf_counter() - start)
+
+
+@lru_cache(maxsize=1)
+def get_metrics_handler() -> MetricsCallbackHandler:
+    """Process-wide handler; runs are tracked by id, so one serves every request."""
+    return MetricsCallbackHandler()
@@ -3,23 +3,31 @@
 from __future__ import annotations
 
 import os
-
-from langfuse import Langfuse, observe
+from typing import TYPE_CHECKING, Any
 
 from app.core.config import settings
+from app.core.metrics import get_metrics_handler
+
+if TYPE_CHECKING:
+    from langfuse import observe
+
+    from app.core.tracing import get_langfuse
 
 # Re-export the observe decorator for use in agents/routes
 __all__ = ["observe", "get_langfuse", "setup_observability"]
 
 
-def get_langfuse() -> Langfuse:
-    """Get the Langfuse client instance."""
-    return Langfuse(
-        public_key=settings.langfuse_public_key,
-        secret_key=settings.langfuse_secret_key,
-        host=settings.langfuse_host,
-        enabled=bool(settings.langfuse_public_key),
-    )
+def __getattr__(name: str) -> Any:
+    # langfuse takes most of a second to import; load it only if it is used.
+    if name == "observe":
+        from langfuse import observe
+
+        return observe
+    if name == "get_langfuse":
+        from app.core.tracing import get_langfuse
+
+        return get_langfuse
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def setup_observability() -> None:
@@ -35,14 +43,17 @@ def setup_observability() -> None:
         os.environ["LANGCHAIN_PROJECT"] = settings.langsmith_project
 
 
-def get_callbacks() -> list:
+def get_callbacks() -> list[Any]:
     """Get LangChain-compatible callbacks for agent runs.
 
-    Returns an empty list if no observability is configured,
-    which is safe to pass to LangChain/LangGraph invoke calls.
+    Includes the Prometheus metrics handler when ``settings.metrics_enabled``
+    and the sampled Langfuse recorder when Langfuse is configured; otherwise
+    the list may be empty, which is safe to pass to LangChain/LangGraph
+    invoke calls. LangSmith uses env vars.
     """
-    callbacks: list = []
-    # Langfuse v3 uses the @observe decorator and auto-instrumentation
-    # rather than explicit callbacks. LangSmith uses env vars.
-    # This function is kept for API compatibility.
+    callbacks: list[Any] = [get_metrics_handler()] if settings.metrics_enabled else []
+    if settings.langfuse_public_key:
+        from app.core.tracing import get_trace_recorder
+
+        callbacks.append(get_trace_recorder())
     return callbacks
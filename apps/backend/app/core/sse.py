@@ -0,0 +1,86 @@
+"""Server-Sent Events helpers shared by the streaming endpoints."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+from collections.abc import AsyncGenerator, AsyncIterator
+from typing import Any
+
+
+def sse(data: str | dict[str, Any], event: str | None = None) -> str:
+    """Format one SSE frame.
+
+    Plain strings are sent as-is (split across ``data:`` lines so embedded
+    newlines survive); dicts are JSON-encoded.
+    """
+    payload = json.dumps(data) if isinstance(data, dict) else data
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in payload.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+async def coalesce_tokens(
+    events: AsyncIterator[dict[str, Any]],
+    interval: float = 0.03,
+    max_chars: int = 256,
+) -> AsyncGenerator[dict[str, Any]]:
+    """Merge consecutive ``{"type": "token"}`` events into fewer, larger frames.
+
+    Buffered text is flushed after ``interval`` seconds even when the model
+    stalls, when it reaches ``max_chars``, or right before any other event,
+    so ordering is preserved and per-frame overhead stays bounded.
+    """
+    loop = asyncio.get_running_loop()
+    buffer: list[str] = []
+    size = 0
+    deadline = 0.0
+    pending: asyncio.Future[dict[str, Any]] | None = None
+
+    def flush() -> dict[str, Any]:
+        nonlocal size
+        text = "".join(buffer)
+        buffer.clear()
+        size = 0
+        return {"type": "token", "content": text}
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(events))
+            timeout = max(deadline - loop.time(), 0) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield flush()
+                continue
+
+            future, pending = pending, None
+            try:
+                event = future.result()
+            except StopAsyncIteration:
+                break
+
+            if event.get("type") == "token":
+                if not buffer:
+                    deadline = loop.time() + interval
+                buffer.append(event["content"])
+                size += len(event["content"])
+                if size >= max_chars:
+                    yield flush()
+                continue
+
+            if buffer:
+                yield flush()
+            yield event
+
+        if buffer:
+            yield flush()
+    finally:
+        if pending is not None:
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await pending
+        aclose = getattr(events, "aclose", None)
+        if aclose is not None:
+            await aclose()
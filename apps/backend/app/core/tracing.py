@@ -0,0 +1,465 @@
+"""Sampled, non-blocking trace export to Langfuse.
+
+Sending every run to Langfuse as it happens puts serialization and network
+work on the request path, and holds every trace's payload in memory under
+load. Instead:
+
+- ``TraceRecorder`` (a LangChain callback handler, run inline) keeps a
+  run's spans and generations in memory until its root run ends. Recording
+  is a few dict operations per event.
+- Head sampling: only ``tracing_head_sample_rate`` of root runs are
+  recorded at all.
+- Tail sampling: when a recorded run ends, it is kept if it failed, took at
+  least ``tracing_slow_threshold`` seconds, or falls in
+  ``tracing_tail_sample_rate`` of the rest. Other runs are discarded.
+- ``TraceExporter`` buffers kept traces, up to ``tracing_buffer_size``.
+  When the buffer is full, new traces are dropped and counted; callers
+  never wait. A background task sends them in batches through the
+  Langfuse ingestion API, with their original timestamps.
+
+Outcomes are counted in ``aiforge_traces_total`` (see ``app.core.metrics``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from functools import lru_cache
+from typing import Any, Literal
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from langfuse import Langfuse
+from langfuse.api.resources.ingestion.types import (
+    CreateGenerationBody,
+    CreateSpanBody,
+    IngestionEvent,
+    IngestionEvent_GenerationCreate,
+    IngestionEvent_SpanCreate,
+    IngestionEvent_TraceCreate,
+    TraceBody,
+)
+
+from app.core.config import settings
+from app.core.metrics import TRACES
+
+logger = logging.getLogger(__name__)
+
+# LangGraph marks its plumbing runs (channel writes, routing) with this tag.
+HIDDEN_TAG = "langsmith:hidden"
+
+_MAX_DEPTH = 6
+_MAX_STRING = 10_000
+
+
+@lru_cache(maxsize=1)
+def get_langfuse() -> Langfuse:
+    """The shared Langfuse client (also behind the ``observe`` decorator)."""
+    return Langfuse(
+        public_key=settings.langfuse_public_key,
+        secret_key=settings.langfuse_secret_key,
+        host=settings.langfuse_host,
+        tracing_enabled=bool(settings.langfuse_public_key),
+        flush_at=settings.tracing_batch_size,
+        flush_interval=settings.tracing_flush_interval,
+        sample_rate=settings.tracing_head_sample_rate,
+    )
+
+
+@dataclass(slots=True, eq=False)
+class Observation:
+    """One span or generation, in wall-clock seconds."""
+
+    key: UUID
+    parent_id: str | None
+    name: str
+    kind: Literal["span", "generation"]
+    start: float
+    input: Any = None
+    output: Any = None
+    end: float | None = None
+    error: str | None = None
+    model: str | None = None
+    usage: dict[str, int] | None = None
+    first_token: float | None = None
+
+    @property
+    def id(self) -> str:
+        return str(self.key)
+
+
+@dataclass(slots=True, eq=False)
+class Trace:
+    """A root run and everything recorded under it."""
+
+    observations: list[Observation] = field(default_factory=list)
+    error: bool = False
+    reason: str = ""  # why tail sampling kept it: error, slow or sampled
+
+    @property
+    def root(self) -> Observation:
+        return self.observations[0]
+
+    @property
+    def id(self) -> str:
+        return self.root.id
+
+    @property
+    def duration(self) -> float:
+        return (self.root.end or time.time()) - self.root.start
+
+
+def _jsonable(value: Any, depth: int = 0) -> Any:
+    """A JSON-friendly, size-bounded copy of a run input or output."""
+    if value is None or isinstance(value, bool | int | float):
+        return value
+    if isinstance(value, str):
+        return value[:_MAX_STRING]
+    if depth >= _MAX_DEPTH:
+        return str(value)[:_MAX_STRING]
+    if isinstance(value, BaseMessage):
+        message: dict[str, Any] = {"role": value.type, "content": _jsonable(value.content, depth)}
+        if tool_calls := getattr(value, "tool_calls", None):
+            message["tool_calls"] = _jsonable(tool_calls, depth + 1)
+        return message
+    if isinstance(value, Document):
+        return {"page_content": value.page_content[:_MAX_STRING], "metadata": value.metadata}
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, list | tuple):
+        return [_jsonable(v, depth + 1) for v in value]
+    return str(value)[:_MAX_STRING]
+
+
+def _timestamp(seconds: float | None) -> datetime | None:
+    return datetime.fromtimestamp(seconds, UTC) if seconds is not None else None
+
+
+def to_ingestion_events(traces: Sequence[Trace]) -> list[IngestionEvent]:
+    """Langfuse ingestion events for finished traces."""
+    now = datetime.now(UTC).isoformat()
+    events: list[IngestionEvent] = []
+    for trace in traces:
+        root = trace.root
+        events.append(
+            IngestionEvent_TraceCreate(
+                id=uuid.uuid4().hex,
+                timestamp=now,
+                body=TraceBody(
+                    id=trace.id,
+                    timestamp=_timestamp(root.start),
+                    name=root.name,
+                    input=_jsonable(root.input),
+                    output=_jsonable(root.output),
+                    metadata={"sampled": trace.reason, "duration_s": round(trace.duration, 3)},
+                ),
+            )
+        )
+        for obs in trace.observations:
+            common: dict[str, Any] = {
+                "id": obs.id,
+                "trace_id": trace.id,
+                "name": obs.name,
+                "start_time": _timestamp(obs.start),
+                "end_time": _timestamp(obs.end),
+                "input": _jsonable(obs.input),
+                "output": _jsonable(obs.output),
+                "parent_observation_id": obs.parent_id,
+            }
+            if obs.error is not None:
+                common.update(level="ERROR", status_message=obs.error[:_MAX_STRING])
+            if obs.kind == "generation":
+                generation = common | {
+                    "model": obs.model,
+                    "usage_details": obs.usage,
+                    "completion_start_time": _timestamp(obs.first_token),
+                }
+                body = CreateGenerationBody(**generation)
+                events.append(
+                    IngestionEvent_GenerationCreate(id=uuid.uuid4().hex, timestamp=now, body=body)
+                )
+            else:
+                events.append(
+                    IngestionEvent_SpanCreate(
+                        id=uuid.uuid4().hex, timestamp=now, body=CreateSpanBody(**common)
+                    )
+                )
+    return events
+
+
+async def send_to_langfuse(traces: Sequence[Trace]) -> None:
+    """Serialize off the event loop, then send one ingestion batch."""
+    events = await asyncio.to_thread(to_ingestion_events, traces)
+    await get_langfuse().async_api.ingestion.batch(batch=events)
+
+
+class TraceExporter:
+    """Bounded buffer of kept traces, drained in batches by a background task."""
+
+    def __init__(
+        self,
+        send: Callable[[Sequence[Trace]], Awaitable[None]] = send_to_langfuse,
+        max_buffer: int = 1000,
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+    ) -> None:
+        self.send = send
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: deque[Trace] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def submit(self, trace: Trace) -> bool:
+        """Queue ``trace`` for export; False (dropped) when the buffer is full."""
+        if len(self._buffer) >= self.max_buffer:
+            TRACES.labels("dropped").inc()
+            return False
+        self._buffer.append(trace)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Send everything buffered, one batch at a time."""
+        while self._buffer:
+            count = min(self.batch_size, len(self._buffer))
+            batch = [self._buffer.popleft() for _ in range(count)]
+            try:
+                await self.send(batch)
+            except Exception:
+                logger.warning("Trace export failed; dropped %d traces", count, exc_info=True)
+                TRACES.labels("failed").inc(count)
+            else:
+                TRACES.labels("exported").inc(count)
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Stop the background task and flush what is left, within ``timeout``."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except TimeoutError:
+            logger.warning("Trace export did not finish on shutdown; %d traces lost", len(self))
+
+
+@lru_cache(maxsize=1)
+def get_trace_exporter() -> TraceExporter:
+    """Process-wide exporter configured from settings; started by the app lifespan."""
+    return TraceExporter(
+        max_buffer=settings.tracing_buffer_size,
+        batch_size=settings.tracing_batch_size,
+        flush_interval=settings.tracing_flush_interval,
+    )
+
+
+class TraceRecorder(BaseCallbackHandler):
+    """Records runs in memory and hands tail-sampled traces to an exporter."""
+
+    run_inline = True  # called on the event loop, not in a thread pool
+
+    def __init__(
+        self,
+        exporter: TraceExporter | None = None,
+        head_rate: float = 1.0,
+        tail_rate: float = 0.01,
+        slow_threshold: float = 5.0,
+        max_observations: int = 500,
+    ) -> None:
+        self.exporter = exporter
+        self.head_rate = head_rate
+        self.tail_rate = tail_rate
+        self.slow_threshold = slow_threshold
+        self.max_observations = max_observations
+        # run id -> its observation, or its nearest recorded ancestor for hidden runs
+        self._runs: dict[UUID, tuple[Trace, Observation]] = {}
+
+    def _start(
+        self,
+        run_id: UUID,
+        parent_run_id: UUID | None,
+        name: str,
+        kind: Literal["span", "generation"],
+        payload: Any,
+        tags: list[str] | None = None,
+        model: str | None = None,
+    ) -> None:
+        if parent_run_id is None:
+            if random.random() >= self.head_rate:  # noqa: S311 - sampling, not security
+                return
+            trace = Trace()
+            parent_id = None
+        else:
+            parent = self._runs.get(parent_run_id)
+            if parent is None:  # trace not sampled, or over its size limit
+                return
+            trace, parent_obs = parent
+            if tags and HIDDEN_TAG in tags:
+                self._runs[run_id] = parent  # children attach to the visible ancestor
+                return
+            if len(trace.observations) >= self.max_observations:
+                return
+            parent_id = parent_obs.id
+        obs = Observation(run_id, parent_id, name, kind, time.time(), payload, model=model)
+        trace.observations.append(obs)
+        self._runs[run_id] = (trace, obs)
+
+    def _end(
+        self,
+        run_id: UUID,
+        output: Any = None,
+        error: BaseException | None = None,
+        usage: dict[str, int] | None = None,
+    ) -> None:
+        entry = self._runs.pop(run_id, None)
+        if entry is None:
+            return
+        trace, obs = entry
+        if obs.key != run_id:  # hidden run
+            return
+        obs.end = time.time()
+        obs.output = output
+        obs.usage = usage
+        if error is not None:
+            obs.error = repr(error)
+            trace.error = True
+        if obs.parent_id is None:
+            self._finish(trace)
+
+    def _finish(self, trace: Trace) -> None:
+        # Runs cut short (e.g. by cancellation) never end; stop tracking them.
+        for obs in trace.observations:
+            if obs.end is None:
+                self._runs.pop(obs.key, None)
+        if trace.error:
+            trace.reason = "error"
+        elif trace.duration >= self.slow_threshold:
+            trace.reason = "slow"
+        elif random.random() < self.tail_rate:  # noqa: S311 - sampling, not security
+            trace.reason = "sampled"
+        else:
+            TRACES.labels("sampled_out").inc()
+            return
+        if self.exporter is not None:
+            self.exporter.submit(trace)
+
+    def on_chain_start(
+        self,
+        serialized: dict[str, Any] | None,
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        tags: list[str] | None = None,
+        name: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, parent_run_id, name or "chain", "span", inputs, tags)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, outputs)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=error)
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any] | None,
+        messages: list[list[BaseMessage]],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        tags: list[str] | None = None,
+        metadata: dict[str, Any] | None = None,
+        name: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        model = (metadata or {}).get("ls_model_name")
+        self._start(
+            run_id, parent_run_id, name or "chat_model", "generation", messages[0], tags, model
+        )
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        entry = self._runs.get(run_id)
+        if entry is not None and entry[1].first_token is None:
+            entry[1].first_token = time.time()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        generation = response.generations[0][0] if response.generations else None
+        message = getattr(generation, "message", None)
+        usage = getattr(message, "usage_metadata", None)
+        self._end(
+            run_id,
+            message,
+            usage=(
+                {
+                    "input": usage["input_tokens"],
+                    "output": usage["output_tokens"],
+                    "total": usage["total_tokens"],
+                }
+                if usage
+                else None
+            ),
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=error)
+
+    def on_tool_start(
+        self,
+        serialized: dict[str, Any] | None,
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        tags: list[str] | None = None,
+        name: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, parent_run_id, name or "tool", "span", input_str, tags)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, output)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=error)
+
+
+@lru_cache(maxsize=1)
+def get_trace_recorder() -> TraceRecorder:
+    """Process-wide recorder configured from settings."""
+    return TraceRecorder(
+        get_trace_exporter(),
+        head_rate=settings.tracing_head_sample_rate,
+        tail_rate=settings.tracing_tail_sample_rate,
+        slow_threshold=settings.tracing_slow_threshold,
+        max_observations=settings.tracing_max_observations,
+    )
@@ -3,22 +3,75 @@
 Production-grade AI backend with:
 - /api/v1/chat — LangGraph agent with tool calling
 - /api/v1/chat/stream — SSE streaming chat
+- /api/v1/chat/sessions/{id} — DELETE a server-side chat session
 - /api/v1/rag — Retrieval-augmented generation with Supabase pgvector
+- /api/v1/rag/stream — SSE streaming RAG (sources first, then answer tokens)
+- /api/v1/rag/batch — Batch RAG with shared embedding and retrieval round-trips
 - /health — Health check
+- /metrics — Prometheus latency and throughput metrics
 - /docs — Scalar API reference (modern alternative to Swagger UI)
 - /openapi.json — Auto-generated OpenAPI spec
+
+Importing this module stays cheap: provider SDKs, Langfuse and the
+orchestrator load on first use, and agent graphs compile on their first
+request. Set ``startup_warmup`` to pay those costs in the lifespan instead,
+before the server accepts connections (``benchmarks/bench_startup.py``).
 """
 
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 from collections.abc import AsyncGenerator
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 
+from app.agents.chat_agent import get_chat_agent
+from app.agents.rag_agent import get_rag_agent
 from app.core.config import settings
+from app.core.database import close_pool, get_pool, open_pool
+from app.core.metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, render_metrics
+from app.services.embedding_cache import (
+    start_embedding_cache_cleanup,
+    stop_embedding_cache_cleanup,
+)
+from app.services.embeddings import get_openai_client
+from app.services.llm import DEFAULT_CHAT_MODEL, close_llm_clients, get_scheduled_model
+from app.services.llm_scheduler import provider_errors
+from app.services.sessions import close_session_store, open_session_store
+from app.services.tokens import get_token_counter
 from app.routers import chat
 
+logger = logging.getLogger(__name__)
+
+
+def _create_clients() -> None:
+    provider_errors()
+    get_openai_client()
+    # Imports the provider integrations (and the failover's) and opens the shared HTTP pools.
+    get_scheduled_model(DEFAULT_CHAT_MODEL)
+
+
+async def warm_up() -> None:
+    """Do the work a cold first request would otherwise pay for.
+
+    Steps run concurrently, blocking ones in worker threads. A failed step
+    is logged and left to happen on first use, so an unreachable database
+    or tokenizer download does not stop the app from starting.
+    """
+    steps = {
+        "clients": asyncio.to_thread(_create_clients),
+        "chat graph": asyncio.to_thread(get_chat_agent),
+        "rag graph": asyncio.to_thread(get_rag_agent),
+        "tokenizer": asyncio.to_thread(get_token_counter, DEFAULT_CHAT_MODEL),
+        "db pool": get_pool().wait(settings.db_pool_timeout),
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for step, result in zip(steps, results, strict=True):
+        if isinstance(result, Exception):
+            logger.warning("Startup warmup step %r failed: %r", step, result)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
@@ -27,10 +80,37 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
     print(f"🚀 {settings.app_name} starting...")
     print(f"   CORS origins: {settings.cors_origins}")
     print(f"   Langfuse: {'enabled' if settings.langfuse_public_key else 'disabled'}")
+    if settings.langfuse_public_key:
+        from app.core.tracing import get_trace_exporter
+
+        get_trace_exporter().start()
     print(f"   LangSmith: {'enabled' if settings.langsmith_api_key else 'disabled'}")
+    await open_pool()
+    print(f"   DB pool: {settings.db_pool_min_size}-{settings.db_pool_max_size} connections")
+    await open_session_store()
+    print(f"   Chat sessions: {settings.session_backend}")
+    start_embedding_cache_cleanup()
+    if settings.startup_warmup:
+        # Uvicorn accepts connections only once startup completes, so
+        # readiness is reported after the warmup.
+        await warm_up()
+        print("   Warmup: done")
+    if settings.orchestrator_warmup_path:
+        from app.agents.orchestrator import warm_graph_cache
+
+        warmed = warm_graph_cache(settings.orchestrator_warmup_path)
+        print(f"   Orchestrator graphs warmed: {warmed}")
     yield
     # Shutdown
     print(f"👋 {settings.app_name} shutting down...")
+    await close_session_store()
+    stop_embedding_cache_cleanup()
+    if settings.langfuse_public_key:
+        from app.core.tracing import get_trace_exporter
+
+        await get_trace_exporter().close()
+    await close_pool()
+    await close_llm_clients()
 
 
 app = FastAPI(
@@ -84,15 +164,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Metrics (outermost, so the timing covers every other middleware)
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 # Routers
 app.include_router(chat.router)
 
 
 @app.get("/health")
-async def health() -> dict:
+async def health() -> dict[str, str]:
     """Health check endpoint."""
     return {
         "status": "ok",
         "service": "aiforge-backend",
         "version": "1.0.0",
     }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Prometheus metrics for this process."""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -1,5 +1,7 @@
 """Chat request/response models shared via OpenAPI."""
 
+from typing import Any, Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -13,11 +15,27 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     """Incoming chat request."""
 
-    messages: list[ChatMessage] = Field(..., description="Conversation history")
+    messages: list[ChatMessage] = Field(
+        ...,
+        description="Conversation history, or only the new messages when session_id is set",
+    )
     model: str = Field(default="gpt-4o", description="Model identifier")
     stream: bool = Field(default=False, description="Enable streaming response")
     temperature: float = Field(default=0.7, ge=0, le=2)
     max_tokens: int = Field(default=4096, ge=1, le=128000)
+    history_max_tokens: int | None = Field(
+        default=None,
+        ge=256,
+        le=128000,
+        description="Token budget for system prompt + history; older turns are summarized",
+    )
+    session_id: str | None = Field(
+        default=None,
+        min_length=1,
+        max_length=128,
+        pattern=r"^[A-Za-z0-9_.:-]+$",
+        description="Continue a server-side conversation; the server keeps its history",
+    )
 
 
 class ChatResponse(BaseModel):
@@ -26,6 +44,7 @@ class ChatResponse(BaseModel):
     content: str = Field(..., description="Assistant response content")
     model: str = Field(..., description="Model used")
     usage: dict[str, int] | None = Field(default=None, description="Token usage")
+    session_id: str | None = Field(default=None, description="Session the turn was added to")
 
 
 class RAGRequest(BaseModel):
@@ -35,10 +54,50 @@ class RAGRequest(BaseModel):
     collection: str = Field(default="documents", description="Vector collection name")
     top_k: int = Field(default=5, ge=1, le=20, description="Number of results to retrieve")
     model: str = Field(default="gpt-4o", description="Model for generation")
+    search_mode: Literal["vector", "hybrid"] = Field(
+        default="vector",
+        description="'vector' for cosine search, 'hybrid' to fuse full-text and vector ranks",
+    )
+    rerank: bool | None = Field(
+        default=None,
+        description="Over-fetch and diversify sources with MMR (default: server setting)",
+    )
+    ef_search: int | None = Field(
+        default=None,
+        ge=1,
+        le=1000,
+        description="HNSW ef_search for this query: higher = better recall, slower",
+    )
+    probes: int | None = Field(
+        default=None,
+        ge=1,
+        le=10000,
+        description="IVFFlat probes for this query: higher = better recall, slower",
+    )
 
 
 class RAGResponse(BaseModel):
     """RAG response with sources."""
 
     content: str = Field(..., description="Generated answer")
-    sources: list[dict] = Field(default_factory=list, description="Retrieved source documents")
+    sources: list[dict[str, Any]] = Field(
+        default_factory=list, description="Retrieved source documents"
+    )
+
+
+class RAGBatchRequest(BaseModel):
+    """Batch of RAG requests answered with shared embedding and retrieval."""
+
+    requests: list[RAGRequest] = Field(..., min_length=1, max_length=256, description="RAG queries")
+
+
+class RAGBatchResult(RAGResponse):
+    """One answer in a batch; ``error`` is set if its generation failed."""
+
+    error: str | None = Field(default=None, description="Generation error, if any")
+
+
+class RAGBatchResponse(BaseModel):
+    """Batch RAG response, in request order."""
+
+    results: list[RAGBatchResult] = Field(..., description="One result per request")
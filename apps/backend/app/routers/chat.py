@@ -2,27 +2,111 @@
 
 from __future__ import annotations
 
+import hashlib
 import logging
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from typing import Any
 
-from fastapi import APIRouter, HTTPException
+import numpy as np
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
-from app.agents.chat_agent import run_chat_agent
-from app.agents.rag_agent import run_rag_query
+from app.agents.chat_agent import DEFAULT_SYSTEM_PROMPT, run_chat_agent, stream_chat_agent
+from app.agents.rag_agent import RAG_SYSTEM_PROMPT, run_rag_batch, run_rag_query, stream_rag_query
+from app.core.admission import Lane, Overloaded, admit, admitted
 from app.core.config import settings
-from app.models.chat import ChatRequest, ChatResponse, RAGRequest, RAGResponse
+from app.core.sse import coalesce_tokens, sse
+from app.models.chat import (
+    ChatRequest,
+    ChatResponse,
+    RAGBatchRequest,
+    RAGBatchResponse,
+    RAGBatchResult,
+    RAGRequest,
+    RAGResponse,
+)
+from app.services.answer_cache import get_answer_cache, make_scope
+from app.services.embeddings import embed_query
+from app.services.llm_scheduler import ProviderThrottledError
+from app.services.sessions import get_session_store
+from app.services.singleflight import get_singleflight, request_key
+from app.services.vector_store import SearchTuning
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1", tags=["chat"])
 
+CACHE_HEADER = "X-Cache"
+
+
+async def _cache_vector(http_request: Request, text: str) -> np.ndarray | None:
+    """Embed ``text`` for an answer-cache lookup, or None when caching is skipped.
+
+    Clients can bypass the cache with ``Cache-Control: no-cache``. Embedding
+    failures only disable caching for this request.
+    """
+    if not settings.answer_cache_enabled:
+        return None
+    if "no-cache" in http_request.headers.get("cache-control", ""):
+        return None
+    try:
+        return await embed_query(text)
+    except Exception:
+        logger.warning("Answer cache embedding failed; skipping cache", exc_info=True)
+        return None
+
+
+async def _coalesce[T](key: str, fn: Callable[[], Awaitable[T]]) -> T:
+    """Run ``fn`` once for all concurrent requests with the same ``key``.
+
+    Provider rate limiting that outlasted the scheduler's retries becomes a
+    503 with ``Retry-After``.
+    """
+    try:
+        if not settings.singleflight_enabled:
+            return await fn()
+        return await get_singleflight().do(key, fn)
+    except ProviderThrottledError as exc:
+        raise Overloaded(503, str(exc), exc.retry_after) from exc
+
+
+def _coalesce_stream(
+    key: str, factory: Callable[[], AsyncGenerator[dict[str, Any]]]
+) -> AsyncGenerator[dict[str, Any]]:
+    """Share one upstream event stream among concurrent requests with the same ``key``."""
+    if not settings.singleflight_enabled:
+        return factory()
+    return get_singleflight().stream(key, factory)
+
+
+async def _admit_stream(http_request: Request, key: str, lane: Lane) -> Callable[[], None]:
+    """Admit a streaming request before its response starts, so rejections keep their status.
+
+    Requests joining an in-flight identical stream add no upstream work and
+    are not counted (best effort: the stream may finish before they join).
+    Returns the idempotent slot release.
+    """
+    if settings.singleflight_enabled and get_singleflight().in_flight(key):
+        return lambda: None
+    slot = await admit(http_request, lane)
+    return slot.release if slot is not None else lambda: None
+
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest) -> ChatResponse:
+async def chat(request: ChatRequest, http_request: Request, response: Response) -> ChatResponse:
     """Chat endpoint — runs LangGraph agent with tool calling.
 
     Accepts conversation history and returns an AI-generated response
     using the configured LLM with access to tools (knowledge base, etc.).
+    With ``answer_cache_chat_enabled``, a conversation whose earlier turns
+    match exactly and whose last user message is semantically equivalent is
+    served from the answer cache. Answers that called tools are not cached:
+    they depend on live data (the time, the knowledge base).
+
+    With a ``session_id`` the server keeps the history, and ``messages``
+    holds only the new turn. Session turns bypass the answer cache, since
+    the new message alone does not identify the conversation.
     """
     if not settings.openai_api_key:
         raise HTTPException(
@@ -32,8 +116,52 @@ async def chat(request: ChatRequest) -> ChatResponse:
 
     messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
 
+    cache = get_answer_cache()
+    # Earlier turns must match exactly. Embedded with the history, a short last
+    # message ("yes, delete it" / "no, keep it") barely moves the vector.
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages[:-1])
+    scope = make_scope(
+        "chat",
+        model=request.model,
+        system_prompt=DEFAULT_SYSTEM_PROMPT,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        history_max_tokens=request.history_max_tokens,
+        history=hashlib.sha256(transcript.encode()).hexdigest(),
+    )
+    vector = None
+    if (
+        settings.answer_cache_chat_enabled
+        and request.session_id is None
+        and messages
+        and messages[-1]["role"] == "user"
+    ):
+        vector = await _cache_vector(http_request, messages[-1]["content"])
+    if vector is not None and (cached := cache.lookup(scope, vector)) is not None:
+        response.headers[CACHE_HEADER] = "HIT"
+        return ChatResponse(content=cached, model=request.model, usage=None)
+    response.headers[CACHE_HEADER] = "MISS" if vector is not None else "BYPASS"
+
+    async def answer() -> str:
+        async with admitted(http_request):
+            result = await run_chat_agent(
+                messages=messages,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                history_max_tokens=request.history_max_tokens,
+                session_id=request.session_id,
+            )
+        content: str = result["content"]
+        if vector is not None and not result["tools"]:
+            cache.store(scope, vector, content)
+        return content
+
+    key = request_key("chat", system_prompt=DEFAULT_SYSTEM_PROMPT, **request.model_dump())
     try:
-        content = await run_chat_agent(messages=messages)
+        content = await _coalesce(key, answer)
+    except HTTPException:
+        raise
     except Exception as exc:
         logger.exception("Chat agent error")
         raise HTTPException(status_code=502, detail=str(exc)) from exc
@@ -42,46 +170,191 @@ async def chat(request: ChatRequest) -> ChatResponse:
         content=content,
         model=request.model,
         usage=None,
+        session_id=request.session_id,
     )
 
 
 @router.post("/chat/stream")
-async def chat_stream(request: ChatRequest) -> StreamingResponse:
-    """Streaming chat endpoint — SSE response for real-time token streaming."""
+async def chat_stream(request: ChatRequest, http_request: Request) -> StreamingResponse:
+    """Streaming chat endpoint — SSE response for real-time token streaming.
+
+    LLM token deltas are forwarded as they are generated (coalesced into
+    frames every ~30 ms) as plain ``data:`` frames; tool calls are reported as
+    ``event: tool_start`` / ``event: tool_end`` frames. The agent run is
+    cancelled when the client disconnects.
+    """
     if not settings.openai_api_key:
         raise HTTPException(
             status_code=503,
             detail="OpenAI API key not configured. Set OPENAI_API_KEY in your .env file.",
         )
 
-    async def generate():
+    def upstream() -> AsyncGenerator[dict[str, Any]]:
         messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+        return coalesce_tokens(
+            stream_chat_agent(
+                messages=messages,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                history_max_tokens=request.history_max_tokens,
+                session_id=request.session_id,
+            )
+        )
+
+    key = request_key("chat_stream", system_prompt=DEFAULT_SYSTEM_PROMPT, **request.model_dump())
+    release = await _admit_stream(http_request, key, "interactive")
+
+    async def generate() -> AsyncGenerator[str]:
+        events = _coalesce_stream(key, upstream)
         try:
-            content = await run_chat_agent(messages=messages)
-            for token in content:
-                yield f"data: {token}\n\n"
-            yield "data: [DONE]\n\n"
+            async for event in events:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected; cancelling chat stream")
+                    return
+                if event["type"] == "token":
+                    yield sse(event["content"])
+                else:
+                    yield sse({"name": event["name"]}, event=event["type"])
+            yield sse("[DONE]")
         except Exception as exc:
             logger.exception("Chat stream error")
-            yield f"data: [ERROR] {exc}\n\n"
+            yield sse(f"[ERROR] {exc}")
+        finally:
+            await events.aclose()
+            release()
+
+    # The background task also releases if the body is never iterated.
+    return StreamingResponse(
+        generate(), media_type="text/event-stream", background=BackgroundTask(release)
+    )
+
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+@router.delete("/chat/sessions/{session_id}", status_code=204)
+async def delete_chat_session(session_id: str) -> Response:
+    """Forget a server-side chat session and its history."""
+    await get_session_store().delete(session_id)
+    return Response(status_code=204)
 
 
 @router.post("/rag", response_model=RAGResponse)
-async def rag_query(request: RAGRequest) -> RAGResponse:
+async def rag_query(request: RAGRequest, http_request: Request, response: Response) -> RAGResponse:
     """RAG endpoint — retrieval-augmented generation using Supabase pgvector.
 
     Retrieves relevant documents from the vector store, then generates
-    an answer grounded in the retrieved context.
+    an answer grounded in the retrieved context. Semantically equivalent
+    queries against the same collection are served from the answer cache.
     """
-    result = await run_rag_query(
-        query=request.query,
+    cache = get_answer_cache()
+    scope = make_scope(
+        "rag",
         collection=request.collection,
+        model=request.model,
+        system_prompt=RAG_SYSTEM_PROMPT,
         top_k=request.top_k,
+        search_mode=request.search_mode,
+        rerank=request.rerank,
+        ef_search=request.ef_search,
+        probes=request.probes,
     )
+    # The retrieve node reuses this embedding through the embedding cache.
+    vector = await _cache_vector(http_request, request.query)
+    if vector is not None and (cached := cache.lookup(scope, vector)) is not None:
+        response.headers[CACHE_HEADER] = "HIT"
+        return RAGResponse(content=cached["content"], sources=cached["sources"])
+    response.headers[CACHE_HEADER] = "MISS" if vector is not None else "BYPASS"
+
+    async def answer() -> dict[str, Any]:
+        async with admitted(http_request):
+            result = await run_rag_query(
+                query=request.query,
+                collection=request.collection,
+                top_k=request.top_k,
+                model=request.model,
+                search_mode=request.search_mode,
+                rerank=request.rerank,
+                tuning=SearchTuning(request.ef_search, request.probes),
+            )
+        if vector is not None:
+            cache.store(scope, vector, result)
+        return result
+
+    key = request_key("rag", system_prompt=RAG_SYSTEM_PROMPT, **request.model_dump())
+    result = await _coalesce(key, answer)
 
     return RAGResponse(
         content=result["content"],
         sources=result["sources"],
     )
+
+
+@router.post("/rag/stream")
+async def rag_stream(request: RAGRequest, http_request: Request) -> StreamingResponse:
+    """Streaming RAG endpoint — SSE with sources first, then the answer.
+
+    Frames, in order:
+    - ``event: sources`` as soon as retrieval finishes, so citations can render
+      while the answer is still generating; a second ``sources`` frame, still
+      before the answer, replaces it if the context budget dropped chunks
+    - plain ``data:`` frames with answer tokens
+    - ``event: done`` with token usage and timings, then ``data: [DONE]``
+
+    The run is cancelled when the client disconnects.
+    """
+
+    def upstream() -> AsyncGenerator[dict[str, Any]]:
+        return coalesce_tokens(
+            stream_rag_query(
+                query=request.query,
+                collection=request.collection,
+                top_k=request.top_k,
+                model=request.model,
+                search_mode=request.search_mode,
+                rerank=request.rerank,
+                tuning=SearchTuning(request.ef_search, request.probes),
+            )
+        )
+
+    key = request_key("rag_stream", system_prompt=RAG_SYSTEM_PROMPT, **request.model_dump())
+    release = await _admit_stream(http_request, key, "interactive")
+
+    async def generate() -> AsyncGenerator[str]:
+        events = _coalesce_stream(key, upstream)
+        try:
+            async for event in events:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected; cancelling RAG stream")
+                    return
+                if event["type"] == "token":
+                    yield sse(event["content"])
+                elif event["type"] == "sources":
+                    yield sse({"sources": event["sources"]}, event="sources")
+                elif event["type"] == "done":
+                    yield sse({"usage": event["usage"], "timings": event["timings"]}, event="done")
+            yield sse("[DONE]")
+        except Exception as exc:
+            logger.exception("RAG stream error")
+            yield sse(f"[ERROR] {exc}")
+        finally:
+            await events.aclose()
+            release()
+
+    return StreamingResponse(
+        generate(), media_type="text/event-stream", background=BackgroundTask(release)
+    )
+
+
+@router.post("/rag/batch", response_model=RAGBatchResponse)
+async def rag_batch(request: RAGBatchRequest, http_request: Request) -> RAGBatchResponse:
+    """Batch RAG endpoint — answer many queries in one call.
+
+    Embeds all queries in a single API call, retrieves top-k for all of them
+    in one SQL round-trip per collection, then generates answers with bounded
+    concurrency. Results are returned in request order; a failed generation
+    sets ``error`` on its result instead of failing the batch.
+
+    Batches take one slot in the lowest-priority admission lane.
+    """
+    async with admitted(http_request, "batch"):
+        results = await run_rag_batch([r.model_dump() for r in request.requests])
+    return RAGBatchResponse(results=[RAGBatchResult(**r) for r in results])
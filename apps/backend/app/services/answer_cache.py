@@ -0,0 +1,162 @@
+"""Semantic answer cache for the /chat and /rag endpoints.
+
+A stored answer is returned when a new query's embedding is within a cosine
+similarity threshold of a cached query in the same scope. Scopes separate
+entries by endpoint, collection, model and system prompt, so answers never
+leak across configurations. Entries expire after a TTL and the whole cache is
+LRU-bounded; writing to a collection drops its RAG entries.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+
+from app.core.config import settings
+
+ScopeKey = tuple[str, ...]
+
+
+def make_scope(
+    kind: str,
+    *,
+    collection: str = "",
+    model: str = "",
+    system_prompt: str = "",
+    **extra: object,
+) -> ScopeKey:
+    """Build a cache scope; the system prompt is hashed to keep keys small."""
+    prompt_hash = hashlib.sha1(system_prompt.encode(), usedforsecurity=False).hexdigest()[:16]
+    return (kind, collection, model, prompt_hash, *(f"{k}={v}" for k, v in sorted(extra.items())))
+
+
+@dataclass
+class _Entry:
+    id: int
+    scope: ScopeKey
+    vector: np.ndarray
+    value: Any
+    expires_at: float
+
+
+@dataclass
+class _Scope:
+    entries: dict[int, _Entry] = field(default_factory=dict)
+    # Stacked unit vectors for one matmul per lookup; rebuilt lazily after writes.
+    _ids: list[int] = field(default_factory=list)
+    _matrix: np.ndarray | None = None
+
+    def matrix(self) -> tuple[list[int], np.ndarray]:
+        if self._matrix is None:
+            self._ids = list(self.entries)
+            self._matrix = np.stack([self.entries[i].vector for i in self._ids])
+        return self._ids, self._matrix
+
+    def invalidate(self) -> None:
+        self._matrix = None
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """In-process semantic cache with TTL, LRU eviction and a global size cap."""
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600.0, maxsize: int = 5000) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scopes: dict[ScopeKey, _Scope] = {}
+        self._lru: OrderedDict[int, _Entry] = OrderedDict()
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def lookup(self, scope: ScopeKey, vector: np.ndarray) -> Any | None:
+        """Return the cached value closest to ``vector`` if above the threshold."""
+        bucket = self._scopes.get(scope)
+        if bucket is None or not bucket.entries:
+            self.misses += 1
+            return None
+
+        ids, matrix = bucket.matrix()
+        scores = matrix @ _unit(vector)
+        best = int(np.argmax(scores))
+        entry = bucket.entries[ids[best]]
+
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        if entry.expires_at < time.monotonic():
+            self._remove(entry)
+            self.misses += 1
+            return None
+
+        self._lru.move_to_end(entry.id)
+        self.hits += 1
+        return entry.value
+
+    def store(self, scope: ScopeKey, vector: np.ndarray, value: Any) -> None:
+        """Cache ``value`` for ``vector`` in ``scope``, evicting LRU entries past the cap."""
+        entry = _Entry(
+            id=self._next_id,
+            scope=scope,
+            vector=_unit(vector),
+            value=value,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._next_id += 1
+
+        bucket = self._scopes.setdefault(scope, _Scope())
+        bucket.entries[entry.id] = entry
+        bucket.invalidate()
+        self._lru[entry.id] = entry
+
+        while len(self._lru) > self.maxsize:
+            _, oldest = self._lru.popitem(last=False)
+            self._remove(oldest)
+
+    def invalidate_collection(self, collection: str) -> int:
+        """Drop every RAG entry answered from ``collection``; returns entries removed."""
+        removed = 0
+        for scope in [s for s in self._scopes if s[0] == "rag" and s[1] == collection]:
+            for entry in list(self._scopes[scope].entries.values()):
+                self._remove(entry)
+                removed += 1
+        return removed
+
+    def clear(self) -> None:
+        self._scopes.clear()
+        self._lru.clear()
+
+    def _remove(self, entry: _Entry) -> None:
+        self._lru.pop(entry.id, None)
+        bucket = self._scopes.get(entry.scope)
+        if bucket is None:
+            return
+        bucket.entries.pop(entry.id, None)
+        bucket.invalidate()
+        if not bucket.entries:
+            del self._scopes[entry.scope]
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> SemanticAnswerCache:
+    """Create and cache the process-wide answer cache from settings."""
+    return SemanticAnswerCache(
+        threshold=settings.answer_cache_threshold,
+        ttl=settings.answer_cache_ttl,
+        maxsize=settings.answer_cache_size,
+    )
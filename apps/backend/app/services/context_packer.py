@@ -0,0 +1,135 @@
+"""Token-budgeted packing of retrieved chunks into a RAG prompt context.
+
+Documents are taken in the order given (retrieval and re-ranking return
+them most relevant first) until the budget is spent:
+
+- exact repeats and chunks contained in an already packed chunk are skipped,
+  and text a chunk shares with a packed neighbour (chunker overlap windows)
+  is trimmed;
+- a chunk that does not fit is cut at the last sentence boundary that does,
+  or skipped if not even one sentence fits, so a later, shorter chunk can
+  still use the remaining budget.
+
+Token counts come from ``app.services.tokens`` and are cached per chunk.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+
+from langchain_core.documents import Document
+
+from app.services.tokens import TokenCounter
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# Shared text shorter than this is treated as coincidence, not chunk overlap.
+MIN_OVERLAP_CHARS = 40
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def format_chunk(doc: Document) -> str:
+    """One document as it appears in the prompt."""
+    return f"Source: {doc.metadata.get('source', 'unknown')}\n{doc.page_content}"
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    probe = right[:MIN_OVERLAP_CHARS]
+    pos = left.find(probe, max(0, len(left) - len(right)))
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.find(probe, pos + 1)
+    return 0
+
+
+def _dedupe(content: str, packed: list[str]) -> str | None:
+    """Strip text ``content`` shares with packed chunks; None if nothing new is left."""
+    for other in packed:
+        if content in other:
+            return None
+        head = _overlap(other, content)
+        if head >= MIN_OVERLAP_CHARS:
+            content = content[head:]
+        tail = _overlap(content, other)
+        if tail >= MIN_OVERLAP_CHARS:
+            content = content[:-tail]
+    content = content.strip()
+    return content or None
+
+
+@dataclass
+class PackedContext:
+    """The packed prompt context and the documents it was built from."""
+
+    text: str = ""
+    documents: list[Document] = field(default_factory=list)
+    tokens: int = 0
+    truncated: int = 0
+    skipped: int = 0
+
+
+class ContextPacker:
+    """Fills a token budget with retrieved chunks."""
+
+    def __init__(self, counter: TokenCounter, budget: int) -> None:
+        self.counter = counter
+        self.budget = budget
+
+    def pack(self, documents: list[Document]) -> PackedContext:
+        result = PackedContext()
+        packed_contents: list[str] = []
+        separator_tokens = self.counter.count(CONTEXT_SEPARATOR)
+        parts: list[str] = []
+
+        for doc in documents:
+            content = _dedupe(doc.page_content, packed_contents)
+            if content is None:
+                result.skipped += 1
+                continue
+
+            remaining = self.budget - result.tokens - (separator_tokens if parts else 0)
+            chunk_doc = Document(page_content=content, metadata=dict(doc.metadata), id=doc.id)
+            chunk = format_chunk(chunk_doc)
+            tokens = self.counter.count(chunk)
+
+            if tokens > remaining:
+                cut = self._truncate(chunk_doc, remaining)
+                if cut is None:
+                    result.skipped += 1
+                    continue
+                chunk_doc, chunk, tokens = cut
+                chunk_doc.metadata["truncated"] = True
+                result.truncated += 1
+
+            if parts:
+                result.tokens += separator_tokens
+            parts.append(chunk)
+            packed_contents.append(chunk_doc.page_content)
+            result.documents.append(chunk_doc)
+            result.tokens += tokens
+
+        result.text = CONTEXT_SEPARATOR.join(parts)
+        return result
+
+    def _truncate(self, doc: Document, remaining: int) -> tuple[Document, str, int] | None:
+        """Cut ``doc`` at the last sentence boundary that fits in ``remaining`` tokens."""
+        content = doc.page_content
+        ends = [m.start() for m in _SENTENCE_END.finditer(content)]
+        best = None
+        lo, hi = 0, len(ends) - 1
+        # Token count grows with the prefix, so binary-search the boundaries.
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            cut = Document(page_content=content[: ends[mid]], metadata=doc.metadata, id=doc.id)
+            chunk = format_chunk(cut)
+            tokens = self.counter.count(chunk)
+            if tokens <= remaining:
+                best = (cut, chunk, tokens)
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return best
@@ -0,0 +1,324 @@
+"""Query-embedding cache — in-process LRU with TTL plus an optional Postgres tier.
+
+Keys are ``(model, normalized text)`` so repeated and trivially different
+queries ("What is RAG?" vs "  what is rag? ") skip the embedding round-trip.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Protocol
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.database import get_pool
+
+logger = logging.getLogger(__name__)
+
+CacheKey = tuple[str, str]
+
+
+def normalize_query(text: str) -> str:
+    """Canonicalize a query for cache lookups: NFKC, casefold, collapse whitespace."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def make_key(model: str, text: str) -> CacheKey:
+    """Build the cache key for an embedding request."""
+    return (model, normalize_query(text))
+
+
+class EmbeddingCache(Protocol):
+    """Interface every cache tier implements.
+
+    ``get_many``/``set_many`` let a shared tier answer a whole batch in one
+    round-trip.
+    """
+
+    async def get(self, key: CacheKey) -> np.ndarray | None: ...
+
+    async def set(self, key: CacheKey, vector: np.ndarray) -> None: ...
+
+    async def get_many(self, keys: list[CacheKey]) -> list[np.ndarray | None]: ...
+
+    async def set_many(self, items: list[tuple[CacheKey, np.ndarray]]) -> None: ...
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters for the embedding cache."""
+
+    hits: int = 0
+    l2_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.l2_hits + self.misses
+        return (self.hits + self.l2_hits) / total if total else 0.0
+
+
+class LRUEmbeddingCache:
+    """Bounded in-process LRU cache with per-entry TTL."""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 3600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[CacheKey, tuple[float, np.ndarray]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: CacheKey) -> np.ndarray | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, vector = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return vector
+
+    async def set(self, key: CacheKey, vector: np.ndarray) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, keys: list[CacheKey]) -> list[np.ndarray | None]:
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, items: list[tuple[CacheKey, np.ndarray]]) -> None:
+        for key, vector in items:
+            await self.set(key, vector)
+
+
+class PostgresEmbeddingCache:
+    """Shared second tier stored in Postgres, so workers and restarts reuse embeddings.
+
+    Uses the app connection pool; the table is created on first use. Reads
+    ignore rows older than ``ttl`` and ``cleanup`` deletes them, so the table
+    stays bounded by the working set.
+    """
+
+    def __init__(self, table: str = "embedding_cache", ttl: float = 7 * 24 * 3600.0) -> None:
+        self.table = table
+        self.ttl = ttl
+        self._ready = False
+
+    @staticmethod
+    def _digest(key: CacheKey) -> str:
+        model, text = key
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    async def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        async with get_pool().connection() as conn:
+            await conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    embedding vector NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+                """
+            )
+            await conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_created_at_idx "
+                f"ON {self.table} (created_at)"
+            )
+        self._ready = True
+
+    async def get(self, key: CacheKey) -> np.ndarray | None:
+        await self._ensure_table()
+        async with get_pool().connection() as conn:
+            cur = await conn.execute(
+                f"SELECT embedding FROM {self.table} "
+                "WHERE key = %s AND created_at > NOW() - make_interval(secs => %s)",
+                (self._digest(key), self.ttl),
+                binary=True,
+            )
+            row = await cur.fetchone()
+        return row[0] if row else None
+
+    async def set(self, key: CacheKey, vector: np.ndarray) -> None:
+        await self._ensure_table()
+        async with get_pool().connection() as conn:
+            await conn.execute(
+                f"INSERT INTO {self.table} (key, model, embedding) VALUES (%s, %s, %b) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "embedding = EXCLUDED.embedding, created_at = NOW()",
+                (self._digest(key), key[0], vector),
+            )
+
+    async def get_many(self, keys: list[CacheKey]) -> list[np.ndarray | None]:
+        await self._ensure_table()
+        digests = [self._digest(key) for key in keys]
+        async with get_pool().connection() as conn:
+            cur = await conn.execute(
+                f"SELECT key, embedding FROM {self.table} "
+                "WHERE key = ANY(%s) AND created_at > NOW() - make_interval(secs => %s)",
+                (digests, self.ttl),
+                binary=True,
+            )
+            found: dict[str, np.ndarray] = dict(await cur.fetchall())
+        return [found.get(digest) for digest in digests]
+
+    async def set_many(self, items: list[tuple[CacheKey, np.ndarray]]) -> None:
+        # One statement may not update a row twice, so the last vector per key wins.
+        rows = {self._digest(key): (key[0], vector) for key, vector in items}
+        if not rows:
+            return
+        await self._ensure_table()
+        async with get_pool().connection() as conn:
+            await conn.execute(
+                f"INSERT INTO {self.table} (key, model, embedding) VALUES "
+                + ", ".join(["(%s, %s, %b)"] * len(rows))
+                + " ON CONFLICT (key) DO UPDATE SET "
+                "embedding = EXCLUDED.embedding, created_at = NOW()",
+                [value for digest, row in rows.items() for value in (digest, *row)],
+            )
+
+    async def cleanup(self, batch_size: int = 1000) -> int:
+        """Delete expired rows in batches; returns how many were removed."""
+        await self._ensure_table()
+        removed = 0
+        while True:
+            # Short batches keep locks brief; SKIP LOCKED lets every worker sweep at once.
+            async with get_pool().connection() as conn:
+                cur = await conn.execute(
+                    f"""
+                    DELETE FROM {self.table} WHERE key IN (
+                        SELECT key FROM {self.table}
+                        WHERE created_at < NOW() - make_interval(secs => %s)
+                        LIMIT %s FOR UPDATE SKIP LOCKED
+                    )
+                    """,
+                    (self.ttl, batch_size),
+                )
+            removed += cur.rowcount
+            if cur.rowcount < batch_size:
+                return removed
+
+
+class TieredEmbeddingCache:
+    """L1 in-process cache in front of an optional shared L2, with hit/miss counters.
+
+    L2 failures are logged and treated as misses so a cache outage never
+    fails a request.
+    """
+
+    def __init__(self, l1: EmbeddingCache, l2: EmbeddingCache | None = None) -> None:
+        self.l1 = l1
+        self.l2 = l2
+        self.stats = CacheStats()
+
+    async def get(self, key: CacheKey) -> np.ndarray | None:
+        vector = await self.l1.get(key)
+        if vector is not None:
+            self.stats.hits += 1
+            return vector
+        if self.l2 is not None:
+            try:
+                vector = await self.l2.get(key)
+            except Exception:
+                logger.warning("Embedding cache L2 lookup failed", exc_info=True)
+                vector = None
+            if vector is not None:
+                self.stats.l2_hits += 1
+                await self.l1.set(key, vector)
+                return vector
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: CacheKey, vector: np.ndarray) -> None:
+        await self.l1.set(key, vector)
+        if self.l2 is not None:
+            try:
+                await self.l2.set(key, vector)
+            except Exception:
+                logger.warning("Embedding cache L2 write failed", exc_info=True)
+
+    async def get_many(self, keys: list[CacheKey]) -> list[np.ndarray | None]:
+        """Batch ``get``: one L1 pass, then a single L2 lookup for the L1 misses."""
+        vectors = await self.l1.get_many(keys)
+        self.stats.hits += sum(vector is not None for vector in vectors)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.l2 is not None:
+            try:
+                found = await self.l2.get_many([keys[i] for i in missing])
+            except Exception:
+                logger.warning("Embedding cache L2 lookup failed", exc_info=True)
+                found = [None] * len(missing)
+            promoted = []
+            for i, vector in zip(missing, found, strict=True):
+                if vector is not None:
+                    vectors[i] = vector
+                    promoted.append((keys[i], vector))
+            self.stats.l2_hits += len(promoted)
+            await self.l1.set_many(promoted)
+        self.stats.misses += sum(vector is None for vector in vectors)
+        return vectors
+
+    async def set_many(self, items: list[tuple[CacheKey, np.ndarray]]) -> None:
+        await self.l1.set_many(items)
+        if self.l2 is not None and items:
+            try:
+                await self.l2.set_many(items)
+            except Exception:
+                logger.warning("Embedding cache L2 write failed", exc_info=True)
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> TieredEmbeddingCache:
+    """Create and cache the process-wide embedding cache from settings."""
+    l1 = LRUEmbeddingCache(
+        maxsize=settings.embedding_cache_size,
+        ttl=settings.embedding_cache_ttl,
+    )
+    l2 = PostgresEmbeddingCache() if settings.embedding_cache_backend == "postgres" else None
+    return TieredEmbeddingCache(l1, l2)
+
+
+_cleanup_task: asyncio.Task[None] | None = None
+
+
+async def _cleanup_loop(cache: PostgresEmbeddingCache, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await cache.cleanup()
+        except Exception:
+            logger.warning("Embedding cache cleanup failed", exc_info=True)
+            continue
+        if removed:
+            logger.info("Removed %d expired cached embeddings", removed)
+
+
+def start_embedding_cache_cleanup() -> None:
+    """Start the periodic sweep of expired Postgres rows (no-op for the memory backend)."""
+    global _cleanup_task
+    l2 = get_embedding_cache().l2
+    if _cleanup_task is None and isinstance(l2, PostgresEmbeddingCache):
+        _cleanup_task = asyncio.create_task(
+            _cleanup_loop(l2, settings.embedding_cache_cleanup_interval)
+        )
+
+
+def stop_embedding_cache_cleanup() -> None:
+    """Cancel the cleanup task, if running."""
+    global _cleanup_task
+    if _cleanup_task is not None:
+        _cleanup_task.cancel()
+        _cleanup_task = None
@@ -0,0 +1,86 @@
+"""OpenAI embeddings returned as float32 NumPy arrays.
+
+Embeddings are requested base64-encoded and decoded straight into float32
+buffers, so a query vector goes from the OpenAI response to the pgvector
+binary wire format without ever becoming a list of Python floats. Results are
+cached by (model, normalized text) in ``app.services.embedding_cache``.
+"""
+
+from __future__ import annotations
+
+import base64
+from functools import lru_cache
+from time import perf_counter
+from typing import TYPE_CHECKING, cast
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import EMBEDDING_REQUEST_SECONDS
+from app.services.embedding_cache import get_embedding_cache, make_key
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> AsyncOpenAI:
+    """Create and cache the async OpenAI client (one HTTP connection pool)."""
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=settings.openai_api_key)
+
+
+async def _embed_uncached(texts: list[str], model: str) -> list[np.ndarray]:
+    start = perf_counter()
+    response = await get_openai_client().embeddings.create(
+        model=model,
+        input=texts,
+        encoding_format="base64",
+    )
+    EMBEDDING_REQUEST_SECONDS.observe(perf_counter() - start)
+    data = sorted(response.data, key=lambda item: item.index)
+    # The SDK types ``embedding`` as floats; with base64 encoding it is a string.
+    return [
+        np.frombuffer(base64.b64decode(cast(str, item.embedding)), dtype=np.float32)
+        for item in data
+    ]
+
+
+async def embed_texts(texts: list[str], model: str = EMBEDDING_MODEL) -> list[np.ndarray]:
+    """Embed a batch of texts, calling the API once for all cache misses.
+
+    Args:
+        texts: Texts to embed.
+        model: OpenAI embedding model.
+
+    Returns:
+        One float32 array per input text, in input order.
+    """
+    cache = get_embedding_cache()
+    keys = [make_key(model, text) for text in texts]
+    # One cache round-trip for the batch, however many texts it has.
+    vectors = await cache.get_many(keys)
+
+    # Duplicate texts in one batch are embedded once.
+    missing: dict[tuple[str, str], list[int]] = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], []).append(i)
+    if missing:
+        positions = list(missing.values())
+        fresh = await _embed_uncached([texts[idx[0]] for idx in positions], model)
+        for idx, vector in zip(positions, fresh, strict=True):
+            for i in idx:
+                vectors[i] = vector
+        await cache.set_many(list(zip(missing, fresh, strict=True)))
+
+    return vectors  # type: ignore[return-value]
+
+
+async def embed_query(text: str, model: str = EMBEDDING_MODEL) -> np.ndarray:
+    """Embed a single query string."""
+    [vector] = await embed_texts([text], model=model)
+    return vector
@@ -0,0 +1,205 @@
+"""Token-budgeted chat history with a cached rolling summary of older turns.
+
+Conversations grow with every turn, whether clients resend them or they
+live in a server-side session. Instead of forwarding all of it,
+``HistoryCompactor`` keeps the system prompt and the most recent turns
+within a token budget and replaces everything before them with a summary.
+
+Summaries are cached by a chained digest of the messages they cover, so a
+later turn of the same conversation finds the summary of its prefix without
+storing it with the conversation. Folding also overshoots to half the
+budget, so the next several turns fit without summarizing again. When they
+no longer fit, only the newly folded turns are merged into the cached
+summary.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.core.config import settings
+from app.services.llm import get_scheduled_model
+from app.services.tokens import MESSAGE_OVERHEAD_TOKENS, TokenCounter, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "\n\nSummary of the earlier conversation:\n"
+
+# Tags summary LLM runs, so streaming callers can tell them from the answer.
+SUMMARY_RUN_TAG = "history_summary"
+
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI "
+    "assistant. Merge the new messages into the existing summary. Keep facts, "
+    "decisions, names, numbers and open questions; drop pleasantries. Reply with "
+    "the updated summary only, in at most {max_tokens} tokens."
+)
+
+# (previous summary, turns to fold) -> updated summary
+Summarizer = Callable[[str, list[dict[str, str]]], Awaitable[str]]
+
+
+def _to_message(msg: dict[str, str]) -> BaseMessage | None:
+    if msg["role"] == "user":
+        return HumanMessage(content=msg["content"])
+    if msg["role"] == "assistant":
+        return AIMessage(content=msg["content"])
+    return None
+
+
+class SummaryCache:
+    """LRU of conversation-prefix digest -> summary of that prefix."""
+
+    def __init__(self, maxsize: int = 2048) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, str] = OrderedDict()
+
+    def get(self, key: bytes) -> str | None:
+        summary = self._entries.get(key)
+        if summary is not None:
+            self._entries.move_to_end(key)
+        return summary
+
+    def set(self, key: bytes, summary: str) -> None:
+        self._entries[key] = summary
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+async def summarize_turns(previous: str, turns: list[dict[str, str]]) -> str:
+    """Fold ``turns`` into ``previous`` with the configured summary model."""
+    llm = get_scheduled_model(
+        model=settings.chat_history_summary_model,
+        temperature=0.0,
+        max_tokens=settings.chat_history_summary_max_tokens,
+    )
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    prompt = _SUMMARY_PROMPT.format(max_tokens=settings.chat_history_summary_max_tokens)
+    response = await llm.ainvoke(
+        [
+            SystemMessage(content=prompt),
+            HumanMessage(
+                content=f"Existing summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"
+            ),
+        ],
+        config={"tags": [SUMMARY_RUN_TAG]},
+    )
+    return response.text.strip()
+
+
+class HistoryCompactor:
+    """Fits a conversation into a token budget, summarizing what falls out."""
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        summarizer: Summarizer = summarize_turns,
+        cache: SummaryCache | None = None,
+        summary_max_tokens: int = 512,
+    ) -> None:
+        self.counter = counter
+        self.summarizer = summarizer
+        self.cache = cache if cache is not None else SummaryCache()
+        self.summary_max_tokens = summary_max_tokens
+
+    def _tokens(self, msg: dict[str, str]) -> int:
+        return self.counter.count(msg["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    async def compact(
+        self,
+        messages: list[dict[str, str]],
+        system_prompt: str,
+        budget: int,
+    ) -> list[BaseMessage]:
+        """Return LangChain messages for ``messages`` within ``budget`` tokens.
+
+        The latest message is always kept, even if it alone exceeds the budget.
+        """
+        turns = [m for m in messages if m["role"] in ("user", "assistant")]
+        costs = [self._tokens(m) for m in turns]
+        system_tokens = self.counter.count(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        if system_tokens + sum(costs) <= budget or len(turns) < 2:
+            return self._build(system_prompt, "", turns)
+
+        available = max(budget - system_tokens - self.summary_max_tokens, 0)
+        # suffix[i] = tokens of turns[i:]
+        suffix = [0] * (len(turns) + 1)
+        for i in range(len(turns) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + costs[i]
+        digests = self._prefix_digests(turns)
+
+        # Reuse the longest cached prefix whose remaining turns still fit.
+        for cut in range(len(turns) - 1, 0, -1):
+            summary = self.cache.get(digests[cut - 1])
+            if summary is not None and suffix[cut] <= available:
+                return self._build(system_prompt, summary, turns[cut:])
+
+        # Fold down to half the budget, so the next turns reuse this summary.
+        cut = len(turns) - 1
+        for i in range(1, len(turns)):
+            if suffix[i] <= available // 2:
+                cut = i
+                break
+        # Prefer keeping whole exchanges: start the window on a user turn.
+        while cut < len(turns) - 1 and turns[cut]["role"] != "user":
+            cut += 1
+
+        base, previous = 0, ""
+        for i in range(cut - 1, 0, -1):
+            cached = self.cache.get(digests[i - 1])
+            if cached is not None:
+                base, previous = i, cached
+                break
+
+        try:
+            summary = await self.summarizer(previous, turns[base:cut])
+        except Exception:
+            logger.warning("History summarization failed; dropping older turns", exc_info=True)
+            return self._build(system_prompt, previous, turns[cut:])
+        self.cache.set(digests[cut - 1], summary)
+        return self._build(system_prompt, summary, turns[cut:])
+
+    @staticmethod
+    def _prefix_digests(turns: list[dict[str, str]]) -> list[bytes]:
+        """digests[i] identifies turns[: i + 1]; each chains the previous one."""
+        digests: list[bytes] = []
+        previous = b""
+        for turn in turns:
+            h = hashlib.blake2b(previous, digest_size=16)
+            h.update(turn["role"].encode())
+            h.update(b"\0")
+            h.update(turn["content"].encode())
+            previous = h.digest()
+            digests.append(previous)
+        return digests
+
+    @staticmethod
+    def _build(system_prompt: str, summary: str, turns: list[dict[str, str]]) -> list[BaseMessage]:
+        # One system message: some providers reject a second one mid-conversation.
+        content = f"{system_prompt}{SUMMARY_HEADER}{summary}" if summary else system_prompt
+        result: list[BaseMessage] = [SystemMessage(content=content)]
+        result.extend(m for m in map(_to_message, turns) if m is not None)
+        return result
+
+
+@lru_cache(maxsize=1)
+def get_summary_cache() -> SummaryCache:
+    """Process-wide summary cache, shared by every model's compactor."""
+    return SummaryCache(settings.chat_history_summary_cache_size)
+
+
+@lru_cache(maxsize=32)
+def get_history_compactor(model: str) -> HistoryCompactor:
+    """Compactor counting tokens with ``model``'s encoding."""
+    return HistoryCompactor(
+        get_token_counter(model),
+        cache=get_summary_cache(),
+        summary_max_tokens=settings.chat_history_summary_max_tokens,
+    )
@@ -0,0 +1,208 @@
+"""Chat model registry — configured LLM clients reused across requests.
+
+Building a ``ChatOpenAI`` per call creates a new HTTP client each time, so
+every agent step paid for fresh TLS handshakes. Models are cached here by
+(provider, model, params), and all OpenAI models share one keep-alive
+connection pool per sync/async flavour.
+
+Agents use ``get_scheduled_model``: the same models behind the provider
+scheduler, which paces calls against rate limits and fails over to an
+equivalent model on another provider (see ``app.services.llm_scheduler``).
+
+Provider integrations are imported on first use: each one pulls in its SDK,
+and a process serving only OpenAI models need not load Anthropic's.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from pydantic import SecretStr
+
+from app.core.config import settings
+from app.services.llm_scheduler import Candidate, ScheduledChatModel
+
+DEFAULT_CHAT_MODEL = "gpt-4o"
+
+# Largest completion each model family accepts, checked by name prefix in order.
+_MAX_OUTPUT_TOKENS: tuple[tuple[str, int], ...] = (
+    ("claude-3-5", 8192),
+    ("claude-3-7", 64_000),
+    ("claude-3", 4096),
+    ("claude-opus-4", 32_000),
+    ("claude-", 64_000),
+    ("gpt-4o", 16_384),
+)
+# Anthropic rejects temperatures above 1; OpenAI accepts up to 2.
+_MAX_TEMPERATURE = {"anthropic": 1.0, "openai": 2.0}
+
+
+def resolve_provider(model: str) -> str:
+    """Infer the provider from a model name."""
+    return "anthropic" if model.startswith("claude") else "openai"
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.llm_http_max_connections,
+        max_keepalive_connections=settings.llm_http_max_keepalive,
+        keepalive_expiry=settings.llm_http_keepalive_expiry,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """Shared sync HTTP client for provider SDKs."""
+    return httpx.Client(limits=_limits(), timeout=settings.llm_http_timeout)
+
+
+@lru_cache(maxsize=1)
+def get_async_http_client() -> httpx.AsyncClient:
+    """Shared async HTTP client for provider SDKs."""
+    return httpx.AsyncClient(limits=_limits(), timeout=settings.llm_http_timeout)
+
+
+@lru_cache(maxsize=64)
+def _build_chat_model(
+    provider: str,
+    model: str,
+    temperature: float,
+    max_tokens: int | None,
+    scheduled: bool = False,
+) -> BaseChatModel:
+    # Passed as kwargs: both classes declare these fields under aliases the type checker
+    # would otherwise insist on (``model_name``, ``max_completion_tokens``).
+    kwargs: dict[str, Any] = {"model": model, "temperature": temperature}
+    # Scheduled models leave retries to the scheduler and report rate-limit headers to it.
+    if scheduled:
+        kwargs["max_retries"] = 0
+    if provider == "anthropic":
+        from langchain_anthropic import ChatAnthropic
+
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        return ChatAnthropic(api_key=SecretStr(settings.anthropic_api_key), **kwargs)
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+
+        kwargs["max_tokens"] = max_tokens
+        return ChatOpenAI(
+            api_key=SecretStr(settings.openai_api_key),
+            stream_usage=True,
+            include_response_headers=scheduled,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            **kwargs,
+        )
+    raise ValueError(f"Unknown LLM provider: {provider!r}")
+
+
+def get_chat_model(
+    model: str = DEFAULT_CHAT_MODEL,
+    temperature: float = 0.7,
+    max_tokens: int | None = None,
+    provider: str | None = None,
+) -> BaseChatModel:
+    """Return a cached chat model for these settings, creating it on first use.
+
+    Args:
+        model: Model identifier, e.g. ``gpt-4o-mini`` or ``claude-3-5-haiku-latest``.
+        temperature: Sampling temperature.
+        max_tokens: Optional completion token limit.
+        provider: ``openai`` or ``anthropic``; inferred from the model name if omitted.
+    """
+    return _build_chat_model(
+        provider or resolve_provider(model),
+        model,
+        float(temperature),
+        max_tokens,
+    )
+
+
+def _has_credentials(provider: str) -> bool:
+    if provider == "anthropic":
+        return bool(settings.anthropic_api_key)
+    return bool(settings.openai_api_key)
+
+
+def _fit_params(
+    provider: str, model: str, temperature: float, max_tokens: int | None
+) -> tuple[float, int | None]:
+    """Clamp a request's sampling parameters into what ``model`` accepts."""
+    temperature = min(temperature, _MAX_TEMPERATURE.get(provider, temperature))
+    if max_tokens is not None:
+        for prefix, limit in _MAX_OUTPUT_TOKENS:
+            if model.startswith(prefix):
+                max_tokens = min(max_tokens, limit)
+                break
+    return temperature, max_tokens
+
+
+@lru_cache(maxsize=64)
+def _build_scheduled_model(
+    provider: str,
+    model: str,
+    temperature: float,
+    max_tokens: int | None,
+) -> ScheduledChatModel:
+    candidates = [
+        Candidate(
+            provider,
+            model,
+            _build_chat_model(provider, model, temperature, max_tokens, True),
+            max_tokens,
+        )
+    ]
+    failover = settings.llm_failover_models.get(model)
+    if failover and _has_credentials(resolve_provider(failover)):
+        # The request was valid for the primary; the failover gets the nearest
+        # parameters it accepts instead of a 400 just when it is needed.
+        failover_provider = resolve_provider(failover)
+        params = _fit_params(failover_provider, failover, temperature, max_tokens)
+        candidates.append(
+            Candidate(
+                failover_provider,
+                failover,
+                _build_chat_model(failover_provider, failover, *params, True),
+                params[1],
+            )
+        )
+    return ScheduledChatModel(candidates=candidates)
+
+
+def get_scheduled_model(
+    model: str = DEFAULT_CHAT_MODEL,
+    temperature: float = 0.7,
+    max_tokens: int | None = None,
+    provider: str | None = None,
+) -> BaseChatModel:
+    """Like ``get_chat_model``, but rate-limit aware with cross-provider failover.
+
+    The failover model comes from ``settings.llm_failover_models`` and is
+    only used when its provider has an API key; ``temperature`` and
+    ``max_tokens`` are clamped to what it accepts. Returns the plain model when
+    ``settings.llm_scheduler_enabled`` is off.
+    """
+    if not settings.llm_scheduler_enabled:
+        return get_chat_model(model, temperature, max_tokens, provider)
+    return _build_scheduled_model(
+        provider or resolve_provider(model),
+        model,
+        float(temperature),
+        max_tokens,
+    )
+
+
+async def close_llm_clients() -> None:
+    """Close shared HTTP pools and drop cached models (app shutdown)."""
+    if get_async_http_client.cache_info().currsize:
+        await get_async_http_client().aclose()
+    if get_http_client.cache_info().currsize:
+        get_http_client().close()
+    _build_scheduled_model.cache_clear()
+    _build_chat_model.cache_clear()
+    get_async_http_client.cache_clear()
+    get_http_client.cache_clear()
@@ -0,0 +1,517 @@
+"""Rate-limit-aware scheduling and failover for chat model calls.
+
+Model calls used to go straight to their provider. Bursts ran into 429s,
+the SDK's own retries piled onto the same throttled model, and the error
+reached the client as a 502. ``ScheduledChatModel`` puts a
+``ProviderScheduler`` in front of one or more equivalent models on
+different providers:
+
+- Quotas: each (provider, model) has a request bucket and a token bucket,
+  refilled per minute. Limits come from ``settings.llm_rate_limits`` and
+  are corrected from the ``x-ratelimit-*`` response headers. A call
+  reserves its estimated prompt tokens plus ``max_tokens`` (what providers
+  count against TPM); unused tokens are returned once usage is known. Calls
+  cut short (errors, losing hedges, closed streams) return their
+  ``max_tokens`` allowance.
+- Failover: the next candidate is tried when the current one's quota would
+  not free up within ``llm_failover_wait``, or when it answers 429, 5xx or
+  not at all. Streams fail over only before their first chunk.
+- Backoff: after every candidate has failed, wait with full jitter and try
+  again, up to ``llm_max_retries`` times. A 429's ``Retry-After`` blocks
+  that model until it passes.
+- Hedging: with ``llm_hedge_after`` set, a non-streaming call that has not
+  answered by then is also sent to the failover model. The first answer wins.
+
+When every provider keeps refusing, ``ProviderThrottledError`` carries a retry
+hint, so the API answers 503 with ``Retry-After`` instead of 502.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping, Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, NoReturn
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel, LangSmithParams, LanguageModelInput
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from pydantic import ConfigDict
+
+from app.core.config import settings
+from app.services.tokens import MESSAGE_OVERHEAD_TOKENS, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+# Bound by ``bind_tools``: one kwargs dict per candidate, since tool formats differ.
+CANDIDATE_KWARGS = "candidate_kwargs"
+
+
+class ProviderThrottledError(Exception):
+    """Every candidate model stayed rate limited; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QuotaExhaustedError(Exception):
+    """A model's quota would not free up within the allowed wait."""
+
+
+@dataclass(frozen=True, slots=True)
+class ProviderErrors:
+    """Exception classes the scheduler handles, grouped by how it handles them."""
+
+    rate_limit: tuple[type[Exception], ...]
+    retryable: tuple[type[Exception], ...]  # rate limits, 5xx, connection errors, quota
+    throttle: tuple[type[Exception], ...]  # rate limits and quota
+
+
+@lru_cache(maxsize=1)
+def provider_errors() -> ProviderErrors:
+    """Resolved on first use: the provider SDKs are slow to import."""
+    import anthropic
+    import openai
+
+    rate_limit = (openai.RateLimitError, anthropic.RateLimitError)
+    transient = (
+        openai.APIConnectionError,  # includes timeouts
+        openai.InternalServerError,
+        anthropic.APIConnectionError,
+        anthropic.InternalServerError,
+    )
+    return ProviderErrors(
+        rate_limit=rate_limit,
+        retryable=(*rate_limit, *transient, QuotaExhaustedError),
+        throttle=(*rate_limit, QuotaExhaustedError),
+    )
+
+
+class TokenBucket:
+    """A per-minute allowance that refills continuously.
+
+    ``take`` may drive the level negative. Later callers wait out the debt,
+    so concurrent reservations queue behind each other instead of bursting.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available."""
+        self._refill()
+        if self.capacity <= 0:
+            return math.inf
+        # A call larger than the whole allowance waits for a full bucket, not forever.
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit * 60 / self.capacity)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, limit: float, remaining: float) -> None:
+        """Adopt the provider's limit, and at most its remaining allowance."""
+        self._refill()
+        self.capacity = limit
+        self.level = min(self.level, remaining)
+
+
+class Quota:
+    """Request and token buckets for one (provider, model), plus a 429 block.
+
+    A bucket whose limit is unknown is absent until headers report it.
+    """
+
+    def __init__(self, rpm: int, tpm: int, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self.requests = TokenBucket(rpm, clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock) if tpm else None
+        self.blocked_until = 0.0
+
+    def wait_time(self, tokens: int) -> float:
+        waits = [self.blocked_until - self._clock()]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(0.0, *waits)
+
+    def take(self, tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def give(self, tokens: int, request: bool = False) -> None:
+        if request and self.requests is not None:
+            self.requests.give(1)
+        if self.tokens is not None and tokens > 0:
+            self.tokens.give(tokens)
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Sync the buckets with ``x-ratelimit-{limit,remaining}-{requests,tokens}``."""
+        for kind in ("requests", "tokens"):
+            try:
+                limit = float(headers[f"x-ratelimit-limit-{kind}"])
+                remaining = float(headers[f"x-ratelimit-remaining-{kind}"])
+            except (KeyError, ValueError):
+                continue
+            bucket = getattr(self, kind)
+            if bucket is None:
+                bucket = TokenBucket(limit, self._clock)
+                setattr(self, kind, bucket)
+            bucket.sync(limit, remaining)
+
+
+class ProviderScheduler:
+    """Quota accounting and backoff shared by every scheduled model."""
+
+    def __init__(
+        self,
+        limits: Mapping[str, Sequence[int]] | None = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.limits = dict(limits or {})
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._quotas: dict[tuple[str, str], Quota] = {}
+
+    def quota(self, provider: str, model: str) -> Quota:
+        quota = self._quotas.get((provider, model))
+        if quota is None:
+            rpm, tpm = self.limits.get(f"{provider}:{model}", (0, 0))
+            quota = self._quotas[(provider, model)] = Quota(rpm, tpm, self._clock)
+        return quota
+
+    async def reserve(self, provider: str, model: str, tokens: int, max_wait: float) -> bool:
+        """Reserve quota for one call, waiting for it up to ``max_wait`` seconds.
+
+        Returns False, reserving nothing, if the wait would be longer.
+        """
+        quota = self.quota(provider, model)
+        wait = quota.wait_time(tokens)
+        if wait > max_wait:
+            return False
+        # Reserve before sleeping, so callers arriving meanwhile queue behind this one.
+        quota.take(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                quota.give(tokens, request=True)
+                raise
+        return True
+
+    def settle(
+        self,
+        provider: str,
+        model: str,
+        reserved: int,
+        used: int | None,
+        headers: Mapping[str, str] | None = None,
+    ) -> None:
+        """Return unused tokens and sync with the response's rate-limit headers."""
+        quota = self.quota(provider, model)
+        if used is not None:
+            quota.give(reserved - used)
+        if headers:
+            quota.observe(headers)
+
+    def throttle(self, provider: str, model: str, retry_after: float | None) -> None:
+        """Block a model that answered 429 until its ``Retry-After`` has passed."""
+        quota = self.quota(provider, model)
+        until = self._clock() + (retry_after if retry_after is not None else self.backoff_base)
+        quota.blocked_until = max(quota.blocked_until, until)
+
+    def retry_after(self, candidates: Sequence[Candidate]) -> int:
+        """Whole seconds until the first of ``candidates`` accepts a request again."""
+        wait = min(self.quota(c.provider, c.model).wait_time(0) for c in candidates)
+        return min(60, max(1, math.ceil(wait)))
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry ``attempt`` (0-based)."""
+        cap = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(0, cap)  # noqa: S311 - jitter, not security
+
+
+@lru_cache(maxsize=1)
+def get_provider_scheduler() -> ProviderScheduler:
+    """Process-wide scheduler configured from settings."""
+    return ProviderScheduler(
+        settings.llm_rate_limits,
+        backoff_base=settings.llm_backoff_base,
+        backoff_max=settings.llm_backoff_max,
+    )
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """One provider model a scheduled call may go to."""
+
+    provider: str
+    model: str
+    llm: BaseChatModel
+    max_tokens: int | None = None
+
+    def estimate_tokens(self, messages: list[BaseMessage]) -> int:
+        """Tokens the call counts against TPM: the prompt plus ``max_tokens``."""
+        counter = get_token_counter(self.model)
+        prompt = sum(counter.count(m.text) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+        return prompt + (self.max_tokens or 0)
+
+    def unfinished_tokens(self, reserved: int) -> int:
+        """What a call cut short keeps counted: its prompt, not its completion allowance."""
+        return reserved - (self.max_tokens or 0)
+
+
+def _retry_after(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(response.headers[header]) * scale
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def _pop_headers(generation: ChatGeneration) -> dict[str, str] | None:
+    # Headers are only for the scheduler; keep them out of the message metadata.
+    headers: dict[str, str] | None = (generation.generation_info or {}).pop("headers", None)
+    return headers or generation.message.response_metadata.pop("headers", None)
+
+
+def _used_tokens(message: BaseMessage) -> int | None:
+    usage = getattr(message, "usage_metadata", None)
+    return usage["total_tokens"] if usage else None
+
+
+class ScheduledChatModel(BaseChatModel):
+    """Chat model that schedules calls over ``candidates`` (primary first).
+
+    Sync calls go to the primary model unscheduled; the app only calls
+    models asynchronously.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    candidates: list[Candidate]
+
+    @property
+    def _llm_type(self) -> str:
+        return "scheduled-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"candidates": [f"{c.provider}:{c.model}" for c in self.candidates]}
+
+    def _get_ls_params(self, stop: list[str] | None = None, **kwargs: Any) -> LangSmithParams:
+        # Report the primary model, so traces and metrics are labelled by model name.
+        kwargs.pop(CANDIDATE_KWARGS, None)
+        return self.candidates[0].llm._get_ls_params(stop=stop, **kwargs)
+
+    def bind_tools(
+        self,
+        tools: Sequence[Any],
+        *,
+        tool_choice: Any = None,
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, AIMessage]:
+        # ls_structured_output_format is tracing metadata the outer call consumes.
+        trace = {k: kwargs.pop(k) for k in ("ls_structured_output_format",) if k in kwargs}
+        per_candidate = [
+            c.llm.bind_tools(tools, tool_choice=tool_choice, **kwargs).kwargs  # type: ignore[attr-defined]
+            for c in self.candidates
+        ]
+        return self.bind(**{CANDIDATE_KWARGS: per_candidate}, **trace)
+
+    def _max_wait(self, index: int) -> float:
+        """How long a candidate's quota may be waited for before trying the next one."""
+        if index == len(self.candidates) - 1:
+            return settings.llm_max_quota_wait
+        return settings.llm_failover_wait
+
+    def _failed(self, candidate: Candidate, exc: Exception) -> None:
+        if isinstance(exc, provider_errors().rate_limit):
+            get_provider_scheduler().throttle(
+                candidate.provider, candidate.model, _retry_after(exc)
+            )
+        logger.warning(
+            "%s:%s unavailable (%s)", candidate.provider, candidate.model, type(exc).__name__
+        )
+
+    def _give_up(self, exc: Exception) -> NoReturn:
+        if isinstance(exc, provider_errors().throttle):
+            retry_after = get_provider_scheduler().retry_after(self.candidates)
+            raise ProviderThrottledError(
+                "All model providers are rate limiting requests", retry_after
+            ) from exc
+        raise exc
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        per_candidate = kwargs.pop(CANDIDATE_KWARGS, None)
+        extra = per_candidate[0] if per_candidate else {}
+        return self.candidates[0].llm._generate(
+            messages, stop=stop, run_manager=run_manager, **kwargs, **extra
+        )
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        per_candidate = kwargs.pop(CANDIDATE_KWARGS, None)
+        scheduler = get_provider_scheduler()
+
+        async def call(index: int) -> ChatResult:
+            candidate = self.candidates[index]
+            extra = per_candidate[index] if per_candidate else {}
+            tokens = candidate.estimate_tokens(messages)
+            provider, model = candidate.provider, candidate.model
+            if not await scheduler.reserve(provider, model, tokens, self._max_wait(index)):
+                raise QuotaExhaustedError(f"{provider}:{model}")
+            try:
+                result = await candidate.llm._agenerate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs, **extra
+                )
+            except BaseException as exc:
+                # Failed, or cancelled as the losing hedge: usage is unknown.
+                scheduler.settle(provider, model, tokens, candidate.unfinished_tokens(tokens))
+                if isinstance(exc, provider_errors().retryable):
+                    self._failed(candidate, exc)
+                raise
+            generation = result.generations[0]
+            scheduler.settle(
+                provider, model, tokens, _used_tokens(generation.message), _pop_headers(generation)
+            )
+            return result
+
+        hedge = settings.llm_hedge_after > 0 and len(self.candidates) > 1
+        for attempt in range(settings.llm_max_retries + 1):
+            try:
+                return await (self._hedged(call) if hedge else self._in_order(call))
+            except provider_errors().retryable as exc:
+                if attempt == settings.llm_max_retries:
+                    self._give_up(exc)
+            await asyncio.sleep(scheduler.backoff(attempt))
+        raise AssertionError("unreachable")
+
+    async def _in_order[T](self, call: Callable[[int], Awaitable[T]]) -> T:
+        """Try each candidate in turn; raise the last retryable error if all fail."""
+        error: Exception | None = None
+        for index in range(len(self.candidates)):
+            try:
+                return await call(index)
+            except provider_errors().retryable as exc:
+                error = exc
+        assert error is not None
+        raise error
+
+    async def _hedged[T](self, call: Callable[[int], Awaitable[T]]) -> T:
+        """Start the primary; add the failover model if it fails or is slow. First answer wins."""
+        pending = {asyncio.ensure_future(call(0))}
+        hedged = False
+        error: Exception | None = None
+        try:
+            while pending:
+                timeout = None if hedged else settings.llm_hedge_after
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    exc = task.exception()
+                    if exc is None:
+                        return task.result()
+                    if not isinstance(exc, provider_errors().retryable):
+                        raise exc
+                    error = exc
+                if not hedged:
+                    hedged = True
+                    pending.add(asyncio.ensure_future(call(1)))
+        finally:
+            for task in pending:
+                task.cancel()
+        assert error is not None
+        raise error
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        per_candidate = kwargs.pop(CANDIDATE_KWARGS, None)
+        scheduler = get_provider_scheduler()
+        for attempt in range(settings.llm_max_retries + 1):
+            error: Exception | None = None
+            for index, candidate in enumerate(self.candidates):
+                extra = per_candidate[index] if per_candidate else {}
+                tokens = candidate.estimate_tokens(messages)
+                provider, model = candidate.provider, candidate.model
+                if not await scheduler.reserve(provider, model, tokens, self._max_wait(index)):
+                    error = QuotaExhaustedError(f"{provider}:{model}")
+                    continue
+                started = finished = False
+                headers: dict[str, str] | None = None
+                used: int | None = None
+                try:
+                    async for chunk in candidate.llm._astream(
+                        messages, stop=stop, run_manager=run_manager, **kwargs, **extra
+                    ):
+                        if not started:
+                            started = True
+                            headers = _pop_headers(chunk)
+                        if (chunk_used := _used_tokens(chunk.message)) is not None:
+                            used = (used or 0) + chunk_used
+                        yield chunk
+                    finished = True
+                except provider_errors().retryable as exc:
+                    if started:
+                        raise  # already streamed to the caller: cannot switch models
+                    self._failed(candidate, exc)
+                    error = exc
+                    continue
+                finally:
+                    # Cut short (failed, closed by the consumer, cancelled): usage is unknown.
+                    if not finished:
+                        used = candidate.unfinished_tokens(tokens)
+                    scheduler.settle(provider, model, tokens, used, headers)
+                return
+            assert error is not None
+            if attempt == settings.llm_max_retries:
+                self._give_up(error)
+            await asyncio.sleep(scheduler.backoff(attempt))
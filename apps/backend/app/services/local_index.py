@@ -0,0 +1,600 @@
+"""Embedded IVF vector index over memory-mapped float32 matrices.
+
+Serves read-mostly collections in-process, without a database round-trip.
+Each collection lives in its own directory:
+
+    manifest.json   dim, row count, IVF list count and a write version
+    vectors.f32     unit-normalized rows, append-only
+    deleted.u8      one tombstone byte per row
+    lists.i32       IVF list of each row (-1 until the index is trained)
+    centroids.f32   spherical k-means centroids, one per IVF list
+    docs.jsonl      ``{"id", "content", "metadata"}`` per row
+    offsets.u64     end offset of each row's line in docs.jsonl
+
+Arrays are opened with ``np.memmap`` so workers share the OS page cache and
+start without reading the files. Adds append rows; deletes and updates
+tombstone the old row. Below ``train_threshold`` live rows (or before the
+first training) searches are an exact scan; past it rows are bucketed into
+``sqrt(n)`` IVF lists and a query only scans the ``nprobe`` closest lists.
+Lists are retrained once the collection has doubled since the last training.
+
+One process should write to a collection at a time; readers in other
+processes pick up new rows on their next search via the manifest version.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Literal
+from uuid import UUID, uuid4
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.answer_cache import get_answer_cache
+from app.services.vector_store import (
+    Candidates,
+    Embedding,
+    IngestStats,
+    RecordSource,
+    SearchMode,
+    SearchTuning,
+    _batched,
+    _to_document,
+    _to_uuid,
+    as_vector,
+)
+
+logger = logging.getLogger(__name__)
+
+_MANIFEST = "manifest.json"
+_VECTORS = "vectors.f32"
+_DELETED = "deleted.u8"
+_LISTS = "lists.i32"
+_CENTROIDS = "centroids.f32"
+_DOCS = "docs.jsonl"
+_OFFSETS = "offsets.u64"
+
+# Collection names become directory names.
+_COLLECTION_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# Rows scored per matmul when assigning the whole collection to IVF lists.
+_ASSIGN_CHUNK = 65_536
+_KMEANS_ITERATIONS = 10
+# Training sample per centroid; more adds little for spherical k-means.
+_SAMPLE_PER_LIST = 64
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so inner product equals cosine similarity."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit: np.ndarray = (vectors / norms).astype(np.float32, copy=False)
+    return unit
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` largest finite scores, best first."""
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def _memmap(
+    path: Path, dtype: type[np.generic], shape: tuple[int, ...], mode: Literal["r", "r+"] = "r"
+) -> np.ndarray:
+    # np.memmap refuses empty files, and there is nothing to map anyway.
+    if not shape or shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Replace ``path`` so readers see either the old or the new file, never half."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """Arrays for one manifest version, swapped as a unit so searches never see a torn write."""
+
+    count: int
+    vectors: np.ndarray
+    deleted: np.ndarray
+    lists: np.ndarray
+    centroids: np.ndarray | None
+    ends: np.ndarray
+    docs: BinaryIO | None
+    # Rows grouped by IVF list: rows in list i are order[bounds[i]:bounds[i + 1]].
+    order: np.ndarray | None
+    bounds: np.ndarray | None
+
+
+class IVFIndex:
+    """A single collection's on-disk IVF index."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        dim: int | None = None,
+        train_threshold: int = 20_000,
+    ) -> None:
+        self.path = Path(path)
+        self.train_threshold = train_threshold
+        self._dim = dim
+        self._nlist = 0
+        self._trained_count = 0
+        self._lock = threading.Lock()
+        self._id_rows: dict[str, int] | None = None
+        self._version = 0
+        self._manifest_stamp: tuple[int, int] | None = None
+        self._snapshot: _Snapshot | None = None
+        self.refresh()
+
+    # ── Reading ────────────────────────────────────────────────────────
+    @property
+    def dim(self) -> int | None:
+        return self._dim
+
+    def __len__(self) -> int:
+        """Number of live (non-deleted) rows."""
+        snap = self._snapshot
+        if snap is None or snap.count == 0:
+            return 0
+        return snap.count - int(np.count_nonzero(snap.deleted))
+
+    def refresh(self) -> None:
+        """Remap the files if another writer has published a new manifest."""
+        manifest_path = self.path / _MANIFEST
+        try:
+            stat = manifest_path.stat()
+        except FileNotFoundError:
+            return
+        # The manifest is replaced atomically, so a new inode means a new version.
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._manifest_stamp:
+            return
+        self._manifest_stamp = stamp
+        self._load(json.loads(manifest_path.read_text()))
+
+    def _load(self, manifest: dict[str, Any]) -> None:
+        count, dim, nlist = manifest["count"], manifest["dim"], manifest["nlist"]
+        self._dim = dim
+        self._nlist = nlist
+        self._trained_count = manifest["trained_count"]
+        self._version = manifest["version"]
+
+        lists = _memmap(self.path / _LISTS, np.int32, (count,))
+        order = bounds = None
+        centroids = None
+        if nlist:
+            centroids = _memmap(self.path / _CENTROIDS, np.float32, (nlist, dim))
+            order = np.argsort(lists, kind="stable")
+            # Untrained rows (-1) sort first and fall outside every list.
+            bounds = np.searchsorted(lists[order], np.arange(nlist + 1))
+
+        previous = self._snapshot
+        docs = previous.docs if previous else None
+        if docs is not None and (
+            not count or os.fstat(docs.fileno()).st_ino != (self.path / _DOCS).stat().st_ino
+        ):
+            docs = None
+        if docs is None and count:
+            docs = open(self.path / _DOCS, "rb")  # noqa: SIM115
+
+        self._snapshot = _Snapshot(
+            count=count,
+            vectors=_memmap(self.path / _VECTORS, np.float32, (count, dim)),
+            deleted=_memmap(self.path / _DELETED, np.uint8, (count,)),
+            lists=lists,
+            centroids=centroids,
+            ends=_memmap(self.path / _OFFSETS, np.uint64, (count,)),
+            # Appends keep the same file, so the handle carries over; a rebuild
+            # replaces docs.jsonl, and the new snapshot opens the new file.
+            docs=docs,
+            order=order,
+            bounds=bounds,
+        )
+        if previous is not None and previous.docs is not None and previous.docs is not docs:
+            previous.docs.close()
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int | Sequence[int],
+        nprobe: int = 8,
+    ) -> list[list[tuple[int, float]]]:
+        """Return ``(row, cosine similarity)`` pairs per query, best first.
+
+        Args:
+            queries: ``(m, dim)`` or ``(dim,)`` float32 query vectors.
+            top_k: Results per query, either one value or one per query.
+            nprobe: IVF lists scanned per query once the index is trained.
+        """
+        self.refresh()
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        limits = [top_k] * len(queries) if isinstance(top_k, int) else list(top_k)
+        snap = self._snapshot
+        if snap is None or snap.count == 0:
+            return [[] for _ in queries]
+        if queries.shape[1] != snap.vectors.shape[1]:
+            raise ValueError(
+                f"Query dimension {queries.shape[1]} does not match index dimension "
+                f"{snap.vectors.shape[1]}"
+            )
+
+        if snap.order is None or snap.bounds is None or snap.centroids is None:
+            # Exact scan: one matmul for the whole batch.
+            scores = queries @ snap.vectors.T
+            scores[:, snap.deleted.astype(bool)] = -np.inf
+            return [
+                [(int(r), float(row_scores[r])) for r in _top_k(row_scores, k)]
+                for row_scores, k in zip(scores, limits, strict=True)
+            ]
+
+        probe_scores = queries @ snap.centroids.T
+        results = []
+        for query, centroid_scores, k in zip(queries, probe_scores, limits, strict=True):
+            probes = _top_k(centroid_scores, nprobe)
+            rows = np.concatenate([snap.order[snap.bounds[p] : snap.bounds[p + 1]] for p in probes])
+            rows = rows[snap.deleted[rows] == 0]
+            scores = snap.vectors[rows] @ query
+            results.append([(int(rows[i]), float(scores[i])) for i in _top_k(scores, k)])
+        return results
+
+    def vectors(self, rows: Sequence[int]) -> np.ndarray:
+        """Stored unit vectors for ``rows``, as an ``(n, dim)`` float32 array."""
+        snap = self._snapshot
+        if snap is None:
+            return np.empty((0, self._dim or 0), dtype=np.float32)
+        return np.asarray(snap.vectors[np.asarray(rows, dtype=np.int64)])
+
+    def document(self, row: int) -> dict[str, Any]:
+        """Read one row's ``{"id", "content", "metadata"}`` record."""
+        snap = self._snapshot
+        if snap is None or snap.docs is None or not 0 <= row < snap.count:
+            raise IndexError(row)
+        start = int(snap.ends[row - 1]) if row else 0
+        end = int(snap.ends[row])
+        # pread does not move the shared file position, so concurrent reads are safe.
+        record: dict[str, Any] = json.loads(os.pread(snap.docs.fileno(), end - start, start))
+        return record
+
+    # ── Writing ────────────────────────────────────────────────────────
+    def add(
+        self,
+        ids: Sequence[str],
+        contents: Sequence[str],
+        metadatas: Sequence[dict[str, Any]],
+        vectors: np.ndarray,
+    ) -> int:
+        """Append rows, replacing any live rows with the same ids; returns rows written.
+
+        Rows are appended after the published count and the manifest is
+        published before the replaced rows are tombstoned: an add that fails
+        partway loses nothing (its bytes are cut off by the next one), and
+        searches see an updated id twice for a moment rather than not at all.
+        """
+        if not len(ids):
+            return 0
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if not len(ids) == len(contents) == len(metadatas) == len(vectors):
+            raise ValueError(
+                f"Got {len(ids)} ids, {len(contents)} contents, {len(metadatas)} metadatas "
+                f"and {len(vectors)} vectors"
+            )
+        vectors = _normalize(vectors)
+        with self._lock:
+            self.refresh()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match "
+                    f"index dimension {self._dim}"
+                )
+            self.path.mkdir(parents=True, exist_ok=True)
+
+            # Last occurrence of an id within the batch wins, like the pgvector upsert.
+            latest = {id_: i for i, id_ in enumerate(ids)}
+            keep = sorted(latest.values())
+            id_rows = self._ids()
+            replaced = [id_rows[ids[i]] for i in keep if ids[i] in id_rows]
+
+            snap = self._snapshot
+            base = snap.count if snap else 0
+            docs_end = int(snap.ends[-1]) if snap and snap.count else 0
+            self._truncate_unpublished(base, docs_end)
+
+            lines = [
+                json.dumps(
+                    {"id": ids[i], "content": contents[i], "metadata": metadatas[i] or {}}
+                ).encode()
+                + b"\n"
+                for i in keep
+            ]
+            ends = docs_end + np.cumsum([len(line) for line in lines], dtype=np.uint64)
+
+            new = vectors[keep]
+            lists = np.full(len(keep), -1, dtype=np.int32)
+            if snap is not None and snap.centroids is not None:
+                lists = np.argmax(new @ snap.centroids.T, axis=1).astype(np.int32)
+
+            for name, data in (
+                (_DOCS, b"".join(lines)),
+                (_VECTORS, new.tobytes()),
+                (_DELETED, np.zeros(len(keep), dtype=np.uint8).tobytes()),
+                (_LISTS, lists.tobytes()),
+                (_OFFSETS, ends.tobytes()),
+            ):
+                with open(self.path / name, "ab") as f:
+                    f.write(data)
+
+            # The manifest is published after the appends, so a reader that
+            # sees the new count also sees every byte it points at.
+            self._publish(count=base + len(keep))
+            try:
+                self._tombstone(replaced)
+            except BaseException:
+                # _ids() tombstones the stale duplicates when it is rebuilt.
+                self._id_rows = None
+                raise
+            for n, i in enumerate(keep):
+                id_rows[ids[i]] = base + n
+
+            live = len(self)
+            if live >= self.train_threshold and live >= 2 * self._trained_count:
+                self._train()
+            return len(keep)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """Tombstone rows by id; returns the number of rows removed."""
+        with self._lock:
+            self.refresh()
+            id_rows = self._ids()
+            rows = [id_rows.pop(id_) for id_ in ids if id_ in id_rows]
+            if rows:
+                assert self._snapshot is not None
+                self._tombstone(rows)
+                self._publish(count=self._snapshot.count)
+            return len(rows)
+
+    def rebuild(self) -> None:
+        """Drop tombstoned rows from disk and retrain the IVF lists."""
+        with self._lock:
+            self.refresh()
+            snap = self._snapshot
+            if snap is None:
+                return
+            live = np.flatnonzero(snap.deleted == 0)
+            docs = [self.document(int(r)) for r in live]
+            vectors = np.ascontiguousarray(snap.vectors[live])
+
+            lines = [json.dumps(doc).encode() + b"\n" for doc in docs]
+            ends = np.cumsum([len(line) for line in lines], dtype=np.uint64)
+            _write_atomic(self.path / _DOCS, b"".join(lines))
+            _write_atomic(self.path / _OFFSETS, ends.tobytes())
+            _write_atomic(self.path / _VECTORS, vectors.tobytes())
+            _write_atomic(self.path / _DELETED, np.zeros(len(live), dtype=np.uint8).tobytes())
+            _write_atomic(self.path / _LISTS, np.full(len(live), -1, dtype=np.int32).tobytes())
+            self._id_rows = None
+            self._nlist = 0
+            self._trained_count = 0
+            self._publish(count=len(live))
+            if len(live) >= self.train_threshold:
+                self._train()
+
+    def _ids(self) -> dict[str, int]:
+        """id -> live row, built from docs.jsonl on the first write.
+
+        An id live in more than one row means an add stopped between
+        publishing its rows and tombstoning the ones they replaced; the
+        newest row wins and the others are tombstoned here.
+        """
+        if self._id_rows is None:
+            self._id_rows = {}
+            stale = []
+            snap = self._snapshot
+            if snap is not None:
+                for row in np.flatnonzero(snap.deleted == 0):
+                    id_ = self.document(int(row))["id"]
+                    if id_ in self._id_rows:
+                        stale.append(self._id_rows[id_])
+                    self._id_rows[id_] = int(row)
+            self._tombstone(stale)
+        return self._id_rows
+
+    def _truncate_unpublished(self, count: int, docs_end: int) -> None:
+        """Cut bytes a failed ``add`` appended past the published ``count`` rows.
+
+        Appends start at the end of each file, so leftovers would misalign
+        every later row with its vector and document offset.
+        """
+        dim = self._dim or 0
+        for name, size in (
+            (_DOCS, docs_end),
+            (_VECTORS, count * dim * 4),
+            (_DELETED, count),
+            (_LISTS, count * 4),
+            (_OFFSETS, count * 8),
+        ):
+            path = self.path / name
+            try:
+                if path.stat().st_size > size:
+                    os.truncate(path, size)
+            except FileNotFoundError:
+                continue
+
+    def _tombstone(self, rows: list[int]) -> None:
+        if not rows:
+            return
+        # Written through a shared mapping, so other processes see it immediately.
+        deleted = np.memmap(self.path / _DELETED, dtype=np.uint8, mode="r+")
+        deleted[rows] = 1
+        deleted.flush()
+
+    def _train(self) -> None:
+        """Cluster the live rows with spherical k-means and reassign every row."""
+        snap = self._snapshot
+        assert snap is not None
+        live = np.flatnonzero(snap.deleted == 0)
+        nlist = max(1, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(0)
+        sample = snap.vectors[
+            np.sort(rng.choice(live, min(len(live), nlist * _SAMPLE_PER_LIST), replace=False))
+        ]
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(_KMEANS_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = ~np.bincount(assign, minlength=nlist).astype(bool)
+            # Reseed empty clusters from random sample rows.
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        lists = np.empty(snap.count, dtype=np.int32)
+        for start in range(0, snap.count, _ASSIGN_CHUNK):
+            chunk = snap.vectors[start : start + _ASSIGN_CHUNK]
+            lists[start : start + _ASSIGN_CHUNK] = np.argmax(chunk @ centroids.T, axis=1)
+
+        _write_atomic(self.path / _CENTROIDS, centroids.tobytes())
+        _write_atomic(self.path / _LISTS, lists.tobytes())
+        self._nlist = nlist
+        self._trained_count = len(live)
+        self._publish(count=snap.count)
+        logger.info("Trained %s: %d IVF lists over %d rows", self.path.name, nlist, len(live))
+
+    def _publish(self, count: int) -> None:
+        manifest = {
+            "dim": self._dim,
+            "count": count,
+            "nlist": self._nlist,
+            "trained_count": self._trained_count,
+            "version": self._version + 1,
+        }
+        _write_atomic(self.path / _MANIFEST, json.dumps(manifest).encode())
+        stat = (self.path / _MANIFEST).stat()
+        self._manifest_stamp = (stat.st_ino, stat.st_mtime_ns)
+        self._load(manifest)
+
+
+class LocalVectorStore:
+    """``VectorStore`` backed by one ``IVFIndex`` directory per collection under ``root``.
+
+    There is no full-text index, so ``hybrid`` searches are ranked by vector
+    similarity alone.
+    """
+
+    def __init__(self, root: str | Path, nprobe: int = 8, train_threshold: int = 20_000) -> None:
+        self.root = Path(root)
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self._indexes: dict[str, IVFIndex] = {}
+
+    def index(self, collection: str) -> IVFIndex:
+        """Open (or create on first write) the index for ``collection``."""
+        index = self._indexes.get(collection)
+        if index is None:
+            if not _COLLECTION_NAME.fullmatch(collection):
+                raise ValueError(f"Invalid collection name: {collection!r}")
+            index = IVFIndex(self.root / collection, train_threshold=self.train_threshold)
+            self._indexes[collection] = index
+        return index
+
+    async def search(
+        self,
+        embedding: Embedding,
+        collection: str = "documents",
+        top_k: int = 5,
+        mode: SearchMode = "vector",
+        query_text: str | None = None,
+        tuning: SearchTuning | None = None,
+    ) -> list[Document]:
+        return (await self.search_batch([embedding], collection, top_k, tuning))[0]
+
+    async def search_candidates(
+        self,
+        embedding: Embedding,
+        collection: str = "documents",
+        top_k: int = 5,
+        mode: SearchMode = "vector",
+        query_text: str | None = None,
+        tuning: SearchTuning | None = None,
+    ) -> Candidates:
+        index = self.index(collection)
+        [hits] = index.search(as_vector(embedding), top_k, self._nprobe(tuning))
+        return Candidates(
+            [self._document(index, row, score) for row, score in hits],
+            index.vectors([row for row, _ in hits]),
+        )
+
+    async def search_batch(
+        self,
+        embeddings: Sequence[Embedding],
+        collection: str = "documents",
+        top_k: int | Sequence[int] = 5,
+        tuning: SearchTuning | None = None,
+    ) -> list[list[Document]]:
+        if not embeddings:
+            return []
+        index = self.index(collection)
+        # Small enough to run on the event loop: one matmul over mapped pages.
+        found = index.search(
+            np.stack([as_vector(e) for e in embeddings]), top_k, self._nprobe(tuning)
+        )
+        return [[self._document(index, row, score) for row, score in hits] for hits in found]
+
+    def _nprobe(self, tuning: SearchTuning | None) -> int:
+        return tuning.probes if tuning and tuning.probes else self.nprobe
+
+    @staticmethod
+    def _document(index: IVFIndex, row: int, score: float) -> Document:
+        record = index.document(row)
+        return _to_document(record["content"], record["metadata"], 1 - score)
+
+    async def upsert(
+        self,
+        records: RecordSource,
+        collection: str = "documents",
+        batch_size: int = 1000,
+    ) -> IngestStats:
+        index = self.index(collection)
+        stats = IngestStats()
+        started = time.perf_counter()
+        async for batch in _batched(records, batch_size):
+            ids = [str(_to_uuid(r.id) or uuid4()) for r in batch]
+            stats.rows += await asyncio.to_thread(
+                index.add,
+                ids,
+                [r.content for r in batch],
+                [r.metadata or {} for r in batch],
+                np.stack([as_vector(r.embedding) for r in batch]),
+            )
+            get_answer_cache().invalidate_collection(collection)
+            stats.batches += 1
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    async def delete(self, ids: Sequence[str | UUID], collection: str = "documents") -> int:
+        index = self.index(collection)
+        removed = await asyncio.to_thread(index.delete, [str(_to_uuid(i)) for i in ids])
+        get_answer_cache().invalidate_collection(collection)
+        return removed
@@ -0,0 +1,143 @@
+"""Post-retrieval re-ranking: maximal marginal relevance over candidate embeddings.
+
+Retrieval over-fetches candidates; MMR then picks ``top_k`` of them that are
+relevant to the query but not redundant with each other, so near-duplicate
+chunks stop eating the prompt. Relevance is cosine similarity to the query
+unless a ``Scorer`` (e.g. a local cross-encoder) is configured.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Protocol
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.config import settings
+
+
+class Scorer(Protocol):
+    """Scores query/passage pairs; higher means more relevant."""
+
+    def score(self, query: str, passages: Sequence[str]) -> Sequence[float]: ...
+
+
+class CrossEncoderScorer:
+    """``Scorer`` backed by a sentence-transformers cross-encoder running locally.
+
+    Requires the optional ``sentence-transformers`` package.
+    """
+
+    def __init__(self, model: str) -> None:
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as exc:
+            raise ImportError(
+                "rerank_model requires sentence-transformers: pip install sentence-transformers"
+            ) from exc
+        self._model = CrossEncoder(model)
+
+    def score(self, query: str, passages: Sequence[str]) -> Sequence[float]:
+        scores: Sequence[float] = self._model.predict([(query, passage) for passage in passages])
+        return scores
+
+
+@lru_cache(maxsize=1)
+def get_scorer() -> Scorer | None:
+    """The configured relevance scorer, or None to rank by embedding similarity."""
+    if not settings.rerank_model:
+        return None
+    return CrossEncoderScorer(settings.rerank_model)
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit: np.ndarray = matrix / norms
+    return unit
+
+
+def mmr(
+    query: np.ndarray,
+    embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    relevance: np.ndarray | None = None,
+) -> list[int]:
+    """Greedy maximal marginal relevance selection.
+
+    The candidate similarity matrix is computed once; each step then only
+    updates every candidate's max similarity to the selected set, so the
+    loop is O(k * n) vector ops.
+
+    Args:
+        query: Query embedding.
+        embeddings: ``(n, dim)`` candidate embeddings.
+        k: Number of candidates to select.
+        lambda_mult: 1.0 ranks by relevance only, 0.0 by diversity only.
+        relevance: Optional per-candidate relevance in [0, 1] replacing cosine
+            similarity to the query (e.g. normalized cross-encoder scores).
+
+    Returns:
+        Indices of the selected candidates, in selection order.
+    """
+    n = len(embeddings)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    candidates = _unit_rows(embeddings)
+    if relevance is None:
+        relevance = candidates @ _unit_rows(query)[0]
+    similarity = candidates @ candidates.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    max_similarity = similarity[first].copy()
+    available = np.ones(n, dtype=bool)
+    available[first] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return selected
+
+
+def rerank(
+    query: str,
+    query_embedding: np.ndarray,
+    documents: list[Document],
+    embeddings: np.ndarray,
+    top_k: int,
+    lambda_mult: float = 0.5,
+    scorer: Scorer | None = None,
+) -> list[Document]:
+    """Return the diversified ``top_k`` of ``documents``.
+
+    With a ``scorer``, its scores (min-max scaled to [0, 1]) replace cosine
+    relevance and are recorded as ``rerank_score`` in each kept document's
+    metadata.
+    """
+    if len(documents) <= 1 or len(embeddings) != len(documents):
+        return documents[:top_k]
+
+    relevance = None
+    raw: np.ndarray | None = None
+    if scorer is not None:
+        raw = np.asarray(scorer.score(query, [d.page_content for d in documents]), np.float32)
+        spread = float(raw.max() - raw.min())
+        relevance = (raw - raw.min()) / spread if spread else np.ones_like(raw)
+
+    picked = mmr(query_embedding, embeddings, top_k, lambda_mult, relevance)
+    if raw is not None:
+        for i in picked:
+            documents[i].metadata["rerank_score"] = float(raw[i])
+    return [documents[i] for i in picked]
@@ -0,0 +1,338 @@
+"""Server-side chat sessions — LangGraph checkpoint stores with idle expiry.
+
+With a ``session_id`` the chat agent runs with a checkpointer keyed by that
+id. The conversation then lives on the server, and clients send only the
+new message each turn. Sessions idle for longer than ``session_ttl`` start
+over and are removed by a periodic cleanup task.
+
+LangGraph keeps a checkpoint per graph step, so each turn the chat agent
+prunes a session to its latest checkpoint: it holds the whole
+conversation, and storage stays proportional to the history, not to the
+number of steps ever taken.
+
+Two backends, selected by ``settings.session_backend``:
+
+- ``memory``: ``InMemorySaver`` bounded to ``session_max_sessions`` by LRU
+  eviction. Per process, lost on restart; meant for development.
+- ``postgres``: ``AsyncPostgresSaver`` over ``supabase_db_url``, shared by
+  all workers. It uses its own small pool because the saver needs
+  autocommit, dict-row connections.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import weakref
+from collections import OrderedDict
+from typing import Protocol
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+from psycopg.rows import dict_row
+
+from app.core.config import settings
+from app.core.database import TimedConnectionPool, TimedCursor
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(Protocol):
+    """Checkpointer plus the activity tracking that expires idle sessions."""
+
+    @property
+    def checkpointer(self) -> BaseCheckpointSaver[str]: ...
+
+    async def touch(self, session_id: str) -> None:
+        """Mark a session active, clearing it first if it sat idle past the TTL."""
+        ...
+
+    async def delete(self, session_id: str) -> None: ...
+
+    async def prune(self, session_id: str) -> None:
+        """Drop all but the latest checkpoint of a session."""
+        ...
+
+    async def cleanup(self) -> int:
+        """Delete sessions idle past the TTL; returns how many were removed."""
+        ...
+
+    async def close(self) -> None: ...
+
+
+class MemorySessionStore:
+    """In-process sessions with LRU eviction and idle TTL."""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 86_400.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.checkpointer = InMemorySaver()
+        self._last_seen: OrderedDict[str, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+    async def touch(self, session_id: str) -> None:
+        now = time.monotonic()
+        last_seen = self._last_seen.get(session_id)
+        if last_seen is not None and last_seen + self.ttl < now:
+            self.checkpointer.delete_thread(session_id)
+        self._last_seen[session_id] = now
+        self._last_seen.move_to_end(session_id)
+        while len(self._last_seen) > self.maxsize:
+            evicted, _ = self._last_seen.popitem(last=False)
+            self.checkpointer.delete_thread(evicted)
+
+    async def delete(self, session_id: str) -> None:
+        self._last_seen.pop(session_id, None)
+        self.checkpointer.delete_thread(session_id)
+
+    async def prune(self, session_id: str) -> None:
+        # InMemorySaver has no prune, so this edits its storage like its delete_thread.
+        saver = self.checkpointer
+        for checkpoint_ns, checkpoints in saver.storage.get(session_id, {}).items():
+            if not checkpoints:
+                continue
+            latest = max(checkpoints)
+            versions = saver.serde.loads_typed(checkpoints[latest][0])["channel_versions"]
+            for checkpoint_id in [c for c in checkpoints if c != latest]:
+                del checkpoints[checkpoint_id]
+                saver.writes.pop((session_id, checkpoint_ns, checkpoint_id), None)
+            for key in [k for k in saver.blobs if k[:2] == (session_id, checkpoint_ns)]:
+                if versions.get(key[2]) != key[3]:
+                    del saver.blobs[key]
+
+    async def cleanup(self) -> int:
+        cutoff = time.monotonic() - self.ttl
+        expired = []
+        # Oldest first: stop at the first session that is still live.
+        for session_id, last_seen in self._last_seen.items():
+            if last_seen >= cutoff:
+                break
+            expired.append(session_id)
+        for session_id in expired:
+            await self.delete(session_id)
+        return len(expired)
+
+    async def close(self) -> None:
+        pass
+
+
+class PostgresSessionStore:
+    """Sessions checkpointed in Postgres, with last-seen times in ``table``.
+
+    The checkpoint tables and ``table`` are created on first use, so the app
+    still starts when Postgres is unreachable.
+    """
+
+    def __init__(
+        self,
+        conninfo: str,
+        ttl: float = 86_400.0,
+        max_size: int = 5,
+        table: str = "chat_sessions",
+    ) -> None:
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver  # only this backend
+
+        self.ttl = ttl
+        self.table = table
+        self._pool = TimedConnectionPool(
+            conninfo=conninfo,
+            min_size=1,
+            max_size=max_size,
+            timeout=settings.db_pool_timeout,
+            kwargs={
+                "autocommit": True,
+                "prepare_threshold": 0,
+                "row_factory": dict_row,
+                "cursor_factory": TimedCursor,
+            },
+            name="aiforge-sessions",
+            open=False,
+        )
+        self.checkpointer = AsyncPostgresSaver(self._pool)
+        self._ready = False
+        self._setup_lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        await self._pool.open(wait=False)
+
+    async def _ensure_ready(self) -> None:
+        if self._ready:
+            return
+        async with self._setup_lock:
+            if self._ready:
+                return
+            await self.checkpointer.setup()
+            async with self._pool.connection() as conn:
+                await conn.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {self.table} (
+                        session_id TEXT PRIMARY KEY,
+                        last_seen TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    )
+                    """
+                )
+                await conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.table}_last_seen_idx "
+                    f"ON {self.table} (last_seen)"
+                )
+            self._ready = True
+
+    async def touch(self, session_id: str) -> None:
+        await self._ensure_ready()
+        async with self._pool.connection() as conn:
+            cur = await conn.execute(
+                f"""
+                WITH previous AS (SELECT last_seen FROM {self.table} WHERE session_id = %s)
+                INSERT INTO {self.table} (session_id) VALUES (%s)
+                ON CONFLICT (session_id) DO UPDATE SET last_seen = NOW()
+                RETURNING (SELECT last_seen < NOW() - make_interval(secs => %s) FROM previous)
+                    AS expired
+                """,
+                (session_id, session_id, self.ttl),
+            )
+            row = await cur.fetchone()
+        if row and row["expired"]:
+            await self.checkpointer.adelete_thread(session_id)
+
+    async def delete(self, session_id: str) -> None:
+        await self._ensure_ready()
+        async with self._pool.connection() as conn:
+            await conn.execute(f"DELETE FROM {self.table} WHERE session_id = %s", (session_id,))
+        await self.checkpointer.adelete_thread(session_id)
+
+    async def prune(self, session_id: str) -> None:
+        # The saver has no prune; these are its tables (checkpoint ids sort by time).
+        async with self._pool.connection() as conn, conn.transaction():
+            await conn.execute(
+                """
+                DELETE FROM checkpoints c USING (
+                    SELECT checkpoint_ns, max(checkpoint_id) AS checkpoint_id
+                    FROM checkpoints WHERE thread_id = %s GROUP BY checkpoint_ns
+                ) latest
+                WHERE c.thread_id = %s AND c.checkpoint_ns = latest.checkpoint_ns
+                    AND c.checkpoint_id < latest.checkpoint_id
+                """,
+                (session_id, session_id),
+            )
+            await conn.execute(
+                """
+                DELETE FROM checkpoint_writes w WHERE thread_id = %s AND NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns
+                        AND c.checkpoint_id = w.checkpoint_id
+                )
+                """,
+                (session_id,),
+            )
+            await conn.execute(
+                """
+                DELETE FROM checkpoint_blobs b WHERE thread_id = %s AND NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+                        AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+                )
+                """,
+                (session_id,),
+            )
+
+    async def cleanup(self, batch_size: int = 500) -> int:
+        await self._ensure_ready()
+        removed = 0
+        while True:
+            # SKIP LOCKED lets every worker run cleanup without racing on rows.
+            async with self._pool.connection() as conn:
+                cur = await conn.execute(
+                    f"""
+                    DELETE FROM {self.table} WHERE session_id IN (
+                        SELECT session_id FROM {self.table}
+                        WHERE last_seen < NOW() - make_interval(secs => %s)
+                        LIMIT %s FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING session_id
+                    """,
+                    (self.ttl, batch_size),
+                )
+                expired = [row["session_id"] for row in await cur.fetchall()]
+            for session_id in expired:
+                await self.checkpointer.adelete_thread(session_id)
+            removed += len(expired)
+            if len(expired) < batch_size:
+                return removed
+
+    async def close(self) -> None:
+        await self._pool.close()
+
+
+_store: SessionStore | None = None
+_cleanup_task: asyncio.Task[None] | None = None
+_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+
+async def _cleanup_loop(store: SessionStore, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await store.cleanup()
+        except Exception:
+            logger.warning("Session cleanup failed", exc_info=True)
+            continue
+        if removed:
+            logger.info("Removed %d expired chat sessions", removed)
+
+
+async def open_session_store() -> SessionStore:
+    """Create the configured session store and start its cleanup task (idempotent)."""
+    global _store, _cleanup_task
+    if _store is None:
+        if settings.session_backend == "postgres":
+            store = PostgresSessionStore(
+                settings.supabase_db_url,
+                ttl=settings.session_ttl,
+                max_size=settings.session_db_pool_max_size,
+            )
+            await store.open()
+            _store = store
+        else:
+            _store = MemorySessionStore(settings.session_max_sessions, settings.session_ttl)
+        _cleanup_task = asyncio.create_task(
+            _cleanup_loop(_store, settings.session_cleanup_interval)
+        )
+    return _store
+
+
+async def close_session_store() -> None:
+    """Stop the cleanup task and close the session store, if open."""
+    global _store, _cleanup_task
+    if _cleanup_task is not None:
+        _cleanup_task.cancel()
+        _cleanup_task = None
+    if _store is not None:
+        await _store.close()
+        _store = None
+
+
+def get_session_store() -> SessionStore:
+    """Return the session store.
+
+    Raises:
+        RuntimeError: If the store has not been opened by the app lifespan.
+    """
+    if _store is None:
+        raise RuntimeError("Session store is not open. It is created in the app lifespan.")
+    return _store
+
+
+def session_lock(session_id: str) -> asyncio.Lock:
+    """Per-session lock, so concurrent turns of one session run one at a time.
+
+    Only serializes within this process; with several workers, route a
+    session to one worker or accept that racing turns may fork its history.
+    """
+    lock = _locks.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[session_id] = lock
+    return lock
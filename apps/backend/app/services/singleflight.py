@@ -0,0 +1,150 @@
+"""Single-flight coalescing of identical in-flight requests.
+
+When a popular question spikes, identical requests arrive while the first
+is still running. ``SingleFlight`` runs the work once per key and hands
+the result to every concurrent caller:
+
+- ``do``: duplicates await the in-flight call's result (or exception).
+- ``stream``: duplicates subscribe to the in-flight upstream stream.
+  Subscribers that join late first get the events they missed.
+
+Work is cancelled only once every caller waiting on it has gone away, so
+one client disconnecting does not fail the others. Keys cover the whole
+request (see ``request_key``). A finished flight is forgotten right away;
+repeats after that are the answer cache's job.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from contextlib import aclosing
+from functools import lru_cache
+from typing import Any
+
+_END = object()
+
+
+def request_key(kind: str, **fields: Any) -> str:
+    """Canonical hash of a request: same fields (in any order) give the same key."""
+    payload = json.dumps(fields, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(f"{kind}\0{payload}".encode(), digest_size=16).hexdigest()
+
+
+class _Failure:
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task[Any]) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class _Stream:
+    """One upstream iterator broadcast to subscriber queues."""
+
+    def __init__(self) -> None:
+        self.events: list[Any] = []
+        self.subscribers: set[asyncio.Queue[Any]] = set()
+        self.pump: asyncio.Task[None] | None = None
+
+    def subscribe(self) -> asyncio.Queue[Any]:
+        queue: asyncio.Queue[Any] = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        self.subscribers.add(queue)
+        return queue
+
+    def publish(self, event: Any) -> None:
+        self.events.append(event)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls and streams by key."""
+
+    def __init__(self) -> None:
+        self.calls = 0  # calls that did the work
+        self.coalesced = 0  # calls served by someone else's work
+        self._calls: dict[str, _Call] = {}
+        self._streams: dict[str, _Stream] = {}
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a call or stream for ``key`` is running (a new caller would join it)."""
+        return key in self._calls or key in self._streams
+
+    async def do[T](self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return ``fn()``'s result, sharing one in-flight call per ``key``."""
+        call = self._calls.get(key)
+        if call is None:
+            self.calls += 1
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(self._calls, key, call))
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        try:
+            # Shielded: a cancelled caller must not cancel the others' work.
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(self._calls, key, call)
+                call.task.cancel()
+
+    async def stream[T](
+        self, key: str, factory: Callable[[], AsyncGenerator[T]]
+    ) -> AsyncGenerator[T]:
+        """Yield the events of ``factory()``, sharing one upstream per ``key``."""
+        flight = self._streams.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = _Stream()
+            self._streams[key] = flight
+            flight.pump = asyncio.create_task(self._pump(key, flight, factory))
+        else:
+            self.coalesced += 1
+        queue = flight.subscribe()
+        try:
+            while True:
+                event = await queue.get()
+                if event is _END:
+                    return
+                if isinstance(event, _Failure):
+                    raise event.exc
+                yield event
+        finally:
+            flight.subscribers.discard(queue)
+            if not flight.subscribers and flight.pump is not None and not flight.pump.done():
+                self._forget(self._streams, key, flight)
+                flight.pump.cancel()
+
+    async def _pump[T](
+        self, key: str, flight: _Stream, factory: Callable[[], AsyncGenerator[T]]
+    ) -> None:
+        try:
+            async with aclosing(factory()) as events:
+                async for event in events:
+                    flight.publish(event)
+            flight.publish(_END)
+        except Exception as exc:
+            flight.publish(_Failure(exc))
+        finally:
+            self._forget(self._streams, key, flight)
+
+    @staticmethod
+    def _forget(flights: dict[str, Any], key: str, flight: Any) -> None:
+        if flights.get(key) is flight:
+            del flights[key]
+
+
+@lru_cache(maxsize=1)
+def get_singleflight() -> SingleFlight:
+    """Process-wide single-flight group for the API endpoints."""
+    return SingleFlight()
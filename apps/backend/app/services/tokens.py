@@ -0,0 +1,69 @@
+"""Token counting with tiktoken, cached per chunk of text.
+
+RAG chunks and chat turns are counted again on every request that sees
+them; the counter caches counts by a digest of the text so repeat chunks
+cost one hash instead of a full BPE pass.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Protocol
+
+import tiktoken
+
+# Used for models tiktoken does not know (e.g. Claude); close enough for budgeting.
+FALLBACK_ENCODING = "o200k_base"
+
+# Role/formatting tokens each chat message costs on top of its content.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class Encoding(Protocol):
+    name: str
+
+    def encode_ordinary(self, text: str) -> list[int]: ...
+
+
+@lru_cache(maxsize=32)
+def get_encoding(model: str) -> Encoding:
+    """The tiktoken encoding for ``model``, falling back to ``o200k_base``."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+
+
+class TokenCounter:
+    """Counts tokens for one encoding with an LRU cache keyed by text digest."""
+
+    def __init__(self, encoding: Encoding, maxsize: int = 50_000) -> None:
+        self.encoding = encoding
+        self.maxsize = maxsize
+        self._cache: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        n = len(self.encoding.encode_ordinary(text))
+        with self._lock:
+            self._cache[key] = n
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return n
+
+
+@lru_cache(maxsize=32)
+def get_token_counter(model: str) -> TokenCounter:
+    """Shared counter for ``model``'s encoding."""
+    return TokenCounter(get_encoding(model))
@@ -0,0 +1,308 @@
+"""pgvector ANN index management — create, rebuild, inspect and drop per collection.
+
+Without an ANN index on ``embedding``, every search is a sequential scan.
+Builds run ``CONCURRENTLY`` by default so the collection stays writable, with
+a session-level ``maintenance_work_mem`` so the graph/lists fit in memory
+(pgvector builds are much slower once they spill).
+
+Query-time recall knobs (``hnsw.ef_search``, ``ivfflat.probes``) are set per
+search via ``SearchTuning`` in ``app.services.vector_store``.
+
+Also usable from the command line::
+
+    python -m app.services.vector_index create documents --method hnsw --mem 2GB
+    python -m app.services.vector_index inspect documents
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import math
+from dataclasses import asdict, dataclass
+from typing import Any, Literal
+
+from psycopg import AsyncConnection, sql
+
+from app.core.database import close_pool, get_pool, open_pool
+
+logger = logging.getLogger(__name__)
+
+IndexMethod = Literal["hnsw", "ivfflat"]
+
+# Operator class per distance; search_vectors uses cosine (<=>).
+DEFAULT_OPCLASS = "vector_cosine_ops"
+
+
+@dataclass
+class IndexSpec:
+    """Build parameters for an ANN index on ``embedding``.
+
+    ``m`` and ``ef_construction`` apply to HNSW; ``lists`` to IVFFlat, where
+    None picks pgvector's guidance (rows / 1000 up to 1M rows, sqrt(rows) above).
+    """
+
+    method: IndexMethod = "hnsw"
+    m: int = 16
+    ef_construction: int = 64
+    lists: int | None = None
+    opclass: str = DEFAULT_OPCLASS
+
+
+@dataclass
+class IndexInfo:
+    """An existing index on a collection, as reported by the catalog."""
+
+    name: str
+    method: str
+    definition: str
+    valid: bool  # False after a failed concurrent build; drop and recreate
+    size_bytes: int
+    rows_estimate: int
+
+
+def index_name(collection: str, method: IndexMethod) -> str:
+    return f"{collection}_embedding_{method}_idx"
+
+
+def recommended_lists(rows: int) -> int:
+    """IVFFlat list count for ``rows`` vectors."""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+async def _row_estimate(conn: AsyncConnection, collection: str) -> int:
+    cur = await conn.execute(
+        "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = %s::regclass",
+        (collection,),
+    )
+    row = await cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+async def _autocommit_session(
+    conn: AsyncConnection,
+    maintenance_work_mem: str | None,
+    parallel_workers: int | None,
+) -> None:
+    # CREATE/REINDEX/DROP ... CONCURRENTLY cannot run inside a transaction block.
+    await conn.set_autocommit(True)
+    if maintenance_work_mem:
+        await conn.execute(
+            "SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,)
+        )
+    if parallel_workers is not None:
+        await conn.execute(
+            "SELECT set_config('max_parallel_maintenance_workers', %s, false)",
+            (str(parallel_workers),),
+        )
+
+
+async def _reset_session(conn: AsyncConnection) -> None:
+    # The connection goes back to the shared pool.
+    await conn.execute("RESET maintenance_work_mem; RESET max_parallel_maintenance_workers")
+    await conn.set_autocommit(False)
+
+
+def _create_statement(
+    collection: str,
+    name: str,
+    spec: IndexSpec,
+    rows: int,
+    concurrently: bool,
+) -> sql.Composed:
+    if spec.method == "hnsw":
+        params = sql.SQL("m = {}, ef_construction = {}").format(
+            sql.Literal(spec.m), sql.Literal(spec.ef_construction)
+        )
+    elif spec.method == "ivfflat":
+        params = sql.SQL("lists = {}").format(sql.Literal(spec.lists or recommended_lists(rows)))
+    else:
+        raise ValueError(f"Unknown index method: {spec.method!r}")
+    return sql.SQL(
+        "CREATE INDEX {concurrently} IF NOT EXISTS {name} ON {table} "
+        "USING {method} (embedding {opclass}) WITH ({params})"
+    ).format(
+        concurrently=sql.SQL("CONCURRENTLY" if concurrently else ""),
+        name=sql.Identifier(name),
+        table=sql.Identifier(collection),
+        method=sql.SQL(spec.method),
+        opclass=sql.Identifier(spec.opclass),
+        params=params,
+    )
+
+
+async def create_index(
+    collection: str = "documents",
+    spec: IndexSpec | None = None,
+    concurrently: bool = True,
+    maintenance_work_mem: str | None = "1GB",
+    parallel_workers: int | None = None,
+) -> str:
+    """Create an ANN index on ``collection.embedding`` if it does not exist.
+
+    Args:
+        collection: Table name in Supabase.
+        spec: Index method and build parameters (default: HNSW, m=16, ef_construction=64).
+        concurrently: Build without blocking writes (slower, cannot run in a transaction).
+        maintenance_work_mem: Build memory for this session, e.g. ``"2GB"``.
+        parallel_workers: ``max_parallel_maintenance_workers`` for this build.
+
+    Returns:
+        The index name.
+    """
+    spec = spec or IndexSpec()
+    name = index_name(collection, spec.method)
+    async with get_pool().connection() as conn:
+        await _autocommit_session(conn, maintenance_work_mem, parallel_workers)
+        try:
+            rows = await _row_estimate(conn, collection)
+            if spec.method == "ivfflat" and rows == 0:
+                # IVFFlat trains its lists on existing rows; an empty build is useless.
+                logger.warning(
+                    "Building IVFFlat on empty %s; rebuild after loading data", collection
+                )
+            await conn.execute(_create_statement(collection, name, spec, rows, concurrently))
+        finally:
+            await _reset_session(conn)
+    logger.info("Created %s index %s on %s", spec.method, name, collection)
+    return name
+
+
+async def rebuild_index(
+    collection: str = "documents",
+    method: IndexMethod = "hnsw",
+    spec: IndexSpec | None = None,
+    maintenance_work_mem: str | None = "1GB",
+    parallel_workers: int | None = None,
+) -> str:
+    """Rebuild an index without blocking reads or writes.
+
+    With no ``spec`` the index is ``REINDEX``ed as-is, which also retrains
+    IVFFlat lists on the current data. With a ``spec`` a replacement is built
+    concurrently under a temporary name and swapped in, so build parameters
+    can change without a window where searches fall back to a sequential scan.
+
+    Returns:
+        The index name.
+    """
+    name = index_name(collection, method)
+    async with get_pool().connection() as conn:
+        await _autocommit_session(conn, maintenance_work_mem, parallel_workers)
+        try:
+            if spec is None:
+                await conn.execute(
+                    sql.SQL("REINDEX INDEX CONCURRENTLY {}").format(sql.Identifier(name))
+                )
+            else:
+                if spec.method != method:
+                    raise ValueError(f"spec.method {spec.method!r} does not match {method!r}")
+                staging = f"{name}_new"
+                rows = await _row_estimate(conn, collection)
+                await conn.execute(
+                    sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(staging))
+                )
+                await conn.execute(
+                    _create_statement(collection, staging, spec, rows, concurrently=True)
+                )
+                async with conn.transaction():
+                    await conn.execute(
+                        sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(name))
+                    )
+                    await conn.execute(
+                        sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                            sql.Identifier(staging), sql.Identifier(name)
+                        )
+                    )
+        finally:
+            await _reset_session(conn)
+    logger.info("Rebuilt %s index %s on %s", method, name, collection)
+    return name
+
+
+async def drop_index(collection: str = "documents", method: IndexMethod = "hnsw") -> None:
+    """Drop a collection's ANN index without blocking the table."""
+    async with get_pool().connection() as conn:
+        await _autocommit_session(conn, None, None)
+        try:
+            await conn.execute(
+                sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(
+                    sql.Identifier(index_name(collection, method))
+                )
+            )
+        finally:
+            await _reset_session(conn)
+
+
+async def inspect_indexes(collection: str = "documents") -> list[IndexInfo]:
+    """List the vector indexes on ``collection`` with validity, size and row estimate."""
+    query = """
+        SELECT i.relname, am.amname, pg_get_indexdef(i.oid), x.indisvalid,
+               pg_relation_size(i.oid), GREATEST(t.reltuples, 0)::bigint
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_class t ON t.oid = x.indrelid
+        JOIN pg_am am ON am.oid = i.relam
+        WHERE x.indrelid = %s::regclass AND am.amname IN ('hnsw', 'ivfflat')
+        ORDER BY i.relname
+    """
+    async with get_pool().connection() as conn:
+        cur = await conn.execute(query, (collection,))
+        return [IndexInfo(*row) for row in await cur.fetchall()]
+
+
+async def build_progress() -> list[dict[str, Any]]:
+    """In-flight index builds from ``pg_stat_progress_create_index``."""
+    query = """
+        SELECT c.relname AS collection, i.relname AS index, p.phase,
+               p.tuples_done, p.tuples_total, p.blocks_done, p.blocks_total
+        FROM pg_stat_progress_create_index p
+        JOIN pg_class c ON c.oid = p.relid
+        LEFT JOIN pg_class i ON i.oid = p.index_relid
+    """
+    async with get_pool().connection() as conn:
+        cur = await conn.execute(query)
+        columns = [col.name for col in cur.description or ()]
+        return [dict(zip(columns, row, strict=True)) for row in await cur.fetchall()]
+
+
+async def _main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.services.vector_index")
+    parser.add_argument("action", choices=["create", "rebuild", "drop", "inspect", "progress"])
+    parser.add_argument("collection", nargs="?", default="documents")
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--mem", default="1GB", help="maintenance_work_mem for the build")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--blocking", action="store_true", help="build without CONCURRENTLY")
+    args = parser.parse_args(argv)
+
+    spec = IndexSpec(args.method, args.m, args.ef_construction, args.lists)
+    await open_pool()
+    try:
+        if args.action == "create":
+            await create_index(args.collection, spec, not args.blocking, args.mem, args.workers)
+        elif args.action == "rebuild":
+            changed = spec != IndexSpec(args.method)
+            await rebuild_index(
+                args.collection, args.method, spec if changed else None, args.mem, args.workers
+            )
+        elif args.action == "drop":
+            await drop_index(args.collection, args.method)
+        elif args.action == "inspect":
+            for info in await inspect_indexes(args.collection):
+                print(asdict(info))  # noqa: T201
+        else:
+            for row in await build_progress():
+                print(row)  # noqa: T201
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -1,64 +1,458 @@
-"""Supabase pgvector service for RAG retrieval."""
+"""Vector store backends for RAG retrieval.
+
+Supabase pgvector is the default; ``vector_store_backend = "local"`` serves
+collections from the embedded IVF index in ``app.services.local_index``
+instead. Callers go through ``get_vector_store()``; the module-level
+``*_vectors`` functions are the pgvector implementation.
+"""
 
 from __future__ import annotations
 
-import psycopg
+import logging
+import time
+from array import array
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Literal, NamedTuple, Protocol
+from uuid import UUID, uuid5
+
+import numpy as np
 from langchain_core.documents import Document
+from psycopg import AsyncConnection
 
 from app.core.config import settings
+from app.core.database import get_pool
+from app.services.answer_cache import get_answer_cache
+
+logger = logging.getLogger(__name__)
+
+# Anything we accept as an embedding: plain lists, NumPy arrays or array('f') buffers.
+Embedding = Sequence[float] | np.ndarray | array[float]
+
+SearchMode = Literal["vector", "hybrid"]
+
+# Reciprocal rank fusion constant (Cormack et al. use 60) and how many
+# candidates each retriever contributes per requested result.
+RRF_K = 60
+HYBRID_CANDIDATE_FACTOR = 4
+
+# Both retrievers run as CTEs in one round-trip. The tsvector expression
+# matches the GIN index from the hybrid-search migration, and repeated named
+# placeholders are sent once, so the query vector is still bound a single time.
+_HYBRID_QUERY = """
+    WITH semantic AS (
+        SELECT id, row_number() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT id, embedding <=> %(embedding)b AS distance
+            FROM {collection}
+            ORDER BY distance
+            LIMIT %(candidates)s
+        ) nearest
+    ),
+    lexical AS (
+        SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+        FROM (
+            SELECT id, ts_rank_cd(to_tsvector('english', content), tsq) AS score
+            FROM {collection}, websearch_to_tsquery('english', %(query_text)s) AS tsq
+            WHERE to_tsvector('english', content) @@ tsq
+            ORDER BY score DESC
+            LIMIT %(candidates)s
+        ) matched
+    ),
+    fused AS (
+        SELECT COALESCE(s.id, l.id) AS id,
+               COALESCE(1.0 / (%(rrf_k)s + s.rank), 0)
+             + COALESCE(1.0 / (%(rrf_k)s + l.rank), 0) AS score
+        FROM semantic s
+        FULL OUTER JOIN lexical l ON s.id = l.id
+    )
+    SELECT d.content, d.metadata, d.embedding <=> %(embedding)b AS distance{embedding_column},
+           f.score
+    FROM fused f
+    JOIN {collection} d ON d.id = f.id
+    ORDER BY f.score DESC
+    LIMIT %(top_k)s
+"""
+
+
+@dataclass(frozen=True)
+class SearchTuning:
+    """Per-query ANN recall/latency knobs; unset fields fall back to settings.
+
+    ``ef_search`` is the HNSW candidate list size (pgvector default 40). An
+    HNSW scan returns at most ``ef_search`` rows, so keep it >= top_k.
+    ``probes`` is the number of IVFFlat lists scanned (default 1); the local
+    index uses it as ``nprobe``. Higher values trade latency for recall.
+    """
+
+    ef_search: int | None = None
+    probes: int | None = None
+
+
+async def _apply_tuning(conn: AsyncConnection, tuning: SearchTuning | None) -> None:
+    """SET LOCAL the knobs inside the caller's transaction, in one round-trip."""
+    ef_search = tuning.ef_search if tuning and tuning.ef_search else settings.vector_ef_search
+    probes = tuning.probes if tuning and tuning.probes else settings.vector_ivfflat_probes
+    statements = []
+    if ef_search:
+        statements.append(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+    if probes:
+        statements.append(f"SET LOCAL ivfflat.probes = {int(probes)}")
+    if statements:
+        await conn.execute("; ".join(statements))
+
+
+class Candidates(NamedTuple):
+    """Search results plus their stored embeddings, row-aligned, for re-ranking."""
+
+    documents: list[Document]
+    embeddings: np.ndarray
+
+
+def as_vector(embedding: Embedding) -> np.ndarray:
+    """Return ``embedding`` as a 1-D float32 array without copying when possible.
+
+    float32 NumPy arrays pass through and ``array('f')`` buffers are wrapped
+    zero-copy, so no Python list is built. The pgvector binary dumper still
+    converts to big-endian (``>f4``), which copies once on little-endian hosts.
+    """
+    if isinstance(embedding, np.ndarray) and embedding.dtype == np.float32:
+        return embedding
+    if isinstance(embedding, array) and embedding.typecode == "f":
+        return np.frombuffer(embedding, dtype=np.float32)
+    return np.asarray(embedding, dtype=np.float32)
 
 
 async def search_vectors(
-    embedding: list[float],
+    embedding: Embedding,
     collection: str = "documents",
     top_k: int = 5,
+    mode: SearchMode = "vector",
+    query_text: str | None = None,
+    tuning: SearchTuning | None = None,
 ) -> list[Document]:
     """Search for similar vectors in Supabase pgvector.
 
     Uses cosine similarity search against the specified collection table.
     Expects a table with columns: id, content, metadata, embedding (vector).
 
+    In ``hybrid`` mode a full-text match on ``query_text`` and the ANN search
+    run as CTEs in the same query and are fused with reciprocal rank fusion,
+    which recovers exact identifiers (SKUs, error codes) that embeddings miss.
+    Hybrid results carry an ``rrf_score`` in their metadata.
+
     Args:
         embedding: Query embedding vector.
         collection: Table name in Supabase.
         top_k: Number of results to return.
+        mode: ``vector`` (cosine only) or ``hybrid`` (full-text + cosine).
+        query_text: Raw query text; required for ``hybrid`` mode.
+        tuning: ANN recall/latency knobs, SET LOCAL for this query only.
 
     Returns:
         List of LangChain Document objects.
     """
-    query = f"""
-        SELECT content, metadata, 1 - (embedding <=> %s::vector) AS similarity
-        FROM {collection}
-        ORDER BY embedding <=> %s::vector
-        LIMIT %s
+    found = await _search(embedding, collection, top_k, mode, query_text, False, tuning)
+    return found.documents
+
+
+async def search_candidates(
+    embedding: Embedding,
+    collection: str = "documents",
+    top_k: int = 5,
+    mode: SearchMode = "vector",
+    query_text: str | None = None,
+    tuning: SearchTuning | None = None,
+) -> Candidates:
+    """Like ``search_vectors``, but also return each row's embedding.
+
+    Embeddings come back through a binary cursor, so each one arrives as a
+    float32 array without text parsing. Takes the same arguments as
+    ``search_vectors``.
     """
+    return await _search(embedding, collection, top_k, mode, query_text, True, tuning)
+
+
+async def _search(
+    embedding: Embedding,
+    collection: str,
+    top_k: int,
+    mode: SearchMode,
+    query_text: str | None,
+    with_embeddings: bool,
+    tuning: SearchTuning | None = None,
+) -> Candidates:
+    if mode == "hybrid" and query_text:
+        query = _HYBRID_QUERY.format(
+            collection=collection,
+            embedding_column=", d.embedding" if with_embeddings else "",
+        )
+        params: dict[str, object] | tuple[Any, ...] = {
+            "embedding": as_vector(embedding),
+            "query_text": query_text,
+            "candidates": max(top_k * HYBRID_CANDIDATE_FACTOR, top_k),
+            "rrf_k": RRF_K,
+            "top_k": top_k,
+        }
+    else:
+        # The query vector is bound once, in binary, and the ORDER BY reuses
+        # the distance column so the ANN index still drives the scan.
+        embedding_column = ", embedding" if with_embeddings else ""
+        query = f"""
+            SELECT content, metadata, embedding <=> %b AS distance{embedding_column}
+            FROM {collection}
+            ORDER BY distance
+            LIMIT %s
+        """
+        params = (as_vector(embedding), top_k)
 
     documents: list[Document] = []
+    vectors: list[np.ndarray] = []
 
     try:
-        async with await psycopg.AsyncConnection.connect(settings.supabase_db_url) as conn:
-            async with conn.cursor() as cur:
-                embedding_str = f"[{','.join(str(x) for x in embedding)}]"
-                await cur.execute(query, (embedding_str, embedding_str, top_k))
+        async with get_pool().connection() as conn, conn.transaction():
+            await _apply_tuning(conn, tuning)
+            async with conn.cursor(binary=with_embeddings) as cur:
+                await cur.execute(query, params)
                 rows = await cur.fetchall()
 
-                for row in rows:
-                    content, metadata, similarity = row
-                    doc_metadata = metadata if isinstance(metadata, dict) else {}
-                    doc_metadata["similarity"] = float(similarity)
-                    documents.append(Document(page_content=content, metadata=doc_metadata))
+                for content, metadata, distance, *rest in rows:
+                    if with_embeddings:
+                        vectors.append(rest.pop(0))
+                    doc = _to_document(content, metadata, distance)
+                    if rest:
+                        doc.metadata["rrf_score"] = float(rest[0])
+                    documents.append(doc)
     except Exception as e:
         # Return empty results if vector store is not set up yet
-        print(f"Vector search error (pgvector may not be configured): {e}")
+        logger.warning(
+            "Vector search on %s failed (pgvector may not be configured): %s", collection, e
+        )
+        documents.clear()
+        vectors.clear()
+
+    embeddings = np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+    return Candidates(documents, embeddings)
+
+
+async def search_vectors_batch(
+    embeddings: Sequence[Embedding],
+    collection: str = "documents",
+    top_k: int | Sequence[int] = 5,
+    tuning: SearchTuning | None = None,
+) -> list[list[Document]]:
+    """Search top-k neighbours for many query vectors in one round-trip.
+
+    The query vectors are sent as a single binary ``vector[]`` parameter and
+    each one drives its own index scan through a LATERAL join.
+
+    Args:
+        embeddings: Query embedding vectors.
+        collection: Table name in Supabase.
+        top_k: Results per query, either one value or one per embedding.
+        tuning: ANN recall/latency knobs, SET LOCAL for this query only.
+
+    Returns:
+        One list of Documents per query, in input order.
+    """
+    if not embeddings:
+        return []
+    limits = [top_k] * len(embeddings) if isinstance(top_k, int) else list(top_k)
+
+    query = f"""
+        SELECT q.ord, d.content, d.metadata, d.distance
+        FROM unnest(%b::vector[], %s::int[]) WITH ORDINALITY AS q(embedding, top_k, ord)
+        CROSS JOIN LATERAL (
+            SELECT content, metadata, embedding <=> q.embedding AS distance
+            FROM {collection}
+            ORDER BY distance
+            LIMIT q.top_k
+        ) d
+        ORDER BY q.ord, d.distance
+    """
+
+    results: list[list[Document]] = [[] for _ in embeddings]
+
+    try:
+        async with get_pool().connection() as conn, conn.transaction():
+            await _apply_tuning(conn, tuning)
+            async with conn.cursor() as cur:
+                await cur.execute(query, ([as_vector(e) for e in embeddings], limits))
+                for ord_, content, metadata, distance in await cur.fetchall():
+                    results[ord_ - 1].append(_to_document(content, metadata, distance))
+    except Exception as e:
+        # Same contract as search_vectors: no results if the store is not set up
+        logger.warning(
+            "Vector search on %s failed (pgvector may not be configured): %s", collection, e
+        )
+
+    return results
+
+
+def _to_document(content: str, metadata: object, distance: float) -> Document:
+    doc_metadata = metadata if isinstance(metadata, dict) else {}
+    doc_metadata["similarity"] = 1 - float(distance)
+    return Document(page_content=content, metadata=doc_metadata)
+
+
+# ── Bulk ingestion ─────────────────────────────────────────────────────
+class VectorRecord(NamedTuple):
+    """A single row to ingest: plain ``(text, embedding, metadata[, id])`` tuples also work."""
+
+    content: str
+    embedding: Embedding
+    metadata: dict[str, Any] | None = None
+    id: str | UUID | None = None
+
+
+RecordSource = (
+    Iterable[VectorRecord | tuple[Any, ...]] | AsyncIterable[VectorRecord | tuple[Any, ...]]
+)
+
 
-    return documents
+@dataclass
+class IngestStats:
+    """Throughput report for a bulk ingestion run."""
+
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+# Namespace for deriving UUIDs from caller ids that are not UUIDs themselves,
+# e.g. "handbook.pdf#chunk-12", so re-indexing the same chunk hits ON CONFLICT.
+_ID_NAMESPACE = UUID("6f1c2b8e-4d5a-4e0b-9a57-2f7f0e6c1d3a")
+
+_STAGE_TABLE = "_vector_ingest_stage"
+
+
+def _to_uuid(value: str | UUID | None) -> UUID | None:
+    """Normalize a caller-supplied id to the UUID primary key."""
+    if value is None or isinstance(value, UUID):
+        return value
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return uuid5(_ID_NAMESPACE, str(value))
+
+
+async def _batched(
+    records: RecordSource,
+    batch_size: int,
+) -> AsyncIterator[list[VectorRecord]]:
+    """Group a sync or async stream of records into lists of ``batch_size``."""
+    batch: list[VectorRecord] = []
+    if isinstance(records, AsyncIterable):
+        async for record in records:
+            batch.append(VectorRecord(*record))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    else:
+        for record in records:
+            batch.append(VectorRecord(*record))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _dedupe(batch: list[VectorRecord]) -> list[tuple[Any, ...]]:
+    """Convert a batch to COPY rows, keeping the last occurrence of each id.
+
+    ``ON CONFLICT DO UPDATE`` cannot touch the same row twice in one statement.
+    """
+    rows: dict[object, tuple[Any, ...]] = {}
+    for i, record in enumerate(batch):
+        row_id = _to_uuid(record.id)
+        rows[row_id if row_id is not None else i] = (
+            row_id,
+            record.content,
+            record.metadata or {},
+            as_vector(record.embedding),
+        )
+    return list(rows.values())
+
+
+async def bulk_upsert_vectors(
+    records: RecordSource,
+    collection: str = "documents",
+    batch_size: int = 1000,
+) -> IngestStats:
+    """Stream records into pgvector with binary COPY, one transaction per batch.
+
+    Each batch is COPYed into a temporary staging table and merged into the
+    collection with a single ``INSERT ... SELECT ... ON CONFLICT (id)``, so a
+    re-index of the same corpus updates rows instead of duplicating them.
+    Rows without an id get a fresh ``gen_random_uuid()``.
+
+    Args:
+        records: Iterable or async iterable of ``(text, embedding, metadata[, id])``.
+        collection: Table name in Supabase.
+        batch_size: Rows per COPY/transaction.
+
+    Returns:
+        IngestStats with row count, batch count, elapsed time and rows/sec.
+    """
+    merge = f"""
+        INSERT INTO {collection} (id, content, metadata, embedding)
+        SELECT COALESCE(id, gen_random_uuid()), content, metadata, embedding
+        FROM {_STAGE_TABLE}
+        ON CONFLICT (id) DO UPDATE SET
+            content = EXCLUDED.content,
+            metadata = EXCLUDED.metadata,
+            embedding = EXCLUDED.embedding
+    """
+
+    stats = IngestStats()
+    started = time.perf_counter()
+
+    async with get_pool().connection() as conn:
+        await conn.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {_STAGE_TABLE} "
+            "(id uuid, content text, metadata jsonb, embedding vector) ON COMMIT DELETE ROWS"
+        )
+        await conn.commit()
+
+        async for batch in _batched(records, batch_size):
+            async with conn.transaction(), conn.cursor() as cur:
+                async with cur.copy(
+                    f"COPY {_STAGE_TABLE} (id, content, metadata, embedding) "
+                    "FROM STDIN (FORMAT BINARY)"
+                ) as copy:
+                    copy.set_types(["uuid", "text", "jsonb", "vector"])
+                    for row in _dedupe(batch):
+                        await copy.write_row(row)
+                await cur.execute(merge)
+                stats.rows += cur.rowcount
+            # Cached answers for this collection may now be stale.
+            get_answer_cache().invalidate_collection(collection)
+            stats.batches += 1
+            stats.seconds = time.perf_counter() - started
+            logger.info(
+                "Ingested batch %d into %s: %d rows total, %.0f rows/sec",
+                stats.batches,
+                collection,
+                stats.rows,
+                stats.rows_per_sec,
+            )
+
+    stats.seconds = time.perf_counter() - started
+    return stats
 
 
 async def upsert_vectors(
     texts: list[str],
-    embeddings: list[list[float]],
-    metadatas: list[dict] | None = None,
+    embeddings: Sequence[Embedding],
+    metadatas: list[dict[str, Any]] | None = None,
     collection: str = "documents",
+    ids: list[str | UUID | None] | None = None,
 ) -> int:
     """Insert or update vectors in Supabase pgvector.
 
@@ -67,29 +461,133 @@ async def upsert_vectors(
         embeddings: Corresponding embedding vectors.
         metadatas: Optional metadata for each document.
         collection: Table name in Supabase.
+        ids: Optional stable ids; rows with an existing id are updated in place.
 
     Returns:
         Number of rows upserted.
     """
     if metadatas is None:
         metadatas = [{} for _ in texts]
+    if ids is None:
+        ids = [None for _ in texts]
 
-    query = f"""
-        INSERT INTO {collection} (content, metadata, embedding)
-        VALUES (%s, %s, %s::vector)
-        ON CONFLICT (id) DO UPDATE SET
-            content = EXCLUDED.content,
-            metadata = EXCLUDED.metadata,
-            embedding = EXCLUDED.embedding
-    """
+    records = [
+        VectorRecord(text, embedding, metadata, id_)
+        for text, embedding, metadata, id_ in zip(texts, embeddings, metadatas, ids, strict=True)
+    ]
+    stats = await get_vector_store().upsert(
+        records, collection=collection, batch_size=max(len(records), 1)
+    )
+    return stats.rows
 
-    count = 0
-    async with await psycopg.AsyncConnection.connect(settings.supabase_db_url) as conn:
-        async with conn.cursor() as cur:
-            for text, embedding, metadata in zip(texts, embeddings, metadatas):
-                embedding_str = f"[{','.join(str(x) for x in embedding)}]"
-                await cur.execute(query, (text, metadata, embedding_str))
-                count += 1
-        await conn.commit()
 
-    return count
+async def delete_vectors(ids: Sequence[str | UUID], collection: str = "documents") -> int:
+    """Delete rows by id from a pgvector collection; returns rows deleted."""
+    async with get_pool().connection() as conn:
+        cur = await conn.execute(
+            f"DELETE FROM {collection} WHERE id = ANY(%s)", ([_to_uuid(i) for i in ids],)
+        )
+    get_answer_cache().invalidate_collection(collection)
+    return cur.rowcount
+
+
+# ── Backends ───────────────────────────────────────────────────────────
+class VectorStore(Protocol):
+    """Retrieval backend used by the RAG agents."""
+
+    async def search(
+        self,
+        embedding: Embedding,
+        collection: str = "documents",
+        top_k: int = 5,
+        mode: SearchMode = "vector",
+        query_text: str | None = None,
+        tuning: SearchTuning | None = None,
+    ) -> list[Document]: ...
+
+    async def search_candidates(
+        self,
+        embedding: Embedding,
+        collection: str = "documents",
+        top_k: int = 5,
+        mode: SearchMode = "vector",
+        query_text: str | None = None,
+        tuning: SearchTuning | None = None,
+    ) -> Candidates: ...
+
+    async def search_batch(
+        self,
+        embeddings: Sequence[Embedding],
+        collection: str = "documents",
+        top_k: int | Sequence[int] = 5,
+        tuning: SearchTuning | None = None,
+    ) -> list[list[Document]]: ...
+
+    async def upsert(
+        self,
+        records: RecordSource,
+        collection: str = "documents",
+        batch_size: int = 1000,
+    ) -> IngestStats: ...
+
+    async def delete(self, ids: Sequence[str | UUID], collection: str = "documents") -> int: ...
+
+
+class PgVectorStore:
+    """``VectorStore`` over Supabase pgvector."""
+
+    async def search(
+        self,
+        embedding: Embedding,
+        collection: str = "documents",
+        top_k: int = 5,
+        mode: SearchMode = "vector",
+        query_text: str | None = None,
+        tuning: SearchTuning | None = None,
+    ) -> list[Document]:
+        return await search_vectors(embedding, collection, top_k, mode, query_text, tuning)
+
+    async def search_candidates(
+        self,
+        embedding: Embedding,
+        collection: str = "documents",
+        top_k: int = 5,
+        mode: SearchMode = "vector",
+        query_text: str | None = None,
+        tuning: SearchTuning | None = None,
+    ) -> Candidates:
+        return await search_candidates(embedding, collection, top_k, mode, query_text, tuning)
+
+    async def search_batch(
+        self,
+        embeddings: Sequence[Embedding],
+        collection: str = "documents",
+        top_k: int | Sequence[int] = 5,
+        tuning: SearchTuning | None = None,
+    ) -> list[list[Document]]:
+        return await search_vectors_batch(embeddings, collection, top_k, tuning)
+
+    async def upsert(
+        self,
+        records: RecordSource,
+        collection: str = "documents",
+        batch_size: int = 1000,
+    ) -> IngestStats:
+        return await bulk_upsert_vectors(records, collection, batch_size)
+
+    async def delete(self, ids: Sequence[str | UUID], collection: str = "documents") -> int:
+        return await delete_vectors(ids, collection)
+
+
+@lru_cache(maxsize=1)
+def get_vector_store() -> VectorStore:
+    """Create and cache the configured vector store backend."""
+    if settings.vector_store_backend == "local":
+        from app.services.local_index import LocalVectorStore
+
+        return LocalVectorStore(
+            settings.local_index_dir,
+            nprobe=settings.local_index_nprobe,
+            train_threshold=settings.local_index_train_threshold,
+        )
+    return PgVectorStore()
@@ -0,0 +1,133 @@
+"""Startup benchmark: import time, lifespan startup and first-request cost.
+
+Each run is a fresh interpreter, so every phase is measured cold:
+
+- import: ``import app.main``
+- startup: the app lifespan up to serving (includes ``startup_warmup``)
+- first request: a ``GET /health`` through the ASGI app
+- first agent run: what the first /chat or /rag request builds before its
+  first provider call (compiled graphs, model clients, provider SDKs)
+
+Their sum is the time until a new replica can answer its first real request.
+
+Usage:
+    uv run python -m benchmarks.bench_startup                 # cold, 5 runs
+    uv run python -m benchmarks.bench_startup --compare       # cold vs startup_warmup
+    uv run python -m benchmarks.bench_startup --runs 10 --importtime 15
+
+Point ``SUPABASE_DB_URL`` at a reachable Postgres when warming up; otherwise
+the warmup waits ``DB_POOL_TIMEOUT`` for connections that never come.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PHASES = ("import", "startup", "first request", "first agent run")
+
+
+async def _serve_first_request(timings: dict[str, float]) -> None:
+    from httpx import ASGITransport, AsyncClient
+
+    from app.agents.chat_agent import get_chat_agent
+    from app.agents.rag_agent import get_rag_agent
+    from app.main import app
+    from app.services.llm import DEFAULT_CHAT_MODEL, get_scheduled_model
+    from app.services.llm_scheduler import provider_errors
+
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["startup"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/health")
+            response.raise_for_status()
+        timings["first request"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        get_chat_agent()
+        get_rag_agent()
+        get_scheduled_model(DEFAULT_CHAT_MODEL)
+        provider_errors()
+        timings["first agent run"] = time.perf_counter() - started
+
+
+def child() -> None:
+    """One cold start; prints the phase timings as JSON on the last line."""
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    import app.main  # noqa: F401
+
+    timings["import"] = time.perf_counter() - started
+    asyncio.run(_serve_first_request(timings))
+    print(json.dumps(timings))
+
+
+def _cold_start(warmup: bool) -> dict[str, float]:
+    env = {**os.environ, "STARTUP_WARMUP": "true" if warmup else "false"}
+    output = subprocess.run(  # noqa: S603 - runs this module with the current interpreter
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_startup(runs: int, warmup: bool) -> None:
+    samples = [_cold_start(warmup) for _ in range(runs)]
+    print(f"{'startup_warmup=' + str(warmup).lower():<22}{'median ms':>12}{'min ms':>10}")
+    for phase in (*PHASES, "total"):
+        values = [sum(s[p] for p in PHASES) if phase == "total" else s[phase] for s in samples]
+        print(f"  {phase:<20}{statistics.median(values) * 1e3:>12.0f}{min(values) * 1e3:>10.0f}")
+
+
+def show_importtime(top: int) -> None:
+    """The modules that dominate ``import app.main``, by cumulative time."""
+    stderr = subprocess.run(  # noqa: S603 - runs the current interpreter
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        rows.append((int(cumulative), module.rstrip()))
+    print(f"\nSlowest imports under app.main (cumulative ms, {top} shown)")
+    for cumulative, module in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1e3:>10.0f}  {module}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--compare", action="store_true", help="also run with startup_warmup")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="top N imports")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+    bench_startup(args.runs, warmup=False)
+    if args.compare:
+        bench_startup(args.runs, warmup=True)
+    if args.importtime:
+        show_importtime(args.importtime)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Microbenchmark: text-literal vs binary pgvector encoding for query embeddings.
+
+Compares the old path (``str()`` every float, bind the ``'[...]'`` literal twice
+with ``%s::vector``) against the binary path (float32 array, bound once via the
+pgvector binary dumper).
+
+Usage:
+    uv run python -m benchmarks.bench_vector_encoding            # encoding only
+    uv run python -m benchmarks.bench_vector_encoding --db       # + round-trips
+    uv run python -m benchmarks.bench_vector_encoding --dim 3072 --collection docs
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import time
+import timeit
+
+import numpy as np
+from pgvector import Vector
+
+from app.services.vector_store import as_vector
+
+
+def _text_literal(embedding: list[float]) -> bytes:
+    return f"[{','.join(str(x) for x in embedding)}]".encode()
+
+
+def bench_encoding(dim: int, number: int) -> None:
+    rng = np.random.default_rng(0)
+    raw = rng.standard_normal(dim).astype(np.float32)
+    as_list = raw.tolist()
+    as_b64 = base64.b64encode(raw.tobytes())
+
+    def text_path() -> int:
+        # Old path: the literal is formatted once and sent twice per query.
+        literal = _text_literal(as_list)
+        return 2 * len(literal)
+
+    def binary_from_list() -> int:
+        return len(Vector._to_db_binary(as_vector(as_list)))
+
+    def binary_end_to_end() -> int:
+        # base64 API response -> float32 buffer -> wire, no Python floats.
+        vector = np.frombuffer(base64.b64decode(as_b64), dtype=np.float32)
+        return len(Vector._to_db_binary(vector))
+
+    print(f"Encoding a {dim}-dim query vector ({number} iterations)")
+    print(f"{'path':<24}{'µs/query':>12}{'bytes on wire':>16}")
+    for name, fn in [
+        ("text literal x2", text_path),
+        ("binary from list", binary_from_list),
+        ("binary end-to-end", binary_end_to_end),
+    ]:
+        seconds = timeit.timeit(fn, number=number)
+        print(f"{name:<24}{seconds / number * 1e6:>12.1f}{fn():>16}")
+
+
+async def bench_db(dim: int, collection: str, number: int) -> None:
+    from app.core.database import close_pool, get_pool, open_pool
+
+    rng = np.random.default_rng(1)
+    raw = rng.standard_normal(dim).astype(np.float32)
+    text_query = f"""
+        SELECT content, metadata, 1 - (embedding <=> %s::vector) AS similarity
+        FROM {collection}
+        ORDER BY embedding <=> %s::vector
+        LIMIT 5
+    """
+    binary_query = f"""
+        SELECT content, metadata, embedding <=> %b AS distance
+        FROM {collection}
+        ORDER BY distance
+        LIMIT 5
+    """
+
+    def text_params() -> tuple:
+        literal = _text_literal(raw.tolist()).decode()
+        return (literal, literal)
+
+    def binary_params() -> tuple:
+        return (as_vector(raw),)
+
+    await open_pool()
+    try:
+        async with get_pool().connection() as conn:
+            for name, query, make_params in [
+                ("text literal x2", text_query, text_params),
+                ("binary", binary_query, binary_params),
+            ]:
+                started = time.perf_counter()
+                for _ in range(number):
+                    await (await conn.execute(query, make_params())).fetchall()
+                elapsed = time.perf_counter() - started
+                print(f"{name:<24}{elapsed / number * 1e3:>12.2f} ms/query")
+    finally:
+        await close_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--db", action="store_true", help="also time queries against Postgres")
+    parser.add_argument("--collection", default="documents")
+    args = parser.parse_args()
+
+    bench_encoding(args.dim, args.number)
+    if args.db:
+        print(f"\nRound-trips against {args.collection}")
+        asyncio.run(bench_db(args.dim, args.collection, max(args.number // 10, 1)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Tests for admission control and backpressure."""
+
+import asyncio
+
+import pytest
+
+from app.core.admission import AdmissionController, Overloaded
+
+
+async def _queued(controller, key, lane, order, timeout=None):
+    slot = await controller.acquire(key, lane, timeout)
+    order.append(key)
+    return slot
+
+
+@pytest.mark.asyncio
+async def test_interactive_lane_is_served_before_batch():
+    controller = AdmissionController(max_concurrent=1)
+    held = await controller.acquire("a")
+    order = []
+    batch = asyncio.create_task(_queued(controller, "batch", "batch", order))
+    interactive = asyncio.create_task(_queued(controller, "live", "interactive", order))
+    await asyncio.sleep(0)
+
+    held.release()
+    (await interactive).release()
+    await batch
+
+    assert order == ["live", "batch"]
+
+
+@pytest.mark.asyncio
+async def test_per_key_limits_reject_with_429_without_blocking_other_keys():
+    controller = AdmissionController(per_key_concurrent=1, per_key_queue=1)
+    await controller.acquire("a")
+    waiting = asyncio.create_task(controller.acquire("a"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(Overloaded) as exc:
+        await controller.acquire("a")
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+    await controller.acquire("b")  # another key starts immediately
+    waiting.cancel()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_sheds_lower_lanes_then_rejects_fast():
+    controller = AdmissionController(max_concurrent=1, queue_size=1)
+    await controller.acquire("a")
+    batch = asyncio.create_task(controller.acquire("b", "batch"))
+    await asyncio.sleep(0)
+
+    interactive = asyncio.create_task(controller.acquire("c", "interactive"))
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded) as displaced:
+        await batch
+    with pytest.raises(Overloaded) as full:
+        await controller.acquire("d", "standard")
+
+    assert displaced.value.status_code == full.value.status_code == 503
+    interactive.cancel()
+
+
+@pytest.mark.asyncio
+async def test_queue_deadline_returns_503():
+    controller = AdmissionController(max_concurrent=1)
+    await controller.acquire("a")
+
+    with pytest.raises(Overloaded) as exc:
+        await controller.acquire("b", timeout=0.01)
+
+    assert exc.value.status_code == 503
+    assert controller.waiting == 0
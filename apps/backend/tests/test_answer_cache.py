@@ -0,0 +1,100 @@
+"""Tests for the semantic answer cache."""
+
+import numpy as np
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.core.config import settings
+from app.main import app
+from app.routers import chat
+from app.services.answer_cache import SemanticAnswerCache, make_scope
+
+
+def _vec(*values: float) -> np.ndarray:
+    return np.array(values, dtype=np.float32)
+
+
+def test_hit_requires_similarity_above_threshold():
+    """Near-identical queries hit; unrelated ones miss."""
+    cache = SemanticAnswerCache(threshold=0.95)
+    scope = make_scope("rag", collection="docs", model="gpt-4o")
+    cache.store(scope, _vec(1, 0, 0), "answer")
+
+    assert cache.lookup(scope, _vec(0.99, 0.05, 0)) == "answer"
+    assert cache.lookup(scope, _vec(0, 1, 0)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_scopes_are_isolated():
+    """Answers never cross collection, model or system prompt boundaries."""
+    cache = SemanticAnswerCache()
+    cache.store(make_scope("rag", collection="a", model="gpt-4o"), _vec(1, 0), "a")
+
+    assert cache.lookup(make_scope("rag", collection="b", model="gpt-4o"), _vec(1, 0)) is None
+    assert cache.lookup(make_scope("rag", collection="a", model="mini"), _vec(1, 0)) is None
+    other_prompt = make_scope("rag", collection="a", model="gpt-4o", system_prompt="x")
+    assert cache.lookup(other_prompt, _vec(1, 0)) is None
+
+
+def test_size_cap_evicts_least_recently_used():
+    """The cache stays within maxsize, evicting the least recently used answer."""
+    cache = SemanticAnswerCache(maxsize=2)
+    scope = make_scope("chat")
+    cache.store(scope, _vec(1, 0, 0), "x")
+    cache.store(scope, _vec(0, 1, 0), "y")
+    assert cache.lookup(scope, _vec(1, 0, 0)) == "x"
+    cache.store(scope, _vec(0, 0, 1), "z")
+
+    assert len(cache) == 2
+    assert cache.lookup(scope, _vec(0, 1, 0)) is None
+    assert cache.lookup(scope, _vec(1, 0, 0)) == "x"
+
+
+def test_invalidate_collection_only_drops_that_collection():
+    """Writing to a collection drops its RAG answers and nothing else."""
+    cache = SemanticAnswerCache()
+    cache.store(make_scope("rag", collection="docs"), _vec(1, 0), "stale")
+    cache.store(make_scope("rag", collection="other"), _vec(1, 0), "fresh")
+    cache.store(make_scope("chat"), _vec(1, 0), "chat")
+
+    assert cache.invalidate_collection("docs") == 1
+    assert cache.lookup(make_scope("rag", collection="docs"), _vec(1, 0)) is None
+    assert cache.lookup(make_scope("rag", collection="other"), _vec(1, 0)) == "fresh"
+    assert cache.lookup(make_scope("chat"), _vec(1, 0)) == "chat"
+
+
+@pytest.mark.asyncio
+async def test_chat_cache_keys_on_exact_history_and_skips_tool_answers(monkeypatch):
+    calls = []
+
+    async def fake_agent(messages, **kwargs):
+        calls.append(messages)
+        tools = ["get_current_time"] if "time" in messages[-1]["content"] else []
+        return {"content": f"answer {len(calls)}", "tools": tools}
+
+    async def fake_embed(text):
+        return _vec(1, 0)  # every last message looks the same
+
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+    monkeypatch.setattr(settings, "answer_cache_chat_enabled", True)
+    monkeypatch.setattr(chat, "run_chat_agent", fake_agent)
+    monkeypatch.setattr(chat, "embed_query", fake_embed)
+    cache = SemanticAnswerCache()
+    monkeypatch.setattr(chat, "get_answer_cache", lambda: cache)
+
+    async def ask(*contents, **params):
+        roles = ["user", "assistant"] * len(contents)
+        messages = [{"role": r, "content": c} for r, c in zip(roles, contents, strict=False)]
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/api/v1/chat", json={"messages": messages, **params})
+        return response.headers["X-Cache"], response.json()["content"]
+
+    assert await ask("delete my file?", "sure?", "yes") == ("MISS", "answer 1")
+    assert await ask("delete my file?", "sure?", "yes") == ("HIT", "answer 1")
+    # A completion cut short under a small max_tokens is not served to larger requests.
+    turns = ("delete my file?", "sure?", "yes")
+    assert await ask(*turns, max_tokens=16) == ("MISS", "answer 2")
+    assert await ask(*turns, history_max_tokens=500) == ("MISS", "answer 3")
+    assert await ask("keep my file?", "sure?", "yes") == ("MISS", "answer 4")
+    assert await ask("what time is it") == ("MISS", "answer 5")
+    assert await ask("what time is it") == ("MISS", "answer 6")
@@ -0,0 +1,66 @@
+"""Tests for the chat agent's event streaming."""
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.agents import chat_agent
+from app.services.history import HistoryCompactor
+from app.services.tokens import TokenCounter
+
+
+class WordEncoding:
+    name = "words"
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+class BlockStreamingModel(BaseChatModel):
+    """Streams list-of-blocks content, like ChatAnthropic with tools bound."""
+
+    @property
+    def _llm_type(self):
+        return "blocks"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(content=[{"type": "text", "text": "Hello there"}])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for text in ("Hello", " there"):
+            chunk = AIMessageChunk(content=[{"type": "text", "text": text, "index": 0}])
+            yield ChatGenerationChunk(message=chunk)
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_text_from_list_content_chunks(monkeypatch):
+    monkeypatch.setattr(chat_agent, "_agent_llm", lambda *args: BlockStreamingModel())
+    monkeypatch.setattr(
+        chat_agent,
+        "get_history_compactor",
+        lambda model: HistoryCompactor(TokenCounter(WordEncoding())),
+    )
+
+    events = [
+        event async for event in chat_agent.stream_chat_agent([{"role": "user", "content": "hi"}])
+    ]
+
+    assert [e["content"] for e in events if e["type"] == "token"] == ["Hello", " there"]
+    result = await chat_agent.run_chat_agent([{"role": "user", "content": "hi"}])
+    assert result == {"content": "Hello there", "tools": []}
+
+
+@pytest.mark.asyncio
+async def test_tool_binding_follows_the_registry_after_clients_close():
+    from app.services.llm import close_llm_clients, get_scheduled_model
+
+    bound = chat_agent._agent_llm("gpt-4o-mini", 0.7, None)
+    assert chat_agent._agent_llm("gpt-4o-mini", 0.7, None) is bound
+
+    await close_llm_clients()
+
+    rebound = chat_agent._agent_llm("gpt-4o-mini", 0.7, None)
+    assert rebound is not bound
+    assert rebound.bound is get_scheduled_model(model="gpt-4o-mini", temperature=0.7)
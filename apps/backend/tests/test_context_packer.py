@@ -0,0 +1,70 @@
+"""Tests for token-budgeted RAG context packing."""
+
+from langchain_core.documents import Document
+
+from app.services.context_packer import ContextPacker
+from app.services.tokens import TokenCounter
+
+
+class WordEncoding:
+    """One token per whitespace-separated word; avoids downloading BPE files."""
+
+    name = "words"
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+def _packer(budget):
+    return ContextPacker(TokenCounter(WordEncoding()), budget)
+
+
+def _doc(text, source="a"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_packs_in_order_within_budget_and_truncates_at_sentences():
+    docs = [
+        _doc("First chunk is short."),
+        _doc("One two three. Four five six. Seven eight nine ten eleven."),
+        _doc("Never reached at all because the budget is spent."),
+    ]
+    packed = _packer(budget=16).pack(docs)
+
+    assert packed.tokens <= 16
+    assert [d.page_content for d in packed.documents] == [
+        "First chunk is short.",
+        "One two three. Four five six.",
+    ]
+    assert packed.documents[1].metadata["truncated"] is True
+    assert (packed.truncated, packed.skipped) == (1, 1)
+    assert packed.text.startswith("Source: a\nFirst chunk is short.")
+
+
+def test_dedupes_repeated_and_overlapping_chunks():
+    shared = "the overlapping window shared by two neighbouring chunks goes here."
+    docs = [
+        _doc(f"Start of the document. {shared}"),
+        _doc(f"Start of the document. {shared}"),
+        _doc(f"{shared} And then the second chunk continues."),
+    ]
+    packed = _packer(budget=1000).pack(docs)
+
+    assert [d.page_content for d in packed.documents] == [
+        f"Start of the document. {shared}",
+        "And then the second chunk continues.",
+    ]
+    assert packed.skipped == 1
+
+
+def test_token_counts_are_cached():
+    calls = []
+
+    class CountingEncoding(WordEncoding):
+        def encode_ordinary(self, text):
+            calls.append(text)
+            return super().encode_ordinary(text)
+
+    counter = TokenCounter(CountingEncoding())
+    assert counter.count("a b c") == counter.count("a b c") == 3
+    assert calls == ["a b c"]
@@ -0,0 +1,96 @@
+"""Tests for the query-embedding cache."""
+
+import numpy as np
+import pytest
+
+from app.services import embedding_cache
+from app.services.embedding_cache import (
+    LRUEmbeddingCache,
+    TieredEmbeddingCache,
+    make_key,
+    normalize_query,
+)
+
+
+def test_normalize_query_collapses_case_and_whitespace():
+    """Trivially different queries should share a cache key."""
+    assert normalize_query("  What is   RAG?\n") == normalize_query("what is rag?")
+    assert make_key("m1", "hi") != make_key("m2", "hi")
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_least_recently_used():
+    """The LRU tier should stay bounded and keep recently read keys."""
+    cache = LRUEmbeddingCache(maxsize=2)
+    a, b, c = (make_key("m", t) for t in "abc")
+    await cache.set(a, np.zeros(3, dtype=np.float32))
+    await cache.set(b, np.ones(3, dtype=np.float32))
+    assert await cache.get(a) is not None
+    await cache.set(c, np.ones(3, dtype=np.float32))
+
+    assert len(cache) == 2
+    assert await cache.get(b) is None
+    assert await cache.get(a) is not None
+
+
+@pytest.mark.asyncio
+async def test_lru_expires_entries(monkeypatch):
+    """Entries older than the TTL should be treated as misses."""
+    now = 1000.0
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now)
+    cache = LRUEmbeddingCache(ttl=10)
+    key = make_key("m", "q")
+    await cache.set(key, np.zeros(3, dtype=np.float32))
+
+    now = 1011.0
+    assert await cache.get(key) is None
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_promotes_l2_hits_and_counts():
+    """L2 hits should be copied into L1 and counted separately from misses."""
+    l1, l2 = LRUEmbeddingCache(), LRUEmbeddingCache()
+    cache = TieredEmbeddingCache(l1, l2)
+    key = make_key("m", "q")
+    await l2.set(key, np.ones(3, dtype=np.float32))
+
+    assert await cache.get(make_key("m", "other")) is None
+    assert await cache.get(key) is not None
+    assert await cache.get(key) is not None
+
+    assert (cache.stats.hits, cache.stats.l2_hits, cache.stats.misses) == (1, 1, 1)
+    assert cache.stats.hit_rate == pytest.approx(2 / 3)
+
+
+class CountingCache(LRUEmbeddingCache):
+    """LRU tier that counts batch calls, standing in for one DB round-trip each."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    async def get_many(self, keys):
+        self.calls += 1
+        return await super().get_many(keys)
+
+    async def set_many(self, items):
+        self.calls += 1
+        await super().set_many(items)
+
+
+@pytest.mark.asyncio
+async def test_tiered_batch_lookup_makes_one_l2_call_each_way():
+    """A batch reads the L2 once for all L1 misses and writes its misses back once."""
+    l2 = CountingCache()
+    cache = TieredEmbeddingCache(LRUEmbeddingCache(), l2)
+    keys = [make_key("m", t) for t in "abcd"]
+    await l2.set(keys[1], np.ones(3, dtype=np.float32))
+    await cache.l1.set(keys[0], np.zeros(3, dtype=np.float32))
+
+    vectors = await cache.get_many(keys)
+    await cache.set_many([(keys[2], np.ones(3, dtype=np.float32))])
+
+    assert [v is not None for v in vectors] == [True, True, False, False]
+    assert l2.calls == 2
+    assert (cache.stats.hits, cache.stats.l2_hits, cache.stats.misses) == (1, 1, 2)
+    assert await cache.l1.get(keys[1]) is not None
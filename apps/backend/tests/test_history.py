@@ -0,0 +1,68 @@
+"""Tests for token-budgeted chat history compaction."""
+
+import pytest
+from langchain_core.messages import SystemMessage
+
+from app.services.history import MESSAGE_OVERHEAD_TOKENS, HistoryCompactor, SummaryCache
+from app.services.tokens import TokenCounter
+
+
+class WordEncoding:
+    name = "words"
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+def _conversation(turns):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "word " * 8}
+        for i in range(turns)
+    ]
+
+
+def _compactor(calls):
+    async def summarizer(previous, turns):
+        calls.append((previous, [t["content"].split()[1] for t in turns]))
+        return f"summary through {turns[-1]['content'].split()[1]}"
+
+    return HistoryCompactor(
+        TokenCounter(WordEncoding()), summarizer, SummaryCache(), summary_max_tokens=10
+    )
+
+
+@pytest.mark.asyncio
+async def test_short_history_is_passed_through():
+    calls = []
+    messages = await _compactor(calls).compact(_conversation(3), "system", budget=1000)
+
+    assert len(messages) == 4
+    assert messages[0].content == "system"
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_older_turns_fold_into_cached_rolling_summary():
+    calls = []
+    compactor = _compactor(calls)
+    per_message = 10 + MESSAGE_OVERHEAD_TOKENS
+    budget = 1 + MESSAGE_OVERHEAD_TOKENS + 10 + 6 * per_message
+
+    conversation = _conversation(12)
+    first = await compactor.compact(conversation, "system", budget)
+    assert isinstance(first[0], SystemMessage)
+    assert "summary through" in first[0].content
+    assert first[1].content.startswith("message")
+    assert len(calls) == 1
+
+    # The next turns reuse the cached summary without another LLM call...
+    for n in (13, 14):
+        await compactor.compact(_conversation(n), "system", budget)
+    assert len(calls) == 1
+
+    # ...until they overflow; then only the newly folded turns are summarized.
+    await compactor.compact(_conversation(20), "system", budget)
+    assert len(calls) == 2
+    previous, folded = calls[1]
+    assert previous.startswith("summary through")
+    assert folded[0] == str(len(calls[0][1]))
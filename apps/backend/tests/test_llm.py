@@ -0,0 +1,43 @@
+"""Tests for the chat model registry."""
+
+from langchain_anthropic import ChatAnthropic
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+from app.services.llm import (
+    get_async_http_client,
+    get_chat_model,
+    get_scheduled_model,
+    resolve_provider,
+)
+
+
+def test_models_are_cached_per_settings():
+    """Same settings reuse one client; different settings get their own."""
+    a = get_chat_model(model="gpt-4o-mini", temperature=0.2)
+    assert get_chat_model(model="gpt-4o-mini", temperature=0.2) is a
+    assert get_chat_model(model="gpt-4o-mini", temperature=0.9) is not a
+    assert isinstance(a, ChatOpenAI)
+    assert a.http_async_client is get_async_http_client()
+
+
+def test_provider_is_inferred_from_model_name():
+    """Claude models route to Anthropic, everything else to OpenAI."""
+    assert resolve_provider("claude-3-5-haiku-latest") == "anthropic"
+    assert resolve_provider("gpt-4o") == "openai"
+    assert isinstance(get_chat_model(model="claude-3-5-haiku-latest"), ChatAnthropic)
+
+
+def test_failover_candidate_gets_parameters_its_provider_accepts(monkeypatch):
+    """An OpenAI request that Anthropic would reject still has a usable failover."""
+    monkeypatch.setattr(settings, "llm_scheduler_enabled", True)
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+    monkeypatch.setattr(settings, "anthropic_api_key", "sk-ant-test")
+
+    model = get_scheduled_model("gpt-4o", temperature=1.5, max_tokens=100_000)
+    primary, failover = model.candidates
+
+    assert (primary.llm.temperature, primary.max_tokens) == (1.5, 100_000)
+    assert failover.model == "claude-sonnet-4-5"
+    assert (failover.llm.temperature, failover.llm.max_tokens) == (1.0, 64_000)
+    assert failover.max_tokens == 64_000
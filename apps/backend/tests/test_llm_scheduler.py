@@ -0,0 +1,153 @@
+"""Tests for rate-limit-aware scheduling and provider failover."""
+
+import asyncio
+
+import httpx
+import openai
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.core.config import settings
+from app.services import llm_scheduler
+from app.services.llm_scheduler import (
+    Candidate,
+    ProviderScheduler,
+    ProviderThrottledError,
+    ScheduledChatModel,
+)
+from app.services.tokens import TokenCounter
+
+
+class WordEncoding:
+    name = "words"
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _rate_limited(retry_after="30"):
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class FakeModel(BaseChatModel):
+    """Raises 429 for the first ``fail`` calls, then answers ``reply``."""
+
+    reply: str = "ok"
+    fail: int = 0
+    calls: int = 0
+    delay: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.calls <= self.fail:
+            raise _rate_limited()
+        headers = {"x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "10"}
+        message = AIMessage(content=self.reply)
+        return ChatResult(
+            generations=[ChatGeneration(message=message, generation_info={"headers": headers})]
+        )
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for word in self.reply.split():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    clock = FakeClock()
+    scheduler = ProviderScheduler(backoff_base=0.0, clock=clock)
+    monkeypatch.setattr(llm_scheduler, "get_provider_scheduler", lambda: scheduler)
+    monkeypatch.setattr(
+        llm_scheduler, "get_token_counter", lambda model: TokenCounter(WordEncoding())
+    )
+    return scheduler
+
+
+@pytest.mark.asyncio
+async def test_quota_waits_then_refuses_beyond_max_wait():
+    clock = FakeClock()
+    scheduler = ProviderScheduler({"openai:m": [60, 1000]}, clock=clock)
+
+    assert await scheduler.reserve("openai", "m", 600, max_wait=0)
+    # 900 more tokens needs 500 beyond the 400 left: 30s at 1000 TPM.
+    assert scheduler.quota("openai", "m").wait_time(900) == pytest.approx(30)
+    assert not await scheduler.reserve("openai", "m", 900, max_wait=10)
+
+    scheduler.settle("openai", "m", reserved=600, used=100)
+    assert scheduler.quota("openai", "m").wait_time(900) == 0
+
+
+@pytest.mark.asyncio
+async def test_429_fails_over_and_blocks_the_throttled_model(scheduler):
+    primary = FakeModel(reply="primary", fail=1)
+    backup = FakeModel(reply="backup")
+    llm = ScheduledChatModel(
+        candidates=[Candidate("openai", "a", primary), Candidate("anthropic", "b", backup)]
+    )
+
+    first = await llm.ainvoke([HumanMessage(content="hello")])
+    second = await llm.ainvoke([HumanMessage(content="hello")])
+
+    assert first.content == second.content == "backup"
+    assert primary.calls == 1  # blocked for its Retry-After, so skipped the second time
+    assert "headers" not in first.response_metadata
+    # Headers cut the backup's allowance to 10; the second call then took one.
+    assert scheduler.quota("anthropic", "b").requests.level == 9
+
+
+@pytest.mark.asyncio
+async def test_persistent_throttling_raises_with_retry_hint(scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "llm_max_retries", 1)
+    monkeypatch.setattr(settings, "llm_max_quota_wait", 1.0)
+    model = FakeModel(fail=10)
+    llm = ScheduledChatModel(candidates=[Candidate("openai", "a", model)])
+
+    with pytest.raises(ProviderThrottledError) as exc:
+        await llm.ainvoke([HumanMessage(content="hello")])
+
+    assert model.calls == 1  # the retry found the model blocked instead of calling it
+    assert exc.value.retry_after == 30
+
+
+@pytest.mark.asyncio
+async def test_losing_hedge_and_closed_stream_return_their_allowance(scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_after", 0.01)
+    scheduler.limits = {"openai:a": [0, 10_000], "anthropic:b": [0, 10_000]}
+    primary = FakeModel(reply="slow", delay=5)
+    backup = FakeModel(reply="fast reply")
+    candidates = [
+        Candidate("openai", "a", primary, max_tokens=1000),
+        Candidate("anthropic", "b", backup, max_tokens=1000),
+    ]
+    llm = ScheduledChatModel(candidates=candidates)
+    messages = [HumanMessage(content="hello")]
+    prompt = candidates[0].estimate_tokens(messages) - 1000
+
+    assert (await llm.ainvoke(messages)).content == "fast reply"
+    await asyncio.sleep(0)  # let the cancelled primary settle
+    assert scheduler.quota("openai", "a").tokens.level == 10_000 - prompt
+
+    stream = llm.astream(messages)
+    await anext(stream)
+    await stream.aclose()
+    assert scheduler.quota("openai", "a").tokens.level == 10_000 - 2 * prompt
@@ -0,0 +1,136 @@
+"""Tests for the embedded IVF vector index."""
+
+import builtins
+
+import numpy as np
+import pytest
+
+from app.services import local_index
+from app.services.local_index import IVFIndex
+
+
+def _corpus(n: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def _add(index: IVFIndex, vectors: np.ndarray, start: int = 0) -> None:
+    ids = [f"doc-{start + i}" for i in range(len(vectors))]
+    index.add(ids, [f"text {i}" for i in ids], [{"n": i} for i in range(len(ids))], vectors)
+
+
+def test_exact_search_returns_nearest_rows(tmp_path):
+    """Below the training threshold search is an exact cosine scan."""
+    vectors = _corpus(200)
+    index = IVFIndex(tmp_path / "docs")
+    _add(index, vectors)
+
+    [[(row, score), *_]] = index.search(vectors[42], top_k=3)
+    assert row == 42
+    assert score > 0.999
+    assert index.document(row)["id"] == "doc-42"
+
+
+def test_upsert_and_delete_tombstone_old_rows(tmp_path):
+    """Re-adding an id replaces it; deleted ids never come back from search."""
+    vectors = _corpus(50)
+    index = IVFIndex(tmp_path / "docs")
+    _add(index, vectors)
+
+    index.add(["doc-7"], ["replaced"], [{}], vectors[8:9])
+    assert len(index) == 50
+    hits = index.search(vectors[8], top_k=2)[0]
+    assert {index.document(r)["id"] for r, _ in hits} == {"doc-7", "doc-8"}
+
+    assert index.delete(["doc-8", "missing"]) == 1
+    assert all(index.document(r)["id"] != "doc-8" for r, _ in index.search(vectors[8], top_k=50)[0])
+
+
+def test_reopen_maps_existing_files_and_sees_new_writes(tmp_path):
+    """A second handle (another worker) loads from disk and refreshes on writes."""
+    vectors = _corpus(30)
+    writer = IVFIndex(tmp_path / "docs")
+    _add(writer, vectors[:20])
+
+    reader = IVFIndex(tmp_path / "docs")
+    assert len(reader) == 20
+
+    _add(writer, vectors[20:], start=20)
+    writer.delete(["doc-0"])
+    assert len(reader.search(vectors[25], top_k=30)[0]) == 29
+
+
+def test_ivf_recall_after_training(tmp_path):
+    """Once trained, probing a few lists still finds the true neighbours."""
+    vectors = _corpus(2000, dim=32)
+    index = IVFIndex(tmp_path / "docs", train_threshold=1000)
+    _add(index, vectors)
+    assert index._snapshot.order is not None
+
+    queries = vectors[:50] + 0.05 * _corpus(50, dim=32, seed=1)
+    found = index.search(queries, top_k=1, nprobe=8)
+    recall = np.mean([hits[0][0] == i for i, hits in enumerate(found)])
+    assert recall >= 0.9
+
+    index.rebuild()
+    assert len(index) == 2000
+    assert index.search(vectors[5], top_k=1)[0][0][0] == 5
+
+
+def test_failed_add_loses_nothing_and_later_rows_stay_aligned(tmp_path, monkeypatch):
+    """An add that dies mid-append keeps the old rows, and its bytes are cut off."""
+    vectors = _corpus(12)
+    index = IVFIndex(tmp_path / "docs")
+    _add(index, vectors[:10])
+
+    files = []
+
+    def failing_open(path, mode="r", *args, **kwargs):
+        files.append(path)
+        if len(files) == 3:  # docs and vectors appended, then the disk fills up
+            raise OSError("No space left on device")
+        return builtins.open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(local_index, "open", failing_open, raising=False)
+    with pytest.raises(OSError):
+        index.add(["doc-3"], ["replaced"], [{}], vectors[10:11])
+    monkeypatch.undo()
+
+    [[(row, _)]] = index.search(vectors[3], top_k=1)
+    assert index.document(row)["id"] == "doc-3"
+
+    index.add(["doc-11"], ["new"], [{}], vectors[11:12])
+    [[(row, score)]] = index.search(vectors[11], top_k=1)
+    assert score > 0.999
+    assert index.document(row) == {"id": "doc-11", "content": "new", "metadata": {}}
+    reopened = IVFIndex(tmp_path / "docs")
+    assert reopened.document(10)["id"] == "doc-11"
+
+    with pytest.raises(ValueError, match="2 ids"):
+        index.add(["a", "b"], ["a", "b"], [{}, {}], vectors[:1])
+
+
+def test_update_publishes_before_tombstoning_and_reuses_the_docs_handle(tmp_path, monkeypatch):
+    """An update that dies before its tombstone keeps the id searchable, then self-repairs."""
+    vectors = _corpus(6)
+    index = IVFIndex(tmp_path / "docs")
+    _add(index, vectors[:5])
+    docs = index._snapshot.docs
+
+    def failing_tombstone(rows):
+        raise OSError("killed")
+
+    monkeypatch.setattr(index, "_tombstone", failing_tombstone)
+    with pytest.raises(OSError):
+        index.add(["doc-2"], ["replaced"], [{}], vectors[5:6])
+    monkeypatch.undo()
+
+    assert index._snapshot.docs is docs
+    [[(row, score)]] = index.search(vectors[5], top_k=1)
+    assert score > 0.999
+    assert index.document(row)["content"] == "replaced"
+    assert index.delete(["doc-2"]) == 1
+    assert len(index) == 4
+    assert all(index.document(r)["id"] != "doc-2" for r, _ in index.search(vectors[2], top_k=6)[0])
+
+    index.rebuild()
+    assert docs.closed
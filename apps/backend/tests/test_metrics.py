@@ -0,0 +1,68 @@
+"""Tests for the Prometheus metrics endpoint and recorders."""
+
+from typing import TypedDict
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, StateGraph
+from prometheus_client import REGISTRY
+
+from app.core.metrics import MetricsCallbackHandler
+from app.main import app
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_labels_http_requests_by_route():
+    labels = {"method": "GET", "route": "/health", "status": "200"}
+    before = _sample("aiforge_http_request_duration_seconds_count", **labels)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.get("/health")
+        await client.get("/no/such/path")
+        response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert _sample("aiforge_http_request_duration_seconds_count", **labels) == before + 1
+    assert 'route="unmatched"' in response.text
+
+
+class State(TypedDict):
+    answer: str
+
+
+@pytest.mark.asyncio
+async def test_callback_handler_times_nodes_and_first_token():
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="hello there")]))
+
+    async def generate(state, config):
+        response = await model.ainvoke("hi", config)
+        return {"answer": response.content}
+
+    graph = StateGraph(State)
+    graph.add_node("generate", generate)
+    graph.set_entry_point("generate")
+    graph.add_edge("generate", END)
+    compiled = graph.compile()
+
+    node_before = _sample("aiforge_graph_node_duration_seconds_count", node="generate", status="ok")
+    ttft_before = _sample("aiforge_llm_time_to_first_token_seconds_count", model="unknown")
+    handler = MetricsCallbackHandler()
+    async for _ in compiled.astream_events({"answer": ""}, {"callbacks": [handler]}, version="v2"):
+        pass
+
+    assert (
+        _sample("aiforge_graph_node_duration_seconds_count", node="generate", status="ok")
+        == node_before + 1
+    )
+    # Streamed: the first token is recorded once, not per token.
+    assert (
+        _sample("aiforge_llm_time_to_first_token_seconds_count", model="unknown") == ttft_before + 1
+    )
+    assert not handler._nodes and not handler._models and not handler._streaming
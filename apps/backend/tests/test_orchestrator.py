@@ -0,0 +1,107 @@
+"""Tests for the parallel fan-out orchestration pattern."""
+
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+from prometheus_client import REGISTRY
+
+from app.agents import orchestrator
+
+
+def _node_runs(node):
+    labels = {"node": node, "status": "ok"}
+    return REGISTRY.get_sample_value("aiforge_graph_node_duration_seconds_count", labels) or 0.0
+
+
+class SlowModel:
+    """Answers after a per-prompt delay; a negative delay raises."""
+
+    def __init__(self, delays, merged):
+        self.delays = delays
+        self.merged = merged
+
+    async def ainvoke(self, messages, config=None):
+        prompt = messages[0].content
+        if prompt == "merge":
+            self.merged.append(messages[1].content)
+            return AIMessage(content="merged")
+        delay = self.delays[prompt]
+        if delay < 0:
+            raise RuntimeError("provider error")
+        await asyncio.sleep(delay)
+        return AIMessage(content=f"{prompt} done")
+
+
+def _agents(names):
+    return [
+        {"name": n, "description": n, "system_prompt": n, "model": "m", "temperature": 0}
+        for n in names
+    ]
+
+
+@pytest.mark.asyncio
+async def test_fan_out_runs_concurrently(monkeypatch):
+    merged = []
+    model = SlowModel({f"a{i}": 0.2 for i in range(5)}, merged)
+    monkeypatch.setattr(orchestrator, "get_scheduled_model", lambda **kwargs: model)
+    graph = orchestrator.create_parallel(_agents([f"a{i}" for i in range(5)]), "merge")
+    merges = _node_runs("merge")
+
+    start = time.perf_counter()
+    result = await graph.ainvoke({"input": "task"})
+
+    assert time.perf_counter() - start < 0.6
+    assert len(result["agent_outputs"]) == 5
+    assert merged[0].startswith("### a0:")
+    # Measured without the caller passing callbacks.
+    assert _node_runs("merge") == merges + 1
+
+
+@pytest.mark.asyncio
+async def test_slow_and_failing_branches_are_dropped(monkeypatch):
+    merged = []
+    model = SlowModel({"fast": 0.01, "slow": 5.0, "broken": -1}, merged)
+    monkeypatch.setattr(orchestrator, "get_scheduled_model", lambda **kwargs: model)
+    graph = orchestrator.create_parallel(_agents(["fast", "slow", "broken"]), "merge", timeout=0.1)
+
+    result = await graph.ainvoke({"input": "task"})
+
+    assert result["agent_outputs"] == {"fast": "fast done"}
+    assert set(result["agent_errors"]) == {"slow", "broken"}
+    assert merged == ["### fast:\nfast done"]
+
+
+def test_factories_reuse_compiled_graphs(monkeypatch):
+    monkeypatch.setattr(orchestrator, "get_graph_cache", lambda: cache)
+    cache = orchestrator.GraphCache(maxsize=2)
+    agents = _agents(["a", "b"])
+    reordered = [dict(reversed(list(a.items()))) for a in agents]
+
+    first = orchestrator.create_parallel(agents, model="m1")
+    assert orchestrator.create_parallel(reordered, model="m1") is first
+    assert orchestrator.create_parallel(agents, model="m2") is not first
+    orchestrator.create_pipeline(agents)  # evicts the m1 graph
+
+    assert orchestrator.create_parallel(agents, model="m1") is not first
+    assert (cache.hits, cache.misses, len(cache)) == (1, 4, 2)
+
+
+def test_concurrency_limit_applies_per_run_on_any_loop(monkeypatch):
+    """The cached graph limits each run on its own, whichever event loop runs it."""
+    model = SlowModel({f"a{i}": 0.1 for i in range(4)}, [])
+    monkeypatch.setattr(orchestrator, "get_scheduled_model", lambda **kwargs: model)
+    graph = orchestrator.create_parallel(
+        _agents([f"a{i}" for i in range(4)]), "merge", max_concurrency=2
+    )
+
+    async def two_runs():
+        start = time.perf_counter()
+        await asyncio.gather(*(graph.ainvoke({"input": "task"}) for _ in range(2)))
+        return time.perf_counter() - start
+
+    for _ in range(2):  # a fresh event loop each time, as under separate tests
+        elapsed = asyncio.run(two_runs())
+        # Two rounds of two branches per run; a shared limit would take four rounds.
+        assert 0.2 <= elapsed < 0.38
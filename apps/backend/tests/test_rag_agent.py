@@ -0,0 +1,50 @@
+"""Tests for the RAG agent's event streaming."""
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from app.agents import rag_agent
+from app.services.tokens import TokenCounter
+
+
+class WordEncoding:
+    name = "words"
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+class FakeStore:
+    async def search(self, **kwargs):
+        return [
+            Document(page_content="RAG retrieves context.", metadata={"n": 0}),
+            Document(page_content="RAG retrieves context.", metadata={"n": 1}),
+        ]
+
+
+@pytest.fixture
+def offline_rag(monkeypatch):
+    async def embed_query(text):
+        return np.ones(3, dtype=np.float32)
+
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="It retrieves")]))
+    monkeypatch.setattr(rag_agent, "embed_query", embed_query)
+    monkeypatch.setattr(rag_agent, "get_vector_store", FakeStore)
+    monkeypatch.setattr(rag_agent, "get_scheduled_model", lambda **kwargs: model)
+    monkeypatch.setattr(rag_agent, "get_token_counter", lambda m: TokenCounter(WordEncoding()))
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_retrieved_sources_then_the_packed_ones(offline_rag):
+    events = [event async for event in rag_agent.stream_rag_query("what is rag?")]
+
+    kinds = [e["type"] for e in events]
+    assert kinds[:2] == ["sources", "sources"]
+    assert kinds[-1] == "done" and set(kinds[2:-1]) == {"token"}
+    # Retrieval found both chunks; packing dropped the duplicate.
+    assert [s["metadata"]["n"] for s in events[0]["sources"]] == [0, 1]
+    assert [s["metadata"]["n"] for s in events[1]["sources"]] == [0]
+    assert "retrieve_ms" in events[-1]["timings"]
@@ -0,0 +1,35 @@
+"""Tests for MMR re-ranking."""
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.rerank import mmr, rerank
+
+
+def test_mmr_skips_near_duplicates():
+    """A near-duplicate of the top hit loses to a relevant but different chunk."""
+    query = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    candidates = np.array(
+        [[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7], [0.0, 1.0, 0.0]],
+        dtype=np.float32,
+    )
+
+    assert mmr(query, candidates, k=2, lambda_mult=0.5) == [0, 2]
+    # Pure relevance keeps the duplicate.
+    assert mmr(query, candidates, k=2, lambda_mult=1.0) == [0, 1]
+    assert len(mmr(query, candidates, k=10)) == 4
+
+
+def test_rerank_uses_scorer_relevance():
+    """Scorer scores drive the first pick and are recorded on the documents."""
+
+    class ReverseScorer:
+        def score(self, query, passages):
+            return [float(i) for i in range(len(passages))]
+
+    docs = [Document(page_content=f"chunk {i}") for i in range(3)]
+    embeddings = np.eye(3, dtype=np.float32)
+
+    ranked = rerank("q", embeddings[0], docs, embeddings, top_k=2, scorer=ReverseScorer())
+    assert ranked[0].page_content == "chunk 2"
+    assert ranked[0].metadata["rerank_score"] == 2.0
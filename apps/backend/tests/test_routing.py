@@ -0,0 +1,95 @@
+"""Tests for the supervisor's cheap routers."""
+
+import numpy as np
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.agents import orchestrator, routing
+
+WORKERS = [
+    {
+        "name": "researcher",
+        "description": "finds facts",
+        "system_prompt": "research",
+        "model": "m",
+        "temperature": 0,
+        "keywords": ["research", "sources"],
+    },
+    {
+        "name": "writer",
+        "description": "writes prose",
+        "system_prompt": "write",
+        "model": "m",
+        "temperature": 0,
+        "keywords": ["draft", "write"],
+    },
+]
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    axes = {"facts": 0, "prose": 1}
+
+    def vector(text):
+        v = np.zeros(2, dtype=np.float32)
+        for word, axis in axes.items():
+            v[axis] += text.count(word)
+        return v + 0.01
+
+    async def embed_texts(texts):
+        return [vector(t) for t in texts]
+
+    async def embed_query(text):
+        return vector(text)
+
+    monkeypatch.setattr(routing, "embed_texts", embed_texts)
+    monkeypatch.setattr(routing, "embed_query", embed_query)
+
+
+@pytest.mark.asyncio
+async def test_rules_router_prefers_most_keyword_hits_then_falls_back(fake_embeddings):
+    router = routing.make_router("rules", WORKERS, "", "m", 5)
+
+    assert (await router.route("Write a draft citing research", [], 0)).worker == "writer"
+    assert (await router.route("Some prose please", [], 0)).worker == "writer"
+    assert (await router.route("Find facts", [], 0)).worker == "researcher"
+    assert (await router.route("Write a draft", [], 1)).worker is None
+
+
+@pytest.mark.asyncio
+async def test_supervisor_records_each_routing_decision(monkeypatch, fake_embeddings):
+    class Model:
+        async def ainvoke(self, messages, config=None):
+            return AIMessage(content=f"{messages[0].content} done")
+
+    monkeypatch.setattr(orchestrator, "get_scheduled_model", lambda **kwargs: Model())
+    monkeypatch.setattr(orchestrator, "get_graph_cache", lambda: orchestrator.GraphCache())
+    graph = orchestrator.create_supervisor(WORKERS, router="embedding")
+
+    result = await graph.ainvoke({"task": "facts", "messages": [], "current_worker": "", "round": 0})
+
+    assert [m.content for m in result["messages"]] == ["research done"]
+    assert [d["worker"] for d in result["routing"]] == ["researcher", None]
+    assert all(d["router"] == "embedding" and d["latency_ms"] >= 0 for d in result["routing"])
+
+
+@pytest.mark.asyncio
+async def test_structured_router_falls_back_when_the_model_returns_no_choice(monkeypatch):
+    class Model:
+        def with_structured_output(self, schema):
+            return self
+
+        async def ainvoke(self, messages, config=None):
+            if messages[0].content.startswith("structured"):
+                return None  # what with_structured_output yields for a refusal
+            return AIMessage(content="writer")
+
+    model = Model()
+    monkeypatch.setattr(routing, "get_scheduled_model", lambda **kwargs: model)
+    router = routing.make_router("structured", WORKERS, "structured", "m", 5)
+    router.fallback.prompt = "llm"
+
+    decision = await router.route("Write a draft", [], 0)
+
+    assert decision.worker == "writer"
+    assert decision.message.content == "writer"
@@ -0,0 +1,79 @@
+"""Tests for the in-memory chat session store."""
+
+import operator
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.graph import StateGraph
+
+from app.services import sessions
+from app.services.sessions import MemorySessionStore
+
+
+class State(TypedDict):
+    turns: Annotated[list[str], operator.add]
+
+
+def _graph(store):
+    graph = StateGraph(State)
+    graph.add_node("echo", lambda state: {})
+    graph.set_entry_point("echo")
+    return graph.compile(checkpointer=store.checkpointer)
+
+
+async def _turn(store, graph, session_id, text):
+    await store.touch(session_id)
+    result = await graph.ainvoke(
+        {"turns": [text]}, config={"configurable": {"thread_id": session_id}}
+    )
+    return result["turns"]
+
+
+@pytest.mark.asyncio
+async def test_sessions_keep_history_and_evict_least_recently_used():
+    store = MemorySessionStore(maxsize=2)
+    graph = _graph(store)
+
+    await _turn(store, graph, "a", "a1")
+    await _turn(store, graph, "b", "b1")
+    assert await _turn(store, graph, "a", "a2") == ["a1", "a2"]
+    await _turn(store, graph, "c", "c1")  # evicts b
+
+    assert len(store) == 2
+    assert await _turn(store, graph, "b", "b2") == ["b2"]
+
+
+@pytest.mark.asyncio
+async def test_idle_sessions_expire(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: clock[0])
+    store = MemorySessionStore(ttl=60.0)
+    graph = _graph(store)
+
+    await _turn(store, graph, "a", "a1")
+    await _turn(store, graph, "b", "b1")
+    clock[0] += 30
+    await _turn(store, graph, "b", "b2")
+    clock[0] += 45
+
+    assert await store.cleanup() == 1
+    assert await _turn(store, graph, "b", "b3") == ["b1", "b2", "b3"]
+    clock[0] += 61
+    assert await _turn(store, graph, "b", "b4") == ["b4"]
+
+
+@pytest.mark.asyncio
+async def test_prune_keeps_only_the_latest_checkpoint():
+    store = MemorySessionStore()
+    graph = _graph(store)
+
+    for i in range(5):
+        await _turn(store, graph, "a", f"a{i}")
+        await store.prune("a")
+    await _turn(store, graph, "b", "b0")
+
+    saver = store.checkpointer
+    assert len(saver.storage["a"][""]) == 1
+    assert len(saver.storage["b"][""]) > 1  # other sessions are left alone
+    assert len([k for k in saver.blobs if k[:3] == ("a", "", "turns")]) == 1
+    assert await _turn(store, graph, "a", "a5") == [f"a{i}" for i in range(6)]
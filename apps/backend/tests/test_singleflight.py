@@ -0,0 +1,79 @@
+"""Tests for single-flight request coalescing."""
+
+import asyncio
+
+import pytest
+
+from app.services.singleflight import SingleFlight, request_key
+
+
+def test_request_key_ignores_field_order():
+    assert request_key("rag", query="q", top_k=5) == request_key("rag", top_k=5, query="q")
+    assert request_key("rag", query="q", top_k=5) != request_key("rag", query="q", top_k=6)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution_and_survive_a_cancelled_caller():
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    callers = [asyncio.create_task(flight.do("k", work)) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    callers[0].cancel()
+    results = await asyncio.gather(*callers[1:])
+
+    assert results == ["answer"] * 4
+    assert runs == [1]
+    assert (flight.calls, flight.coalesced) == (1, 4)
+    assert await flight.do("k", work) == "answer"  # finished flights are not reused
+    assert runs == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_stream_subscribers_share_upstream_and_late_joiners_replay():
+    flight = SingleFlight()
+    started = []
+    step = asyncio.Event()
+
+    async def upstream():
+        started.append(1)
+        yield "a"
+        await step.wait()
+        yield "b"
+
+    async def collect():
+        return [event async for event in flight.stream("k", upstream)]
+
+    first = asyncio.create_task(collect())
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(collect())
+    await asyncio.sleep(0.01)
+    step.set()
+
+    assert await first == ["a", "b"]
+    assert await second == ["a", "b"]
+    assert started == [1]
+
+
+@pytest.mark.asyncio
+async def test_stream_upstream_is_cancelled_when_every_subscriber_leaves():
+    flight = SingleFlight()
+    closed = asyncio.Event()
+
+    async def upstream():
+        try:
+            yield "a"
+            await asyncio.sleep(10)
+        finally:
+            closed.set()
+
+    events = flight.stream("k", upstream)
+    assert await anext(events) == "a"
+    await events.aclose()
+
+    await asyncio.wait_for(closed.wait(), 1)
@@ -0,0 +1,47 @@
+"""Tests for SSE framing and token coalescing."""
+
+import asyncio
+
+import pytest
+
+from app.core.sse import coalesce_tokens, sse
+
+
+def test_sse_splits_multiline_data_and_names_events():
+    """Newlines in a payload must not terminate the frame early."""
+    assert sse("a\nb") == "data: a\ndata: b\n\n"
+    assert sse({"name": "t"}, event="tool_start") == 'event: tool_start\ndata: {"name": "t"}\n\n'
+
+
+async def _events(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_coalesce_merges_tokens_and_preserves_order():
+    """Consecutive tokens merge; other events flush the buffer first."""
+    items = [
+        {"type": "token", "content": "Hel"},
+        {"type": "token", "content": "lo"},
+        {"type": "tool_start", "name": "search"},
+        {"type": "token", "content": "!"},
+    ]
+    out = [event async for event in coalesce_tokens(_events(items), interval=10)]
+
+    assert out == [
+        {"type": "token", "content": "Hello"},
+        {"type": "tool_start", "name": "search"},
+        {"type": "token", "content": "!"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_flushes_when_upstream_stalls():
+    """Buffered text is sent after the interval even if no new token arrives."""
+    items = [{"type": "token", "content": "a"}, {"type": "token", "content": "b"}]
+    out = [event async for event in coalesce_tokens(_events(items, delay=0.05), interval=0.01)]
+
+    assert [event["content"] for event in out] == ["a", "b"]
@@ -0,0 +1,29 @@
+"""Tests that importing the app stays cheap."""
+
+import subprocess
+import sys
+
+DEFERRED = (
+    "langfuse",
+    "langchain_openai",
+    "langchain_anthropic",
+    "langgraph.checkpoint.postgres.aio",
+    "app.agents.orchestrator",
+)
+
+
+def test_import_defers_heavy_modules_and_graph_compilation():
+    script = (
+        "import sys, app.main\n"
+        "from app.agents.chat_agent import get_chat_agent\n"
+        "from app.agents.rag_agent import get_rag_agent\n"
+        f"print([m for m in {DEFERRED!r} if m in sys.modules])\n"
+        "print(get_chat_agent.cache_info().currsize + get_rag_agent.cache_info().currsize)\n"
+    )
+    result = subprocess.run(  # noqa: S603 - runs the current interpreter
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+
+    loaded, compiled = result.stdout.strip().splitlines()[-2:]
+    assert loaded == "[]"
+    assert compiled == "0"
@@ -0,0 +1,78 @@
+"""Tests for sampled, buffered Langfuse trace export."""
+
+from typing import TypedDict
+
+import pytest
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, StateGraph
+
+from app.core.tracing import TraceExporter, TraceRecorder, to_ingestion_events
+
+
+class State(TypedDict):
+    answer: str
+
+
+def _graph(fail=False):
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="hello there")]))
+
+    async def generate(state, config):
+        response = await model.ainvoke("hi", config)
+        if fail:
+            raise ValueError("boom")
+        return {"answer": response.content}
+
+    graph = StateGraph(State)
+    graph.add_node("generate", generate)
+    graph.set_entry_point("generate")
+    graph.add_edge("generate", END)
+    return graph.compile()
+
+
+async def _noop_send(batch):
+    return None
+
+
+@pytest.mark.asyncio
+async def test_tail_sampling_keeps_failures_and_drops_fast_successes():
+    exporter = TraceExporter(_noop_send)
+    recorder = TraceRecorder(exporter, tail_rate=0.0)
+
+    await _graph().ainvoke({"answer": ""}, {"callbacks": [recorder]})
+    assert len(exporter) == 0
+
+    with pytest.raises(ValueError):
+        await _graph(fail=True).ainvoke({"answer": ""}, {"callbacks": [recorder]})
+    assert len(exporter) == 1
+    assert not recorder._runs
+
+    trace = exporter._buffer[0]
+    assert trace.reason == "error"
+    names = [obs.name for obs in trace.observations]
+    assert names[:2] == ["LangGraph", "generate"]
+    # The model call nests under its node, not under hidden plumbing runs.
+    generation = next(obs for obs in trace.observations if obs.kind == "generation")
+    node = trace.observations[1]
+    assert generation.parent_id == node.id and node.parent_id == trace.id
+
+    events = to_ingestion_events([trace])
+    assert [event.type for event in events[:2]] == ["trace-create", "span-create"]
+    assert any(event.type == "generation-create" for event in events)
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_drops_instead_of_blocking():
+    sent = []
+
+    async def send(batch):
+        sent.append(len(batch))
+
+    exporter = TraceExporter(send, max_buffer=3, batch_size=2)
+    recorder = TraceRecorder(exporter, tail_rate=1.0)
+    for _ in range(4):
+        await _graph().ainvoke({"answer": ""}, {"callbacks": [recorder]})
+
+    assert len(exporter) == 3
+    await exporter.flush()
+    assert sent == [2, 1]
@@ -0,0 +1,20 @@
+"""Tests for pgvector index DDL generation."""
+
+from app.services.vector_index import IndexSpec, _create_statement, recommended_lists
+
+
+def test_recommended_lists_follows_pgvector_guidance():
+    assert recommended_lists(0) == 1
+    assert recommended_lists(500_000) == 500
+    assert recommended_lists(4_000_000) == 2000
+
+
+def test_create_statement_quotes_identifiers_and_sets_params():
+    hnsw = _create_statement("documents", "documents_embedding_hnsw_idx", IndexSpec(), 0, True)
+    assert hnsw.as_string(None) == (
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS "documents_embedding_hnsw_idx" ON "documents" '
+        'USING hnsw (embedding "vector_cosine_ops") WITH (m = 16, ef_construction = 64)'
+    )
+
+    ivf = _create_statement("docs", "idx", IndexSpec(method="ivfflat"), 250_000, False)
+    assert ivf.as_string(None).endswith("WITH (lists = 250)")
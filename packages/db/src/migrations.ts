@@ -9,4 +9,13 @@ export const MIGRATIONS = [
     description: 'Create pgvector extension, documents, profiles, conversations, messages tables',
     sql: `-- See pgvector.ts for the full initial migration SQL`,
   },
+  {
+    version: '002',
+    name: 'hybrid_search',
+    description: 'GIN full-text index used by hybrid (full-text + vector) retrieval',
+    sql: `-- The expression must match the backend hybrid query exactly:
+-- to_tsvector('english', content). Repeat per collection table.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_content_idx
+  ON documents USING gin (to_tsvector('english', content));`,
+  },
 ] as const;